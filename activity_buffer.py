@@ -0,0 +1,84 @@
+# activity_buffer.py - Write-behind buffer for users.last_activity
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from config import ACTIVITY_FLUSH_INTERVAL
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = {}        # user_id -> latest activity timestamp (UTC, same format as CURRENT_TIMESTAMP)
+_oldest_at = None    # monotonic time of the oldest unflushed activity
+_stats = {
+    'flushes': 0,
+    'rows_flushed': 0,
+    'last_flush_rows': 0,
+    'last_flush_ms': 0.0,
+}
+
+def record(user_id):
+    """Remember that a user was active; repeated calls coalesce into one row"""
+    global _oldest_at
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    with _lock:
+        if not _pending:
+            _oldest_at = time.monotonic()
+        _pending[user_id] = now
+
+def flush():
+    """Write every buffered timestamp in one executemany transaction"""
+    global _pending, _oldest_at
+    with _lock:
+        batch, oldest_at = _pending, _oldest_at
+        _pending, _oldest_at = {}, None
+
+    if not batch:
+        return 0
+
+    started = time.perf_counter()
+    try:
+        with get_connection() as conn:
+            # Anyone talking to the bot can be messaged again
+            conn.executemany('UPDATE users SET last_activity = ?, is_blocked = 0 WHERE user_id = ?',
+                             [(ts, user_id) for user_id, ts in batch.items()])
+    except Exception:
+        # Put the batch back without overwriting anything recorded since
+        with _lock:
+            for user_id, ts in batch.items():
+                _pending.setdefault(user_id, ts)
+            if _oldest_at is None or oldest_at < _oldest_at:
+                _oldest_at = oldest_at
+        raise
+
+    with _lock:
+        _stats['flushes'] += 1
+        _stats['rows_flushed'] += len(batch)
+        _stats['last_flush_rows'] = len(batch)
+        _stats['last_flush_ms'] = (time.perf_counter() - started) * 1000
+    return len(batch)
+
+def flush_lag():
+    """Seconds the oldest unflushed activity has been waiting (0 when empty)"""
+    with _lock:
+        return time.monotonic() - _oldest_at if _oldest_at is not None else 0.0
+
+def get_metrics():
+    with _lock:
+        pending = len(_pending)
+        stats = dict(_stats)
+    return {'pending': pending, 'flush_lag': flush_lag(), **stats}
+
+async def run_flusher(interval=ACTIVITY_FLUSH_INTERVAL):
+    """Flush the buffer on the database writer thread every `interval` seconds"""
+    from async_db import run_write
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_write(flush)
+        except Exception as e:
+            logger.error(f"❌ Activity flush failed ({len(_pending)} pending): {e}")
@@ -0,0 +1,118 @@
+# analytics.py - Aggregate queries for the admin panel, analytics and /stats
+
+from datetime import datetime, timedelta, timezone
+import counters
+from db_pool import get_connection
+
+# Range key -> label, in the order the buttons are shown
+RANGES = {
+    'today': "Today",
+    '7d': "7 Days",
+    '30d': "30 Days",
+    'all': "All Time",
+}
+
+# Range key -> days covered, counting today
+RANGE_DAYS = {'today': 1, '7d': 7, '30d': 30}
+
+def range_start(range_key):
+    """First UTC day (YYYY-MM-DD) of a range, None for all time"""
+    days = RANGE_DAYS.get(range_key)
+    if days is None:
+        return None
+    return (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+
+def get_summary():
+    """Headline numbers for the admin panel, from the running counters"""
+    values = counters.get_all()
+    return {
+        'users': int(values['users']),
+        'balance': values['balance'],
+        'pending_tx': int(values['pending_tx']),
+        'pending_wd': int(values['pending_wd']),
+    }
+
+def get_overview(range_key='all'):
+    """User, transaction and payout figures for a time range, read from the daily rollups"""
+    since = range_start(range_key) or ''
+    summary = get_summary()
+    total_users, total_balance = summary['users'], summary['balance']
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if since:
+            cursor.execute('SELECT COUNT(*) FROM users WHERE registered_at >= ?', (since,))
+            new_users = cursor.fetchone()[0]
+        else:
+            new_users = total_users
+
+        cursor.execute('''
+            SELECT type, status, SUM(count), SUM(amount)
+            FROM daily_transaction_stats WHERE day >= ?
+            GROUP BY type, status
+        ''', (since,))
+        transactions = cursor.fetchall()
+
+        cursor.execute('''
+            SELECT status, SUM(count), SUM(amount)
+            FROM daily_withdrawal_stats WHERE day >= ?
+            GROUP BY status
+        ''', (since,))
+        withdrawals = cursor.fetchall()
+
+        cursor.execute('''
+            SELECT status, SUM(count), SUM(amount)
+            FROM daily_reward_stats WHERE day >= ?
+            GROUP BY status
+        ''', (since,))
+        rewards = cursor.fetchall()
+
+    overview = _build_overview(range_key, total_users, total_balance, new_users, transactions)
+    overview.update(_by_status('wd', withdrawals, ('pending', 'paid', 'denied')))
+    overview.update(_by_status('rewards', rewards, ('pending', 'paid')))
+    return overview
+
+def _by_status(prefix, groups, statuses):
+    """{prefix_status: count, prefix_status_amount: amount} for (status, count, amount) groups"""
+    found = {status: (n, amount) for status, n, amount in groups}
+    result = {}
+    for status in statuses:
+        n, amount = found.get(status, (0, 0.0))
+        result[f'{prefix}_{status}'] = n
+        result[f'{prefix}_{status}_amount'] = amount
+    return result
+
+def _build_overview(range_key, total_users, total_balance, new_users, groups):
+    """Shape (type, status, count, volume) groups into the figures the screens show"""
+    by_status = {}
+    count = {'sell': 0, 'buy': 0}
+    volume = {'sell': 0.0, 'buy': 0.0}
+    for tx_type, status, n, amount in groups:
+        by_status[status] = by_status.get(status, 0) + n
+        if status == 'completed' and tx_type in count:
+            count[tx_type] += n
+            volume[tx_type] += amount
+
+    total_tx = sum(by_status.values())
+    completed = by_status.get('completed', 0)
+
+    return {
+        'range': range_key,
+        'label': RANGES.get(range_key, RANGES['all']),
+        'users': total_users,
+        'new_users': new_users,
+        'balance': total_balance,
+        'avg_balance': total_balance / total_users if total_users else 0,
+        'tx_total': total_tx,
+        'tx_completed': completed,
+        'tx_pending': by_status.get('pending', 0),
+        'tx_failed': by_status.get('failed', 0),
+        'success_rate': completed / total_tx * 100 if total_tx else 0,
+        'sell_count': count['sell'],
+        'buy_count': count['buy'],
+        'sell_volume': volume['sell'],
+        'buy_volume': volume['buy'],
+        'total_volume': volume['sell'] + volume['buy'],
+        'avg_sell': volume['sell'] / count['sell'] if count['sell'] else 0,
+        'avg_buy': volume['buy'] / count['buy'] if count['buy'] else 0,
+    }
@@ -0,0 +1,114 @@
+# async_db.py - Non-blocking database access for async handlers
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import catalog
+import database
+import trending
+from config import DB_READ_THREADS
+
+logger = logging.getLogger(__name__)
+
+# A single writer thread serializes writes (SQLite allows one writer at a time),
+# while WAL lets the reader threads keep serving queries alongside it
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+_read_executor = ThreadPoolExecutor(max_workers=DB_READ_THREADS, thread_name_prefix='db-reader')
+
+async def run_read(func, *args, **kwargs):
+    """Run a blocking read on the reader pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, functools.partial(func, *args, **kwargs))
+
+async def run_write(func, *args, **kwargs):
+    """Run a blocking write on the writer thread"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_write_executor, functools.partial(func, *args, **kwargs))
+
+def _reader(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_read(func, *args, **kwargs)
+    return wrapper
+
+def _writer(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_write(func, *args, **kwargs)
+    return wrapper
+
+def _inline(func, loaded=None):
+    """For calls served from memory - no thread hop needed.
+
+    Until `loaded()` is true the call would load its cache from the database,
+    so it goes to the reader pool instead of blocking the event loop.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if loaded is not None and not loaded():
+            return await run_read(func, *args, **kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
+def shutdown():
+    """Wait for queued queries to finish and stop the executors"""
+    _write_executor.shutdown(wait=True)
+    _read_executor.shutdown(wait=True)
+    logger.info("✅ Database executors stopped")
+
+init_db = _writer(database.init_db)
+
+# User functions
+add_user = _writer(database.add_user)
+update_last_activity = _inline(database.update_last_activity)
+get_balance = _reader(database.get_balance)
+update_balance = _writer(database.update_balance)
+get_user = _reader(database.get_user)
+get_user_stats = _reader(database.get_user_stats)
+
+# Gift card functions
+get_all_gift_cards = _inline(database.get_all_gift_cards, catalog.is_loaded)
+get_gift_card_logo = _inline(database.get_gift_card_logo, catalog.is_loaded)
+
+# Rate functions
+get_random_rate = _inline(database.get_random_rate, catalog.is_loaded)
+update_rate = _writer(database.update_rate)
+
+# Transaction functions
+add_transaction = _writer(database.add_transaction)
+update_transaction_status = _writer(database.update_transaction_status)
+get_transaction = _reader(database.get_transaction)
+get_user_transactions = _reader(database.get_user_transactions)
+get_user_transactions_page = _reader(database.get_user_transactions_page)
+get_trending_cards = _inline(database.get_trending_cards, trending.is_loaded)
+
+# Referral functions
+get_referral_code = _reader(database.get_referral_code)
+get_user_by_referral_code = _reader(database.get_user_by_referral_code)
+get_referred_by = _reader(database.get_referred_by)
+get_referrals_count = _reader(database.get_referrals_count)
+reward_exists = _reader(database.reward_exists)
+add_reward = _writer(database.add_reward)
+update_reward_status = _writer(database.update_reward_status)
+get_reward = _reader(database.get_reward)
+get_pending_rewards_amount = _reader(database.get_pending_rewards_amount)
+get_paid_rewards_amount = _reader(database.get_paid_rewards_amount)
+
+# Withdrawal functions
+add_withdrawal = _writer(database.add_withdrawal)
+update_withdrawal_status = _writer(database.update_withdrawal_status)
+get_withdrawal = _reader(database.get_withdrawal)
+get_user_withdrawals = _reader(database.get_user_withdrawals)
+get_pending_withdrawals = _reader(database.get_pending_withdrawals)
+get_pending_withdrawals_page = _reader(database.get_pending_withdrawals_page)
+
+# Inventory functions
+add_inventory = _writer(database.add_inventory)
+get_available_code = _writer(database.get_available_code)
+
+# Admin functions
+get_all_users = _reader(database.get_all_users)
+get_all_transactions = _reader(database.get_all_transactions)
+get_pending_transactions_page = _reader(database.get_pending_transactions_page)
+get_users_page = _reader(database.get_users_page)
@@ -0,0 +1,46 @@
+# benchmarks/keyboards.py - Per-update cost of building static keyboards vs serving them from screens.py
+#
+# Each case times what one update pays for its reply markup: building the
+# InlineKeyboardMarkup and aiogram serializing it (prepare_arg) before, a
+# lookup plus prepare_arg passing the cached string through now.
+#
+# Usage:
+#   python benchmarks/keyboards.py [--number 20000]
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.utils.payload import prepare_arg
+import screens
+from utils import create_back_button, create_cancel_button, create_confirmation_keyboard, paginate_cards
+
+CASES = [
+    ('main menu', lambda: screens._main_menu(), lambda: screens.MAIN_MENU),
+    ('sell picker, page 2', lambda: paginate_cards(page=1, callback_prefix='sell'), lambda: screens.card_page('sell', 1)),
+    ('buy picker, page 1', lambda: paginate_cards(page=0, callback_prefix='buy'), lambda: screens.card_page('buy', 0)),
+    ('cancel', lambda: create_cancel_button(), lambda: screens.CANCEL),
+    ('cancel + back', lambda: create_cancel_button(with_back=True), lambda: screens.CANCEL_WITH_BACK),
+    ('back', lambda: create_back_button(), lambda: screens.BACK),
+    ('confirm', lambda: create_confirmation_keyboard('confirm_sell'), lambda: screens.CONFIRM_SELL),
+    ('help', lambda: screens._help(), lambda: screens.HELP_KEYBOARD),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Time building keyboards per update against the screens.py cache")
+    parser.add_argument('--number', type=int, default=20000, help="Calls per case")
+    args = parser.parse_args()
+
+    print(f"{'keyboard':<22}{'built µs':>10}{'cached µs':>11}{'speedup':>9}")
+    for name, build, cached in CASES:
+        # Both sides must send Telegram the same thing
+        assert prepare_arg(build()) == prepare_arg(cached()), name
+        built = min(timeit.repeat(lambda: prepare_arg(build()), number=args.number, repeat=3)) / args.number * 1e6
+        served = min(timeit.repeat(lambda: prepare_arg(cached()), number=args.number, repeat=3)) / args.number * 1e6
+        print(f"{name:<22}{built:>10.2f}{served:>11.3f}{built / served:>8.0f}x")
+
+if __name__ == '__main__':
+    main()
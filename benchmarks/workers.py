@@ -0,0 +1,210 @@
+# benchmarks/workers.py - Replays one update stream through the bot in a single process and with K worker processes
+#
+# A fake Bot API server on localhost hands out the stream from getUpdates and
+# answers every other method; the bot runs unchanged as `python main.py`,
+# pointed at it through TELEGRAM_API_URL, on a fresh database each run. Each
+# simulated user sends /start and then browses the menus (rates, help, sell
+# picker, transactions) for a number of rounds. The clock starts when the
+# stream is released - after the bot (and every worker) has logged that it's
+# ready - and stops at the last API call once every callback has been answered.
+# Before timing, it checks that the stream's users spread evenly over every
+# worker's update shards.
+#
+# Usage:
+#   python benchmarks/workers.py [--workers 4] [--users 200] [--rounds 5] [--latency-ms 0]
+
+import argparse
+import asyncio
+import itertools
+import os
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BOT_ID = 42
+# Settings main.py needs, for a bot that only ever talks to the fake server; outbound
+# limits are lifted since this measures handling, not Telegram's rate limits
+BOT_ENV = {'BOT_TOKEN': '123456:benchmark', 'ADMIN_IDS': '1', 'ADMIN_CHANNEL_ID': '-1001', 'BOT_MODE': 'polling',
+           'OUTBOUND_GLOBAL_RATE': '100000', 'OUTBOUND_CHAT_RATE': '1000', 'OUTBOUND_BURST': '1000'}
+
+# Menu taps per round; every one is a callback query the bot answers
+ROUND = ['rates', 'main_menu', 'help', 'main_menu', 'sell_start', 'main_menu', 'transactions', 'main_menu']
+
+def build_stream(users, rounds):
+    """Updates interleaved across users, each user's own in order"""
+    update_ids = itertools.count(1)  # contiguous, so update n is stream[n - 1]
+    ids = itertools.count(1)
+    now = int(time.time())
+
+    def message(user_id, text):
+        return {'message_id': next(ids), 'date': now, 'chat': {'id': user_id, 'type': 'private'}, 'text': text}
+
+    def sender(user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': 'U', 'username': f'u{user_id}'}
+
+    stream = []
+    for step in range(1 + rounds * len(ROUND)):
+        for user_id in range(1000, 1000 + users):
+            if step == 0:
+                start = dict(message(user_id, '/start'), **{'from': sender(user_id)},
+                             entities=[{'type': 'bot_command', 'offset': 0, 'length': 6}])
+                stream.append({'update_id': next(update_ids), 'message': start})
+            else:
+                shown = dict(message(user_id, 'menu'), **{'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'B'}})
+                stream.append({'update_id': next(update_ids), 'callback_query': {
+                    'id': str(next(ids)), 'from': sender(user_id), 'chat_instance': '1',
+                    'data': ROUND[(step - 1) % len(ROUND)], 'message': shown}})
+    return stream
+
+class FakeBotAPI:
+    """Just enough of the Bot API for the handlers the stream reaches"""
+
+    def __init__(self, stream, latency):
+        self.stream = stream
+        self.latency = latency
+        self.released = asyncio.Event()
+        self.answered = 0
+        self.calls = 0
+        self.last_call = 0.0
+        self._message_ids = itertools.count(10 ** 6)
+
+    def result(self, method, data):
+        if method == 'getMe':
+            return {'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method in ('sendMessage', 'editMessageText', 'sendPhoto'):
+            chat_id = int(data.get('chat_id', 1))
+            return {'message_id': next(self._message_ids), 'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'text': data.get('text', '')}
+        return True
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        data = dict(await request.post())
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self.get_updates(data)})
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == 'answerCallbackQuery':
+            self.answered += 1
+        self.calls += 1
+        self.last_call = time.perf_counter()
+        return web.json_response({'ok': True, 'result': self.result(method, data)})
+
+    async def get_updates(self, data):
+        if not self.released.is_set():
+            try:
+                await asyncio.wait_for(self.released.wait(), float(data.get('timeout') or 1))
+            except asyncio.TimeoutError:
+                return []
+        start = max(int(data.get('offset') or 1), 1) - 1
+        return self.stream[start:start + int(data.get('limit') or 100)]
+
+async def run(workers, stream, callbacks, latency):
+    api = FakeBotAPI(stream, latency)
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, **BOT_ENV, DB_NAME=os.path.join(tmp, 'bench.db'), BOT_WORKERS=str(workers),
+                   TELEGRAM_API_URL=f'http://127.0.0.1:{port}')
+        env.pop('WORKER_INDEX', None)
+        bot = await asyncio.create_subprocess_exec(sys.executable, os.path.join(ROOT, 'main.py'), cwd=ROOT, env=env,
+                                                   stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+
+        # Ready once polling is up and (with workers) each worker has started its services
+        ready = asyncio.Event()
+        waiting_for = {'mode active': 1, 'Worker ': workers if workers > 1 else 0}
+
+        async def read_log():
+            while line := await bot.stderr.readline():
+                line = line.decode(errors='replace')
+                if 'Traceback' in line or 'ERROR' in line:
+                    sys.stderr.write(line)
+                for marker in waiting_for:
+                    if marker in line and (marker != 'Worker ' or 'ready' in line):
+                        waiting_for[marker] -= 1
+                if all(left <= 0 for left in waiting_for.values()):
+                    ready.set()
+
+        logging = asyncio.create_task(read_log())
+        try:
+            exited = asyncio.create_task(bot.wait())
+            await asyncio.wait([asyncio.create_task(ready.wait()), exited], timeout=60,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not ready.is_set():
+                raise RuntimeError(f"Bot with {workers} workers didn't start (exit code {bot.returncode})")
+            await asyncio.sleep(0.5)  # let the startup calls (admin notices) settle
+
+            calls_before = api.calls
+            started = time.perf_counter()
+            api.released.set()
+            while api.answered < callbacks:
+                await asyncio.sleep(0.01)
+            # Handlers send their edit right after answering; wait for those too
+            while time.perf_counter() - api.last_call < 0.3:
+                await asyncio.sleep(0.05)
+            elapsed = api.last_call - started
+            calls = api.calls - calls_before
+        finally:
+            if bot.returncode is None:
+                bot.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(bot.wait(), 60)
+            except asyncio.TimeoutError:
+                bot.kill()
+                await bot.wait()
+            logging.cancel()
+            await runner.cleanup()
+    return elapsed, calls
+
+def check_shards(stream, workers):
+    """Assert each worker's users land evenly on its update shards (front: key % K, worker: shard_index)"""
+    for name, value in BOT_ENV.items():
+        os.environ.setdefault(name, value)
+    from config import UPDATE_SHARDS
+    from update_scheduler import shard_index
+
+    users = {update['message']['from']['id'] for update in stream if 'message' in update}
+    for worker in range(workers):
+        mine = [user_id for user_id in users if user_id % workers == worker]
+        load = Counter(shard_index(user_id, UPDATE_SHARDS, workers) for user_id in mine)
+        counts = [load.get(shard, 0) for shard in range(UPDATE_SHARDS)]
+        assert max(counts) - min(counts) <= 1, f"worker {worker}: uneven shards {counts}"
+    print(f"Shards even: {len(users)} users over {workers} workers x {UPDATE_SHARDS} shards")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an update stream through 1 process and through K workers")
+    parser.add_argument('--workers', type=int, default=4, help="Worker processes in the multi-process run")
+    parser.add_argument('--users', type=int, default=200, help="Simulated users")
+    parser.add_argument('--rounds', type=int, default=5, help="Menu rounds per user")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Added to every Bot API call but getUpdates")
+    args = parser.parse_args()
+
+    stream = build_stream(args.users, args.rounds)
+    callbacks = sum('callback_query' in update for update in stream)
+    check_shards(stream, args.workers)
+    print(f"{len(stream)} updates from {args.users} users, {args.latency_ms:g} ms API latency")
+    print(f"{'processes':<12}{'seconds':>9}{'updates/s':>11}{'API calls':>11}")
+    baseline = None
+    for workers in (1, args.workers):
+        elapsed, calls = asyncio.run(run(workers, stream, callbacks, args.latency_ms / 1000))
+        baseline = baseline or elapsed
+        label = '1' if workers == 1 else f'{workers} workers'
+        print(f"{label:<12}{elapsed:>9.2f}{len(stream) / elapsed:>11.0f}{calls:>11}   {baseline / elapsed:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+# broadcast.py - Broadcast campaigns: stored in the database, sent in chunks through the outbound scheduler
+
+import asyncio
+import logging
+import time
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.utils.exceptions import MessageNotModified
+import callback_codec
+import outbound
+from async_db import run_read, run_write
+from config import BROADCAST_CHUNK_SIZE, BROADCAST_PROGRESS_INTERVAL
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('broadcast_id', 'admin_id', 'text', 'status', 'total', 'last_user_id', 'delivered', 'failed',
+           'blocked', 'chat_id', 'message_id', 'created_at', 'started_at', 'finished_at')
+
+_tasks = {}  # broadcast_id -> running campaign task
+
+# Blocking helpers, run on the async_db executors
+def create(admin_id, text):
+    """Store a draft campaign; returns (broadcast_id, recipients)"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM users WHERE is_blocked = 0')
+        total = cursor.fetchone()[0]
+        cursor.execute('INSERT INTO broadcasts (admin_id, text, total) VALUES (?, ?, ?)', (admin_id, text, total))
+        return cursor.lastrowid, total
+
+def get(broadcast_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT {", ".join(COLUMNS)} FROM broadcasts WHERE broadcast_id = ?', (broadcast_id,))
+        row = cursor.fetchone()
+    return dict(zip(COLUMNS, row)) if row else None
+
+def mark_started(broadcast_id, chat_id, message_id):
+    """Draft -> running; False if it was already started or cancelled (e.g. a double tap)"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE broadcasts SET status = 'running', chat_id = ?, message_id = ?, started_at = CURRENT_TIMESTAMP
+            WHERE broadcast_id = ? AND status = 'draft'
+        ''', (chat_id, message_id, broadcast_id))
+        return cursor.rowcount == 1
+
+def mark_finished(broadcast_id, status):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE broadcast_id = ? AND status IN ('draft', 'running')
+        ''', (status, broadcast_id))
+        return cursor.rowcount == 1
+
+def get_running_ids():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT broadcast_id FROM broadcasts WHERE status = 'running' ORDER BY broadcast_id")
+        return [row[0] for row in cursor.fetchall()]
+
+def next_recipients(after_user_id, limit=BROADCAST_CHUNK_SIZE):
+    """Next chunk of reachable users in user_id order (a rowid range scan)"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id FROM users WHERE user_id > ? AND is_blocked = 0 ORDER BY user_id LIMIT ?',
+                       (after_user_id, limit))
+        return [row[0] for row in cursor.fetchall()]
+
+def checkpoint(broadcast_id, last_user_id, delivered, failed, blocked_ids):
+    """Record a finished chunk and flag its unreachable users, in one transaction.
+
+    Returns False if the campaign is no longer running (stopped from another process).
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE broadcasts SET last_user_id = ?, delivered = delivered + ?, failed = failed + ?,
+                blocked = blocked + ?
+            WHERE broadcast_id = ?
+        ''', (last_user_id, delivered, failed, len(blocked_ids), broadcast_id))
+        cursor.executemany('UPDATE users SET is_blocked = 1 WHERE user_id = ?', [(uid,) for uid in blocked_ids])
+        cursor.execute('SELECT status FROM broadcasts WHERE broadcast_id = ?', (broadcast_id,))
+        return cursor.fetchone()[0] == 'running'
+
+def format_progress(campaign):
+    """Progress text and keyboard for the admin's status message"""
+    done = campaign['delivered'] + campaign['failed'] + campaign['blocked']
+    total = max(campaign['total'], done)
+    percent = done / total * 100 if total else 100
+    status = {'running': '⏳ Sending', 'completed': '✅ Completed', 'cancelled': '⏹ Stopped'}.get(
+        campaign['status'], campaign['status'])
+
+    text = (
+        f"📢 Broadcast #{campaign['broadcast_id']} - {status}\n\n"
+        f"Progress: {done}/{total} ({percent:.0f}%)\n"
+        f"• Delivered: {campaign['delivered']}\n"
+        f"• Failed: {campaign['failed']}\n"
+        f"• Blocked: {campaign['blocked']}"
+    )
+    keyboard = InlineKeyboardMarkup()
+    if campaign['status'] == 'running':
+        keyboard.add(InlineKeyboardButton("⏹ Stop Broadcast", callback_data=callback_codec.BROADCAST_STOP.encode(campaign['broadcast_id'])))
+    keyboard.add(InlineKeyboardButton("⬅️ Back to Admin Panel", callback_data="admin_panel"))
+    return text, keyboard
+
+async def _show_progress(campaign):
+    if not campaign['chat_id']:
+        return
+    text, keyboard = format_progress(campaign)
+    try:
+        await outbound.edit_message_text(campaign['chat_id'], campaign['message_id'], text, reply_markup=keyboard)
+    except MessageNotModified:
+        pass
+    except Exception as e:
+        logger.warning(f"⚠️ Broadcast progress update failed: {e}")
+
+def _settled(recipients, handles):
+    """(user_id, result) for the leading recipients whose sends have finished"""
+    done = []
+    for user_id, handle in zip(recipients, handles):
+        if not handle.done() or handle.cancelled():
+            break
+        done.append((user_id, handle.exception() or handle.result()))
+    return done
+
+async def _checkpoint(campaign, done):
+    blocked_ids = [user_id for user_id, result in done if isinstance(result, outbound.UNREACHABLE)]
+    failed = sum(1 for _, result in done if isinstance(result, Exception)) - len(blocked_ids)
+    delivered = len(done) - failed - len(blocked_ids)
+    last_user_id = done[-1][0]
+    running = await run_write(checkpoint, campaign['broadcast_id'], last_user_id, delivered, failed, blocked_ids)
+    campaign.update(last_user_id=last_user_id, delivered=campaign['delivered'] + delivered,
+                    failed=campaign['failed'] + failed, blocked=campaign['blocked'] + len(blocked_ids))
+    return running
+
+async def run_campaign(broadcast_id):
+    """Send a running campaign from its checkpoint to the last user"""
+    campaign = await run_read(get, broadcast_id)
+    if not campaign or campaign['status'] != 'running':
+        return
+    last_shown = 0
+
+    while True:
+        recipients = await run_read(next_recipients, campaign['last_user_id'])
+        if not recipients:
+            break
+
+        # At most one chunk is queued at a time; user and admin messages still go first
+        handles = [outbound.send_message(user_id, campaign['text'], priority=outbound.PRIORITY_BROADCAST)
+                   for user_id in recipients]
+        try:
+            await asyncio.gather(*handles, return_exceptions=True)
+        except asyncio.CancelledError:
+            # Stopped or shutting down: keep what already went out, so resuming doesn't repeat it
+            done = _settled(recipients, handles)
+            if done:
+                await _checkpoint(campaign, done)
+            raise
+        if not await _checkpoint(campaign, _settled(recipients, handles)):
+            logger.info(f"⏹ Broadcast #{broadcast_id} was stopped elsewhere")
+            return
+
+        if time.monotonic() - last_shown >= BROADCAST_PROGRESS_INTERVAL:
+            await _show_progress(campaign)
+            last_shown = time.monotonic()
+
+    await run_write(mark_finished, broadcast_id, 'completed')
+    campaign['status'] = 'completed'
+    await _show_progress(campaign)
+    logger.info(f"✅ Broadcast #{broadcast_id} completed: {campaign['delivered']} delivered, "
+                f"{campaign['failed']} failed, {campaign['blocked']} blocked")
+
+def start(broadcast_id):
+    """Run a campaign in the background (no-op if it is already running here)"""
+    task = _tasks.get(broadcast_id)
+    if task and not task.done():
+        return task
+
+    async def runner():
+        try:
+            await run_campaign(broadcast_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Broadcast #{broadcast_id} failed: {e}")
+        finally:
+            _tasks.pop(broadcast_id, None)
+
+    task = _tasks[broadcast_id] = asyncio.create_task(runner())
+    return task
+
+async def stop(broadcast_id):
+    """Cancel a campaign; messages already handed to Telegram stay sent"""
+    stopped = await run_write(mark_finished, broadcast_id, 'cancelled')
+    task = _tasks.get(broadcast_id)
+    if task:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    campaign = await run_read(get, broadcast_id)
+    if campaign:
+        await _show_progress(campaign)
+    return stopped
+
+async def resume():
+    """Restart campaigns that were running when the bot last stopped"""
+    for broadcast_id in await run_read(get_running_ids):
+        logger.info(f"🔄 Resuming broadcast #{broadcast_id}")
+        start(broadcast_id)
+
+async def shutdown():
+    """Pause running campaigns; they stay 'running' and resume from their checkpoint"""
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def get_metrics():
+    return {'running': len(_tasks)}
@@ -0,0 +1,117 @@
+# cache_sync.py - Keeps each worker process's in-memory caches in step through a table of change events
+#
+# In multi-process mode (workers.py) every worker has its own dashboard cache,
+# catalog snapshot, trending leaderboard and stock counts. A worker applies its
+# own changes at once and publishes them here; every CACHE_SYNC_INTERVAL seconds
+# it writes what it published in one insert and applies what the other workers
+# wrote since it last looked. Another worker's caches can lag a change by about
+# two intervals. In a single process publish() does nothing.
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from config import CACHE_SYNC_INTERVAL
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Events older than this (seconds) are deleted; a worker that has been gone longer reloads its caches anyway
+RETENTION = 3600
+
+_lock = threading.Lock()
+_outgoing = []  # (kind, payload) published since the last exchange
+_appliers = {}  # kind -> function applying another worker's event locally
+_origin = None  # this worker's index once enabled
+_last_seen = 0
+_stats = {'published': 0, 'applied': 0}
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin INTEGER,
+            kind TEXT,
+            payload TEXT,
+            created_at REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_events_created_at ON cache_events (created_at)')
+
+def subscribe(kind, apply):
+    """Have `apply(*args)` run for events of `kind` published by other workers"""
+    _appliers[kind] = apply
+
+def publish(kind, *args):
+    """Tell the other workers about a change already applied here (JSON-serializable args)"""
+    if _origin is None:
+        return
+    with _lock:
+        _outgoing.append((kind, json.dumps(args)))
+
+def enable(origin):
+    """Start publishing as worker `origin`; earlier events are already reflected in freshly loaded caches"""
+    global _origin, _last_seen
+    with get_connection() as conn:
+        _last_seen = conn.execute('SELECT COALESCE(MAX(event_id), 0) FROM cache_events').fetchone()[0]
+    _origin = origin
+
+# Blocking, run on the database writer thread
+def exchange():
+    """Write this worker's events, then apply the other workers' new ones; returns how many were applied"""
+    global _last_seen
+    with _lock:
+        outgoing = _outgoing[:]
+        _outgoing.clear()
+
+    now = time.time()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('INSERT INTO cache_events (origin, kind, payload, created_at) VALUES (?, ?, ?, ?)',
+                           [(_origin, kind, payload, now) for kind, payload in outgoing])
+        cursor.execute('SELECT event_id, origin, kind, payload FROM cache_events WHERE event_id > ? ORDER BY event_id',
+                       (_last_seen,))
+        events = cursor.fetchall()
+
+    applied = 0
+    for event_id, origin, kind, payload in events:
+        _last_seen = event_id
+        apply = _appliers.get(kind)
+        if origin == _origin or apply is None:
+            continue
+        try:
+            apply(*json.loads(payload))
+            applied += 1
+        except Exception as e:
+            logger.error(f"❌ Applying {kind} event {event_id} failed: {e}")
+
+    _stats['published'] += len(outgoing)
+    _stats['applied'] += applied
+    return applied
+
+def purge(age=RETENTION):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM cache_events WHERE created_at < ?', (time.time() - age,))
+        return cursor.rowcount
+
+async def run_sync(interval=CACHE_SYNC_INTERVAL):
+    """Exchange events every `interval` seconds, purging old ones now and then"""
+    from async_db import run_write
+
+    last_purge = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_write(exchange)
+            if time.monotonic() - last_purge >= RETENTION:
+                last_purge = time.monotonic()
+                await run_write(purge)
+        except Exception as e:
+            logger.error(f"❌ Cache sync failed: {e}")
+
+def get_metrics():
+    with _lock:
+        pending = len(_outgoing)
+    return {'enabled': _origin is not None, 'pending': pending, **_stats}
@@ -0,0 +1,149 @@
+# callback_codec.py - Compact, versioned, checksummed callback data for inline buttons
+#
+# Telegram allows 64 bytes of callback data. Card names and ids spliced into
+# "prefix_value" strings don't reliably fit and can't be split on '_' safely,
+# so buttons carry a packed form instead:
+#   "~" + base64url(version, action code, fields..., checksum)
+# Fields are ints (varints), strings (length-prefixed UTF-8) or cards (their
+# index in GIFT_CARDS); the checksum is the low 16 bits of a CRC-32 over the
+# rest. Data without the "~" prefix is a plain route string - callback_router
+# handles both.
+
+import base64
+import binascii
+import zlib
+from config import GIFT_CARDS
+
+PREFIX = '~'
+VERSION = 1
+MAX_LENGTH = 64  # Telegram's limit on callback data, in bytes
+
+_card_index = {card['name']: i for i, card in enumerate(GIFT_CARDS)}
+
+def _put_int(out, value):
+    if value < 0:
+        raise ValueError(f"Can't encode negative int {value}")
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _get_int(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def _put_str(out, value):
+    raw = value.encode()
+    _put_int(out, len(raw))
+    out += raw
+
+def _get_str(data, pos):
+    length, pos = _get_int(data, pos)
+    if pos + length > len(data):
+        raise IndexError("string runs past the end")
+    return data[pos:pos + length].decode(), pos + length
+
+def _put_card(out, name):
+    if name not in _card_index:
+        raise ValueError(f"Unknown gift card '{name}'")
+    _put_int(out, _card_index[name])
+
+def _get_card(data, pos):
+    index, pos = _get_int(data, pos)
+    return GIFT_CARDS[index]['name'], pos
+
+FIELD_TYPES = {
+    'int': (_put_int, _get_int),
+    'str': (_put_str, _get_str),
+    'card': (_put_card, _get_card),
+}
+
+class Action:
+    """A button kind: a one-byte code plus named, typed fields"""
+    __slots__ = ('code', 'name', 'fields', '_put', '_get')
+
+    def __init__(self, code, name, fields):
+        self.code = code
+        self.name = name
+        self.fields = tuple(fields)
+        self._put = [FIELD_TYPES[kind][0] for kind in fields.values()]
+        self._get = [FIELD_TYPES[kind][1] for kind in fields.values()]
+
+    def encode(self, *values):
+        """Callback data for this action with `values` in field order"""
+        if len(values) != len(self.fields):
+            raise ValueError(f"{self.name} takes {len(self.fields)} values, got {len(values)}")
+        out = bytearray((VERSION, self.code))
+        for put, value in zip(self._put, values):
+            put(out, value)
+        out += (zlib.crc32(out) & 0xFFFF).to_bytes(2, 'big')
+        data = PREFIX + base64.urlsafe_b64encode(out).rstrip(b'=').decode()
+        if len(data) > MAX_LENGTH:
+            raise ValueError(f"{self.name} callback data is {len(data)} bytes, over Telegram's {MAX_LENGTH}")
+        return data
+
+    def __repr__(self):
+        return f"Action({self.code}, {self.name!r})"
+
+_actions = {}  # code -> Action
+
+def action(code, name, **fields):
+    """Define an action; codes are part of the format, so never reuse or renumber one"""
+    if not 0 <= code <= 0xFF or code in _actions:
+        raise ValueError(f"Bad or duplicate action code {code} for {name}")
+    _actions[code] = Action(code, name, fields)
+    return _actions[code]
+
+def decode(data):
+    """(Action, {field: value}) from encoded callback data; ValueError if it isn't valid"""
+    if not data.startswith(PREFIX):
+        raise ValueError("Not encoded callback data")
+    try:
+        raw = base64.urlsafe_b64decode(data[1:] + '=' * (-(len(data) - 1) % 4))
+    except (binascii.Error, ValueError):
+        raise ValueError("Malformed callback data")
+    if len(raw) < 4 or zlib.crc32(raw[:-2]) & 0xFFFF != int.from_bytes(raw[-2:], 'big'):
+        raise ValueError("Callback data checksum mismatch")
+    if raw[0] != VERSION:
+        raise ValueError(f"Unsupported callback data version {raw[0]}")
+    act = _actions.get(raw[1])
+    if act is None:
+        raise ValueError(f"Unknown callback action {raw[1]}")
+
+    values = {}
+    body = raw[:-2]
+    pos = 2
+    try:
+        for name, get in zip(act.fields, act._get):
+            values[name], pos = get(body, pos)
+    except (IndexError, UnicodeDecodeError):
+        raise ValueError(f"Malformed {act.name} callback data")
+    if pos != len(body):
+        raise ValueError(f"Trailing bytes in {act.name} callback data")
+    return act, values
+
+# Card pickers (utils.paginate_cards)
+SELL_CARD = action(1, 'sell_card', card_name='card')
+SELL_PAGE = action(2, 'sell_page', page='int')
+BUY_CARD = action(3, 'buy_card', card_name='card')
+BUY_PAGE = action(4, 'buy_page', page='int')
+
+# Admin channel actions
+ADMIN_VALID = action(10, 'admin_valid', tx_id='str')
+ADMIN_INVALID = action(11, 'admin_invalid', tx_id='str', issue='str')
+ADMIN_INVALID_PAYMENT = action(12, 'admin_invalid_payment', tx_id='str')
+COMPLETE_TX = action(13, 'complete_tx', tx_id='str')
+REWARD_PAID = action(14, 'reward_paid', reward_id='int')
+WD_APPROVE = action(15, 'wd_approve', wd_id='str')
+WD_DENY = action(16, 'wd_deny', wd_id='str')
+
+# Broadcasts
+BROADCAST_CONFIRM = action(20, 'broadcast_confirm', broadcast_id='int')
+BROADCAST_CANCEL = action(21, 'broadcast_cancel', broadcast_id='int')
+BROADCAST_STOP = action(22, 'broadcast_stop', broadcast_id='int')
@@ -0,0 +1,173 @@
+# callback_router.py - Callback query routing: every route compiled into one prefix trie
+#
+# Routes are literal prefixes with an optional trailing parameter:
+#   'main_menu'              exact match
+#   'admin_valid_{tx_id}'    rest of the data passed as tx_id
+#   'sell_page_{page:int}'   converted to int (no match if it isn't one)
+#   'users_{after:position}' a Prev/Next button's (direction, cursor) (pagination.parse_position)
+# Dispatch walks the trie once along the callback data and tries the deepest
+# matching route first, so 'admin_invalid_payment_{tx_id}' wins over
+# 'admin_invalid_{tx_id}' regardless of registration order.
+# A callback_codec.Action can be routed too: encoded data ("~...") is decoded
+# once and goes straight to that action's routes, its fields as parameters.
+
+import inspect
+import logging
+import callback_codec
+import pagination
+from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.dispatcher.handler import SkipHandler
+
+logger = logging.getLogger(__name__)
+
+CONVERTERS = {'str': str, 'int': int, 'position': pagination.parse_position}
+
+class _Route:
+    __slots__ = ('pattern', 'handler', 'param', 'convert', 'states', 'user_ids', 'wants', 'hits')
+
+    def __init__(self, pattern, handler, param, convert, states, user_ids):
+        self.pattern = pattern
+        self.handler = handler
+        self.param = param
+        self.convert = convert
+        self.states = states
+        self.user_ids = user_ids
+        # Only pass handlers the arguments they declare
+        self.wants = set(inspect.signature(handler).parameters)
+        self.hits = 0
+
+class _Node:
+    __slots__ = ('children', 'exact', 'prefix')
+
+    def __init__(self):
+        self.children = {}
+        self.exact = []   # routes ending here
+        self.prefix = []  # routes taking the rest of the data as their parameter
+
+_root = _Node()
+_by_action = {}  # callback_codec action code -> routes
+_routes = []
+_unmatched = 0
+_rejected = 0
+
+def _parse(pattern):
+    """(literal prefix, parameter name, converter) for a route pattern"""
+    if '{' not in pattern:
+        return pattern, None, None
+    literal, _, param = pattern.partition('{')
+    if not param.endswith('}') or '{' in param:
+        raise ValueError(f"Bad route pattern '{pattern}': only one trailing {{param}} is supported")
+    name, _, type_name = param[:-1].partition(':')
+    if type_name and type_name not in CONVERTERS:
+        raise ValueError(f"Bad route pattern '{pattern}': unknown type '{type_name}'")
+    return literal, name, CONVERTERS[type_name or 'str']
+
+def _normalize_states(state):
+    """The set of state names a route runs in, '*' for any, None for no state (like aiogram's StateFilter)"""
+    if state == '*':
+        return '*'
+    names = set()
+    for item in state if isinstance(state, (list, set, tuple, frozenset)) else [state]:
+        if isinstance(item, State):
+            names.add(item.state)
+        elif inspect.isclass(item) and issubclass(item, StatesGroup):
+            names.update(item.all_states_names)
+        else:
+            names.add(item)
+    return names
+
+def add(handler, *patterns, state=None, user_id=None):
+    """Route callback data matching any of `patterns` (strings or callback_codec actions) to `handler`.
+
+    `state` and `user_id` work like the aiogram filters of the same name; the
+    handler gets `state` (FSMContext) and route parameters if it declares them.
+    """
+    states = _normalize_states(state)
+    user_ids = None if user_id is None else set(user_id if isinstance(user_id, (list, set, tuple)) else [user_id])
+    for pattern in patterns:
+        if isinstance(pattern, callback_codec.Action):
+            route = _Route(callback_codec.PREFIX + pattern.name, handler, None, None, states, user_ids)
+            _by_action.setdefault(pattern.code, []).append(route)
+            _routes.append(route)
+            continue
+        literal, param, convert = _parse(pattern)
+        route = _Route(pattern, handler, param, convert, states, user_ids)
+        node = _root
+        for char in literal:
+            node = node.children.setdefault(char, _Node())
+        (node.prefix if param else node.exact).append(route)
+        _routes.append(route)
+
+def match(data):
+    """Candidate (route, params) pairs for plain `data`, deepest first; filters are not checked"""
+    candidates = []
+    node = _root
+    for i, char in enumerate(data):
+        if node.prefix:
+            candidates.append((node.prefix, data[i:]))
+        node = node.children.get(char)
+        if node is None:
+            break
+    else:
+        if node.exact:
+            candidates.append((node.exact, None))
+
+    for routes, value in reversed(candidates):
+        for route in routes:
+            if route.param is None:
+                yield route, {}
+                continue
+            try:
+                yield route, {route.param: route.convert(value)}
+            except ValueError:
+                continue
+
+async def dispatch(query, state):
+    """The single aiogram callback handler: run the first route whose filters pass"""
+    global _unmatched, _rejected
+
+    data = query.data or ''
+    if data.startswith(callback_codec.PREFIX):
+        try:
+            action, params = callback_codec.decode(data)
+        except ValueError as e:
+            # Tampered with, or from a format version that's gone
+            _rejected += 1
+            logger.warning(f"⚠️ Rejected callback data from {query.from_user.id}: {e}")
+            await query.answer("⚠️ This button has expired. Please open the menu again.", show_alert=True)
+            return
+        candidates = ((route, params) for route in _by_action.get(action.code, ()))
+    else:
+        candidates = match(data)
+
+    raw_state = ...  # read from storage at most once
+    for route, params in candidates:
+        if route.user_ids is not None and query.from_user.id not in route.user_ids:
+            continue
+        if route.states != '*':
+            if raw_state is ...:
+                raw_state = await state.get_state()
+            if raw_state not in route.states:
+                continue
+
+        route.hits += 1
+        kwargs = {}
+        if 'state' in route.wants:
+            kwargs['state'] = state
+        for name, value in params.items():
+            if name in route.wants:
+                kwargs[name] = value
+        return await route.handler(query, **kwargs)
+
+    _unmatched += 1
+    raise SkipHandler()
+
+def install(dp):
+    """Register dispatch() as the dispatcher's callback query handler"""
+    dp.register_callback_query_handler(dispatch, state='*')
+    logger.info(f"✅ Callback router installed with {len(_routes)} routes")
+
+def get_metrics():
+    """Route count, hits per route pattern (busiest first), callbacks no route took and invalid encoded ones"""
+    hits = sorted(((route.pattern, route.hits) for route in _routes), key=lambda item: -item[1])
+    return {'routes': len(_routes), 'hits': dict(hits), 'unmatched': _unmatched, 'rejected': _rejected}
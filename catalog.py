@@ -0,0 +1,57 @@
+# catalog.py - Read-mostly snapshot of gift cards, logos and rates
+
+import logging
+import threading
+import cache_sync
+from collections import namedtuple
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Immutable once built; readers grab the current one and never see a half-update
+CatalogSnapshot = namedtuple('CatalogSnapshot', [
+    'version',
+    'cards',   # ((name, logo_url), ...) sorted by name
+    'logos',   # name -> logo_url
+    'file_ids',  # name -> Telegram file_id of the uploaded logo (see logos.py)
+    'rates',   # name -> (min_rate, max_rate, buy_min_rate, buy_max_rate)
+])
+
+_snapshot = None
+_reload_lock = threading.Lock()
+
+def load():
+    """Read the catalog tables and atomically swap in a new snapshot"""
+    global _snapshot
+    with _reload_lock:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT name, logo_url, logo_file_id FROM gift_cards ORDER BY name')
+            rows = cursor.fetchall()
+            cards = tuple((name, logo_url) for name, logo_url, _ in rows)
+            file_ids = {name: file_id for name, _, file_id in rows if file_id}
+            cursor.execute('SELECT gift_card_name, min_rate, max_rate, buy_min_rate, buy_max_rate FROM rates')
+            rates = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+        version = _snapshot.version + 1 if _snapshot else 1
+        _snapshot = CatalogSnapshot(version, cards, dict(cards), file_ids, rates)
+
+    logger.info(f"✅ Catalog v{version} loaded: {len(cards)} cards, {len(file_ids)} cached logos, {len(rates)} rates")
+    return _snapshot
+
+def is_loaded():
+    return _snapshot is not None
+
+def get_snapshot():
+    """Current snapshot, loading it on first use"""
+    snapshot = _snapshot
+    if snapshot is None:
+        snapshot = load()
+    return snapshot
+
+def invalidate():
+    """Call after rates or cards change"""
+    cache_sync.publish('catalog')
+    return load()
+
+cache_sync.subscribe('catalog', load)
@@ -8,6 +8,8 @@ load_dotenv()
 # Bot credentials
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 BOT_USERNAME = ""  # Will be set dynamically on startup
+# Bot API server base URL, for a self-hosted telegram-bot-api (default: api.telegram.org)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
 
 # Admin settings - FIXED PARSING
 ADMIN_IDS_STR = os.getenv('ADMIN_IDS', '')
@@ -22,14 +24,107 @@ except (ValueError, TypeError):
 
 # Database
 DB_NAME = os.getenv('DB_NAME', 'giftcard_bot.db')
+DB_READ_THREADS = int(os.getenv('DB_READ_THREADS', '4'))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', str(DB_READ_THREADS + 2)))  # readers + writer + spare
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))  # 16 MB page cache per connection
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))  # 256 MB memory-mapped I/O
+
+# How often buffered last_activity updates are written (seconds)
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv('ACTIVITY_FLUSH_INTERVAL', '10'))
+
+# How often the admin panel counters are checked against the tables (seconds)
+COUNTERS_RECONCILE_INTERVAL = int(os.getenv('COUNTERS_RECONCILE_INTERVAL', '3600'))
+
+# Main menu dashboard caching
+DASHBOARD_CACHE_SIZE = int(os.getenv('DASHBOARD_CACHE_SIZE', '10000'))  # users
+
+# Inventory ids prefetched per card/denomination queue
+INVENTORY_PREFETCH_BATCH = int(os.getenv('INVENTORY_PREFETCH_BATCH', '64'))
+
+# Rows per transaction when bulk importing inventory
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '10000'))
 
 # State timeout (5 minutes)
 STATE_TIMEOUT = 300
 
+# FSM states kept in memory, and how often expired ones are swept (seconds)
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '10000'))
+FSM_SWEEP_INTERVAL = int(os.getenv('FSM_SWEEP_INTERVAL', '60'))
+
+# Outbound message limits (Telegram allows ~30 msg/s overall, ~1/s per chat, ~20/min per group or channel)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))  # messages per second
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))  # messages per second per private chat
+OUTBOUND_GROUP_RATE = float(os.getenv('OUTBOUND_GROUP_RATE', '20'))  # messages per minute per group/channel
+OUTBOUND_BURST = int(os.getenv('OUTBOUND_BURST', '3'))  # back-to-back messages allowed per chat
+OUTBOUND_MAX_IN_FLIGHT = int(os.getenv('OUTBOUND_MAX_IN_FLIGHT', '30'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '5'))  # RetryAfter retries per message
+
+# Broadcasts: recipients queued (and checkpointed) at a time, progress message refresh (seconds)
+BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', '500'))
+BROADCAST_PROGRESS_INTERVAL = int(os.getenv('BROADCAST_PROGRESS_INTERVAL', '5'))
+
+# Background jobs: concurrent workers, idle poll (seconds), lease before a stuck job is retried (seconds)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '8'))
+JOB_POLL_INTERVAL = int(os.getenv('JOB_POLL_INTERVAL', '5'))
+JOB_LEASE = int(os.getenv('JOB_LEASE', '300'))
+# Attempts before a job is dead-lettered; retries back off exponentially from JOB_RETRY_DELAY seconds
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', '10'))
+JOB_RETRY_MAX_DELAY = int(os.getenv('JOB_RETRY_MAX_DELAY', '600'))
+
+# Notification outbox: messages sent per batch (and at once), idle poll and lease (seconds)
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_POLL_INTERVAL = int(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_LEASE = int(os.getenv('OUTBOX_LEASE', '300'))
+# Attempts before a message is given up on; retries back off exponentially from OUTBOX_RETRY_DELAY seconds
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_RETRY_DELAY = int(os.getenv('OUTBOX_RETRY_DELAY', '5'))
+OUTBOX_RETRY_MAX_DELAY = int(os.getenv('OUTBOX_RETRY_MAX_DELAY', '900'))
+# Days sent messages (and so their idempotency keys) are kept
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+
+# Update scheduler: per-user shards (a queue and worker each) and updates a shard queues before intake waits
+UPDATE_SHARDS = int(os.getenv('UPDATE_SHARDS', '32'))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '100'))
+
+# Multi-process mode: worker processes updates are sharded over by user (1 = handle them in this process)
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+# Set by the front process in each worker's environment
+WORKER_INDEX = int(os.getenv('WORKER_INDEX')) if os.getenv('WORKER_INDEX') else None
+# Seconds between a worker publishing its cache changes and picking up the others'
+CACHE_SYNC_INTERVAL = float(os.getenv('CACHE_SYNC_INTERVAL', '1'))
+
+# Telegram's limits are per bot, so each worker sends its share
+if WORKER_INDEX is not None:
+    OUTBOUND_GLOBAL_RATE /= BOT_WORKERS
+    OUTBOUND_GROUP_RATE /= BOT_WORKERS
+
+# Update delivery: 'polling' or 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '').rstrip('/')  # public https base URL
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}"
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# HTTP server for the webhook and the /, /health, /ping routes (PORT is set by the host)
+WEB_SERVER_HOST = os.getenv('WEB_SERVER_HOST', '0.0.0.0')
+WEB_SERVER_PORT = int(os.getenv('PORT', '10000'))
+# In polling mode the health routes are only served when asked for (or a PORT is provided)
+SERVE_HEALTH_CHECKS = os.getenv('SERVE_HEALTH_CHECKS', '1' if os.getenv('PORT') else '0') == '1'
+
 # Validate critical settings
 if not BOT_TOKEN:
     raise ValueError("❌ BOT_TOKEN not found in .env file!")
 
+if BOT_MODE not in ('polling', 'webhook'):
+    raise ValueError("❌ BOT_MODE must be 'polling' or 'webhook'!")
+
+if BOT_WORKERS < 1:
+    raise ValueError("❌ BOT_WORKERS must be at least 1!")
+
+if BOT_MODE == 'webhook' and not WEBHOOK_HOST:
+    raise ValueError("❌ WEBHOOK_HOST must be set in webhook mode!")
+
 if not ADMIN_IDS:
     raise ValueError("❌ ADMIN_IDS not found in .env file!")
 
@@ -67,9 +162,15 @@ GIFT_CARDS = [
     {"name": "Xbox", "logo": "https://upload.wikimedia.org/wikipedia/commons/d/d7/Xbox_logo_%282019%29.svg"},
 ]
 
+# Width (px) gift card logos are rasterized to before uploading
+LOGO_SIZE = int(os.getenv('LOGO_SIZE', '512'))
+
 # Cards per page
 CARDS_PER_PAGE = 8
 
+# Rows per page in transaction, withdrawal and user lists
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '10'))
+
 # Crypto payment wallets
 PAYMENT_WALLETS = {
     "BTC": {
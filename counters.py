@@ -0,0 +1,85 @@
+# counters.py - Running totals for the admin panel header
+
+import asyncio
+import logging
+from config import COUNTERS_RECONCILE_INTERVAL
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+# name -> query giving the true value, used to seed and reconcile
+COUNTERS = {
+    'users': 'SELECT COUNT(*) FROM users',
+    'balance': 'SELECT COALESCE(SUM(balance), 0) FROM users',
+    'pending_tx': "SELECT COUNT(*) FROM transactions WHERE status = 'pending'",
+    'pending_wd': "SELECT COUNT(*) FROM withdrawals WHERE status = 'pending'",
+}
+
+# Float totals are allowed this much rounding drift before reconcile() reports it
+TOLERANCE = 0.005
+
+def create_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value REAL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+
+def bump(cursor, name, delta):
+    """Adjust a counter inside the caller's transaction"""
+    if delta:
+        cursor.execute('UPDATE counters SET value = value + ? WHERE name = ?', (delta, name))
+
+def bump_status(cursor, name, old_status, new_status, tracked='pending'):
+    """Move a row in or out of a status counter"""
+    if old_status == tracked and new_status != tracked:
+        bump(cursor, name, -1)
+    elif old_status != tracked and new_status == tracked:
+        bump(cursor, name, 1)
+
+def get_all():
+    """{name: value} for every counter"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT name, value FROM counters')
+        values = dict(cursor.fetchall())
+
+    return {name: values.get(name, 0) for name in COUNTERS}
+
+def reconcile(cursor=None):
+    """Recompute every counter from the tables and fix any drift; returns {name: drift}"""
+    if cursor is None:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            return reconcile(cursor)
+
+    drift = {}
+    for name, query in COUNTERS.items():
+        actual = cursor.execute(query).fetchone()[0]
+        row = cursor.execute('SELECT value FROM counters WHERE name = ?', (name,)).fetchone()
+        stored = row[0] if row else None
+        if stored is not None and abs(stored - actual) <= TOLERANCE:
+            continue
+        cursor.execute('''
+            INSERT INTO counters (name, value) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        ''', (name, actual))
+        if stored is not None:
+            drift[name] = actual - stored
+
+    if drift:
+        logger.warning(f"⚠️ Counters drifted and were corrected: {drift}")
+    return drift
+
+async def run_reconciler(interval=COUNTERS_RECONCILE_INTERVAL):
+    """Reconcile the counters on the database writer thread every `interval` seconds"""
+    from async_db import run_write
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_write(reconcile)
+        except Exception as e:
+            logger.error(f"❌ Counter reconcile failed: {e}")
@@ -0,0 +1,58 @@
+# dashboard_cache.py - Per-user cache of the rendered main menu dashboard
+
+import threading
+import cache_sync
+from collections import OrderedDict
+from config import DASHBOARD_CACHE_SIZE
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # user_id -> (version, trending, text); text None marks an invalidation
+_version = 0
+_stats = {'hits': 0, 'misses': 0}
+
+def token():
+    """Take before reading the user's stats; pass to put() afterwards"""
+    with _lock:
+        return _version
+
+def get(user_id, trending):
+    """Cached dashboard text, if still valid for the current trending list"""
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry and entry[2] is not None and entry[1] == trending:
+            _entries.move_to_end(user_id)
+            _stats['hits'] += 1
+            return entry[2]
+        _stats['misses'] += 1
+        return None
+
+def put(user_id, trending, text, read_token):
+    """Store a render unless the user's data changed while it was being built"""
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry and entry[0] > read_token:
+            return
+        _entries[user_id] = (read_token, trending, text)
+        _entries.move_to_end(user_id)
+        while len(_entries) > DASHBOARD_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+def invalidate(user_id):
+    """Drop a user's render after their balance, transactions or referrals change"""
+    _drop(user_id)
+    cache_sync.publish('dashboard', user_id)
+
+def _drop(user_id):
+    global _version
+    with _lock:
+        _version += 1
+        _entries[user_id] = (_version, None, None)
+        _entries.move_to_end(user_id)
+        while len(_entries) > DASHBOARD_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+cache_sync.subscribe('dashboard', _drop)
+
+def get_metrics():
+    with _lock:
+        return {'size': len(_entries), **_stats}
@@ -1,457 +1,396 @@
-import sqlite3
+import logging
 import uuid
-from config import DB_NAME, GIFT_CARDS
-from datetime import datetime, timedelta
+import activity_buffer
+import catalog
+import counters
+import dashboard_cache
+import inventory
+import jobs
+import outbox
+import pagination
+import rollups
+import trending
+from db_pool import get_connection
+from migrations import migrate
+
+logger = logging.getLogger(__name__)
 
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Users table with balance
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            registered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            referral_code TEXT UNIQUE,
-            referred_by INTEGER,
-            balance REAL DEFAULT 0.0,
-            last_activity DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Gift cards table (simplified - no country)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS gift_cards (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE,
-            logo_url TEXT
-        )
-    ''')
-    
-    # Rates table (simplified)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS rates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            gift_card_name TEXT UNIQUE,
-            min_rate REAL DEFAULT 5.0,
-            max_rate REAL DEFAULT 25.0,
-            buy_min_rate REAL DEFAULT 10.0,
-            buy_max_rate REAL DEFAULT 30.0,
-            FOREIGN KEY (gift_card_name) REFERENCES gift_cards(name)
-        )
-    ''')
-    
-    # Transactions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            tx_id TEXT PRIMARY KEY,
-            user_id INTEGER,
-            type TEXT,
-            gift_card_name TEXT,
-            denomination REAL,
-            calculated_amount REAL,
-            status TEXT DEFAULT 'pending',
-            reason TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            completed_at DATETIME,
-            FOREIGN KEY (user_id) REFERENCES users(user_id)
-        )
-    ''')
-    
-    # Inventory for buy side
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS inventory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            gift_card_name TEXT,
-            code TEXT UNIQUE,
-            denomination REAL,
-            available BOOLEAN DEFAULT TRUE,
-            FOREIGN KEY (gift_card_name) REFERENCES gift_cards(name)
-        )
-    ''')
-    
-    # Rewards table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS rewards (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            referrer_id INTEGER,
-            referred_id INTEGER,
-            amount REAL DEFAULT 5.0,
-            status TEXT DEFAULT 'pending',
-            tx_id TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Withdrawals table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS withdrawals (
-            wd_id TEXT PRIMARY KEY,
-            user_id INTEGER,
-            method TEXT,
-            amount REAL,
-            fee REAL,
-            net_amount REAL,
-            details TEXT,
-            status TEXT DEFAULT 'pending',
-            reason TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(user_id)
-        )
-    ''')
-    
-    # Insert approved gift cards
-    for card in GIFT_CARDS:
-        cursor.execute('INSERT OR IGNORE INTO gift_cards (name, logo_url) VALUES (?, ?)', 
-                      (card['name'], card['logo']))
-        cursor.execute('INSERT OR IGNORE INTO rates (gift_card_name) VALUES (?)', 
-                      (card['name'],))
-    
-    conn.commit()
-    conn.close()
+    """Bring the schema up to date"""
+    with get_connection() as conn:
+        version = migrate(conn)
+    logger.info(f"✅ Database schema at version {version}")
 
 # User functions
 def add_user(user_id, username, referred_by=None):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    referral_code = uuid.uuid4().hex[:8].upper()
-    cursor.execute('''INSERT OR IGNORE INTO users (user_id, username, referral_code, referred_by) 
-                     VALUES (?, ?, ?, ?)''', (user_id, username, referral_code, referred_by))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        referral_code = uuid.uuid4().hex[:8].upper()
+        cursor.execute('''INSERT OR IGNORE INTO users (user_id, username, referral_code, referred_by) 
+                         VALUES (?, ?, ?, ?)''', (user_id, username, referral_code, referred_by))
+        inserted = cursor.rowcount == 1
+        if inserted:
+            counters.bump(cursor, 'users', 1)
+    if inserted and referred_by:
+        dashboard_cache.invalidate(referred_by)
 
 def update_last_activity(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    """Buffered - written in batches by activity_buffer.flush()"""
+    activity_buffer.record(user_id)
 
 def get_balance(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else 0.0
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        return result[0] if result else 0.0
+
+def _adjust_balance(cursor, user_id, amount):
+    """Add `amount` (negative to deduct) to a balance inside the caller's transaction"""
+    cursor.execute('UPDATE users SET balance = balance + ? WHERE user_id = ?', (amount, user_id))
+    if cursor.rowcount:
+        counters.bump(cursor, 'balance', amount)
 
 def update_balance(user_id, amount, add=True):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    op = '+' if add else '-'
-    cursor.execute(f'UPDATE users SET balance = balance {op} ? WHERE user_id = ?', (amount, user_id))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        _adjust_balance(conn.cursor(), user_id, amount if add else -amount)
+    dashboard_cache.invalidate(user_id)
 
 def get_user(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_id, username, balance FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id, username, balance FROM users WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        return result
 
 def get_user_stats(user_id):
-    """Get comprehensive user statistics"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Get user info
-    cursor.execute('SELECT username, balance FROM users WHERE user_id = ?', (user_id,))
-    user = cursor.fetchone()
-    
-    # Get transaction count
-    cursor.execute('SELECT COUNT(*) FROM transactions WHERE user_id = ? AND status = "completed"', (user_id,))
-    tx_count = cursor.fetchone()[0]
-    
-    # Get referral count
-    cursor.execute('SELECT COUNT(*) FROM users WHERE referred_by = ?', (user_id,))
-    ref_count = cursor.fetchone()[0]
-    
-    conn.close()
+    """Get comprehensive user statistics in a single statement"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT
+                (SELECT username FROM users WHERE user_id = :user_id),
+                (SELECT balance FROM users WHERE user_id = :user_id),
+                (SELECT COUNT(*) FROM transactions WHERE user_id = :user_id AND status = 'completed'),
+                (SELECT COUNT(*) FROM users WHERE referred_by = :user_id)
+        ''', {'user_id': user_id})
+        username, balance, tx_count, ref_count = cursor.fetchone()
     
     return {
-        'username': user[0] if user else 'Unknown',
-        'balance': user[1] if user else 0.0,
+        'username': username or 'Unknown',
+        'balance': balance if balance is not None else 0.0,
         'transactions': tx_count,
         'referrals': ref_count
     }
 
-# Gift card functions
+# Gift card functions (served from the catalog snapshot)
 def get_all_gift_cards():
     """Get all gift cards sorted alphabetically"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT name, logo_url FROM gift_cards ORDER BY name')
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return list(catalog.get_snapshot().cards)
 
 def get_gift_card_logo(name):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT logo_url FROM gift_cards WHERE name = ?', (name,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
+    return catalog.get_snapshot().logos.get(name)
 
 # Rate functions
 def get_random_rate(gift_card_name, is_buy=False):
     import random
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    if is_buy:
-        cursor.execute('SELECT buy_min_rate, buy_max_rate FROM rates WHERE gift_card_name = ?', (gift_card_name,))
-    else:
-        cursor.execute('SELECT min_rate, max_rate FROM rates WHERE gift_card_name = ?', (gift_card_name,))
-    result = cursor.fetchone()
-    conn.close()
-    if result:
-        min_r, max_r = result
+    rates = catalog.get_snapshot().rates.get(gift_card_name)
+    if rates:
+        min_r, max_r = rates[2:] if is_buy else rates[:2]
         return random.uniform(min_r, max_r)
     return random.uniform(5, 25) if not is_buy else random.uniform(10, 30)
 
 # Transaction functions
-def add_transaction(tx_id, user_id, tx_type, gift_card_name, denomination, calculated_amount):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO transactions (tx_id, user_id, type, gift_card_name, denomination, calculated_amount)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (tx_id, user_id, tx_type, gift_card_name, denomination, calculated_amount))
-    conn.commit()
-    conn.close()
-
-def update_transaction_status(tx_id, status, reason=None):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+def add_transaction(tx_id, user_id, tx_type, gift_card_name, denomination, calculated_amount, job=None):
+    """`job` is an optional (kind, payload) queued in the same transaction"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO transactions (tx_id, user_id, type, gift_card_name, denomination, calculated_amount)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (tx_id, user_id, tx_type, gift_card_name, denomination, calculated_amount))
+        rollups.record_transaction(cursor, tx_id)
+        counters.bump(cursor, 'pending_tx', 1)
+        if job:
+            jobs.enqueue(cursor, *job)
+    dashboard_cache.invalidate(user_id)
+
+def update_transaction_status(tx_id, status, reason=None, credit=0, notify=None):
+    """Settle a pending transaction; returns False if it was already settled (e.g. a double tap).
+
+    `credit` is added to the user's balance and `notify` (outbox.add arguments) queued in the same transaction.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        # Read the old status under the write lock so each transaction is settled once
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT status FROM transactions WHERE tx_id = ?', (tx_id,))
+        old = cursor.fetchone()
+        if not old or old[0] != 'pending':
+            return False
+        rollups.record_transaction(cursor, tx_id, sign=-1)
+        if status == 'completed':
+            cursor.execute('''UPDATE transactions SET status = ?, reason = ?, completed_at = CURRENT_TIMESTAMP 
+                             WHERE tx_id = ? RETURNING user_id, gift_card_name, created_at''', (status, reason, tx_id))
+        else:
+            cursor.execute('''UPDATE transactions SET status = ?, reason = ? 
+                             WHERE tx_id = ? RETURNING user_id, gift_card_name, created_at''', (status, reason, tx_id))
+        user_id, gift_card_name, created_at = cursor.fetchone()
+        rollups.record_transaction(cursor, tx_id)
+        counters.bump_status(cursor, 'pending_tx', old[0], status)
+        if credit:
+            _adjust_balance(cursor, user_id, credit)
+        if notify:
+            outbox.add(cursor, f"tx:{tx_id}:{status}", **notify)
+    dashboard_cache.invalidate(user_id)
+    
+    # Keep the trending leaderboard in step with completed sales
     if status == 'completed':
-        cursor.execute('''UPDATE transactions SET status = ?, reason = ?, completed_at = CURRENT_TIMESTAMP 
-                         WHERE tx_id = ?''', (status, reason, tx_id))
-    else:
-        cursor.execute('UPDATE transactions SET status = ?, reason = ? WHERE tx_id = ?', (status, reason, tx_id))
-    conn.commit()
-    conn.close()
+        trending.record_sale(gift_card_name, created_at)
+    return True
 
 def get_transaction(tx_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM transactions WHERE tx_id = ?', (tx_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM transactions WHERE tx_id = ?', (tx_id,))
+        result = cursor.fetchone()
+        return result
+
+def get_user_transactions_page(user_id, direction=None, after=None):
+    """One page of a user's history, newest first (see pagination.fetch_page)"""
+    with get_connection() as conn:
+        return pagination.fetch_page(
+            conn.cursor(),
+            'SELECT tx_id, type, gift_card_name, denomination, calculated_amount, status, created_at FROM transactions',
+            ('created_at', 'tx_id'), (6, 0), 'user_id = ?', (user_id,), direction, after)
 
 def get_user_transactions(user_id, limit=10):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''SELECT tx_id, type, gift_card_name, denomination, calculated_amount, status, created_at 
-                     FROM transactions WHERE user_id = ? ORDER BY created_at DESC LIMIT ?''', (user_id, limit))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''SELECT tx_id, type, gift_card_name, denomination, calculated_amount, status, created_at 
+                         FROM transactions WHERE user_id = ? ORDER BY created_at DESC LIMIT ?''', (user_id, limit))
+        results = cursor.fetchall()
+        return results
 
 def get_trending_cards(limit=5):
     """Get trending gift cards based on completed transactions in last 7 days"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
-    cursor.execute('''
-        SELECT gift_card_name, COUNT(*) as count 
-        FROM transactions 
-        WHERE status = 'completed' AND created_at > ?
-        GROUP BY gift_card_name 
-        ORDER BY count DESC 
-        LIMIT ?
-    ''', (week_ago, limit))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return trending.get_trending_cards(limit)
 
 # Referral functions
 def get_referral_code(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT referral_code FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT referral_code FROM users WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        return result[0] if result else None
 
 def get_user_by_referral_code(code):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_id, username FROM users WHERE referral_code = ?', (code,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id, username FROM users WHERE referral_code = ?', (code,))
+        result = cursor.fetchone()
+        return result
 
 def get_referred_by(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT referred_by FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT referred_by FROM users WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        return result[0] if result else None
 
 def get_referrals_count(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM users WHERE referred_by = ?', (user_id,))
-    result = cursor.fetchone()[0]
-    conn.close()
-    return result
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM users WHERE referred_by = ?', (user_id,))
+        result = cursor.fetchone()[0]
+        return result
 
 def reward_exists(referrer_id, referred_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT 1 FROM rewards WHERE referrer_id = ? AND referred_id = ? LIMIT 1', 
-                  (referrer_id, referred_id))
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1 FROM rewards WHERE referrer_id = ? AND referred_id = ? LIMIT 1', 
+                      (referrer_id, referred_id))
+        result = cursor.fetchone()
+        return result is not None
 
 def add_reward(referrer_id, referred_id, tx_id, amount=5.0):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO rewards (referrer_id, referred_id, tx_id, amount)
-        VALUES (?, ?, ?, ?)
-    ''', (referrer_id, referred_id, tx_id, amount))
-    reward_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return reward_id
-
-def update_reward_status(reward_id, status):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE rewards SET status = ? WHERE id = ?', (status, reward_id))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO rewards (referrer_id, referred_id, tx_id, amount)
+            VALUES (?, ?, ?, ?)
+        ''', (referrer_id, referred_id, tx_id, amount))
+        reward_id = cursor.lastrowid
+        rollups.record_reward(cursor, reward_id)
+        return reward_id
+
+def update_reward_status(reward_id, status, credit=0, notify=None):
+    """Settle a pending reward; returns False if it was already settled.
+
+    `credit` is added to the referrer's balance and `notify` queued in the same transaction.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT status, referrer_id FROM rewards WHERE id = ?', (reward_id,))
+        old = cursor.fetchone()
+        if not old or old[0] != 'pending':
+            return False
+        rollups.record_reward(cursor, reward_id, sign=-1)
+        cursor.execute('UPDATE rewards SET status = ? WHERE id = ?', (status, reward_id))
+        rollups.record_reward(cursor, reward_id)
+        if credit:
+            _adjust_balance(cursor, old[1], credit)
+        if notify:
+            outbox.add(cursor, f"reward:{reward_id}:{status}", **notify)
+    dashboard_cache.invalidate(old[1])
+    return True
 
 def get_reward(reward_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM rewards WHERE id = ?', (reward_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM rewards WHERE id = ?', (reward_id,))
+        result = cursor.fetchone()
+        return result
 
 def get_pending_rewards_amount(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT SUM(amount) FROM rewards WHERE referrer_id = ? AND status = "pending"', (user_id,))
-    result = cursor.fetchone()[0] or 0.0
-    conn.close()
-    return result
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT SUM(amount) FROM rewards WHERE referrer_id = ? AND status = 'pending'", (user_id,))
+        result = cursor.fetchone()[0] or 0.0
+        return result
 
 def get_paid_rewards_amount(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT SUM(amount) FROM rewards WHERE referrer_id = ? AND status = "paid"', (user_id,))
-    result = cursor.fetchone()[0] or 0.0
-    conn.close()
-    return result
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT SUM(amount) FROM rewards WHERE referrer_id = ? AND status = 'paid'", (user_id,))
+        result = cursor.fetchone()[0] or 0.0
+        return result
 
 # Withdrawal functions
-def add_withdrawal(wd_id, user_id, method, amount, fee, net_amount, details):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO withdrawals (wd_id, user_id, method, amount, fee, net_amount, details)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (wd_id, user_id, method, amount, fee, net_amount, details))
-    conn.commit()
-    conn.close()
-
-def update_withdrawal_status(wd_id, status, reason=None):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    if reason:
-        cursor.execute('UPDATE withdrawals SET status = ?, reason = ? WHERE wd_id = ?', (status, reason, wd_id))
-    else:
-        cursor.execute('UPDATE withdrawals SET status = ? WHERE wd_id = ?', (status, wd_id))
-    conn.commit()
-    conn.close()
+def add_withdrawal(wd_id, user_id, method, amount, fee, net_amount, details, job=None):
+    """Debit `amount` and record the withdrawal; returns False (nothing written) if the balance is short.
+
+    `job` is an optional (kind, payload) queued in the same transaction.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        # Checked at write time, so two confirms can't both spend the same balance
+        cursor.execute('UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?',
+                       (amount, user_id, amount))
+        if not cursor.rowcount:
+            conn.rollback()
+            return False
+        counters.bump(cursor, 'balance', -amount)
+        cursor.execute('''
+            INSERT INTO withdrawals (wd_id, user_id, method, amount, fee, net_amount, details)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (wd_id, user_id, method, amount, fee, net_amount, details))
+        rollups.record_withdrawal(cursor, wd_id)
+        counters.bump(cursor, 'pending_wd', 1)
+        if job:
+            jobs.enqueue(cursor, *job)
+    dashboard_cache.invalidate(user_id)
+    return True
+
+def update_withdrawal_status(wd_id, status, reason=None, credit=0, notify=None):
+    """Settle a pending withdrawal; returns False if it was already settled.
+
+    `credit` (a refund) is added to the user's balance and `notify` queued in the same transaction.
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT status, user_id FROM withdrawals WHERE wd_id = ?', (wd_id,))
+        old = cursor.fetchone()
+        if not old or old[0] != 'pending':
+            return False
+        rollups.record_withdrawal(cursor, wd_id, sign=-1)
+        if reason:
+            cursor.execute('UPDATE withdrawals SET status = ?, reason = ? WHERE wd_id = ?', (status, reason, wd_id))
+        else:
+            cursor.execute('UPDATE withdrawals SET status = ? WHERE wd_id = ?', (status, wd_id))
+        rollups.record_withdrawal(cursor, wd_id)
+        counters.bump_status(cursor, 'pending_wd', old[0], status)
+        if credit:
+            _adjust_balance(cursor, old[1], credit)
+        if notify:
+            outbox.add(cursor, f"wd:{wd_id}:{status}", **notify)
+    dashboard_cache.invalidate(old[1])
+    return True
 
 def get_withdrawal(wd_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM withdrawals WHERE wd_id = ?', (wd_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM withdrawals WHERE wd_id = ?', (wd_id,))
+        result = cursor.fetchone()
+        return result
 
 def get_user_withdrawals(user_id, limit=5):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''SELECT wd_id, method, amount, status, created_at 
-                     FROM withdrawals WHERE user_id = ? ORDER BY created_at DESC LIMIT ?''', (user_id, limit))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''SELECT wd_id, method, amount, status, created_at 
+                         FROM withdrawals WHERE user_id = ? ORDER BY created_at DESC LIMIT ?''', (user_id, limit))
+        results = cursor.fetchall()
+        return results
 
 def get_pending_withdrawals():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM withdrawals WHERE status = "pending"')
-    results = cursor.fetchall()
-    conn.close()
-    return results
-
-# Inventory functions
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM withdrawals WHERE status = 'pending'")
+        results = cursor.fetchall()
+        return results
+
+# Inventory functions (reservations handled by inventory.py)
 def add_inventory(gift_card_name, code, denomination):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO inventory (gift_card_name, code, denomination) VALUES (?, ?, ?)', 
-                  (gift_card_name, code, denomination))
-    conn.commit()
-    conn.close()
+    inventory.add_code(gift_card_name, code, denomination)
 
 def get_available_code(gift_card_name, denomination):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''SELECT code FROM inventory 
-                     WHERE gift_card_name = ? AND denomination = ? AND available = TRUE LIMIT 1''', 
-                  (gift_card_name, denomination))
-    result = cursor.fetchone()
-    if result:
-        code = result[0]
-        cursor.execute('UPDATE inventory SET available = FALSE WHERE code = ?', (code,))
-        conn.commit()
-    conn.close()
-    return result[0] if result else None
+    return inventory.claim_code(gift_card_name, denomination)
 
 # Admin functions
 def get_all_users():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_id, username, balance FROM users ORDER BY user_id')
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id, username, balance FROM users ORDER BY user_id')
+        results = cursor.fetchall()
+        return results
 
 def get_all_transactions(status=None):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    if status:
-        cursor.execute('SELECT * FROM transactions WHERE status = ? ORDER BY created_at DESC', (status,))
-    else:
-        cursor.execute('SELECT * FROM transactions ORDER BY created_at DESC LIMIT 50')
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if status:
+            cursor.execute('SELECT * FROM transactions WHERE status = ? ORDER BY created_at DESC', (status,))
+        else:
+            cursor.execute('SELECT * FROM transactions ORDER BY created_at DESC LIMIT 50')
+        results = cursor.fetchall()
+        return results
+
+def get_pending_transactions_page(direction=None, after=None):
+    with get_connection() as conn:
+        return pagination.fetch_page(conn.cursor(), 'SELECT * FROM transactions', ('created_at', 'tx_id'), (8, 0),
+                                     "status = 'pending'", (), direction, after)
+
+def get_pending_withdrawals_page(direction=None, after=None):
+    with get_connection() as conn:
+        return pagination.fetch_page(conn.cursor(), 'SELECT * FROM withdrawals', ('created_at', 'wd_id'), (9, 0),
+                                     "status = 'pending'", (), direction, after)
+
+def get_users_page(direction=None, after=None):
+    with get_connection() as conn:
+        return pagination.fetch_page(conn.cursor(), 'SELECT user_id, username, balance, registered_at FROM users',
+                                     ('registered_at', 'user_id'), (3, 0), '', (), direction, after, key_type=int)
 
 def update_rate(gift_card_name, min_rate, max_rate, buy_min=None, buy_max=None):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    if buy_min and buy_max:
-        cursor.execute('''
-            UPDATE rates SET min_rate = ?, max_rate = ?, buy_min_rate = ?, buy_max_rate = ?
-            WHERE gift_card_name = ?
-        ''', (min_rate, max_rate, buy_min, buy_max, gift_card_name))
-    else:
-        cursor.execute('UPDATE rates SET min_rate = ?, max_rate = ? WHERE gift_card_name = ?', 
-                      (min_rate, max_rate, gift_card_name))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if buy_min and buy_max:
+            cursor.execute('''
+                UPDATE rates SET min_rate = ?, max_rate = ?, buy_min_rate = ?, buy_max_rate = ?
+                WHERE gift_card_name = ?
+            ''', (min_rate, max_rate, buy_min, buy_max, gift_card_name))
+        else:
+            cursor.execute('UPDATE rates SET min_rate = ?, max_rate = ? WHERE gift_card_name = ?', 
+                          (min_rate, max_rate, gift_card_name))
+    catalog.invalidate()
@@ -0,0 +1,119 @@
+# db_pool.py - Pooled, long-lived SQLite connections
+
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config import DB_NAME, DB_POOL_SIZE, DB_CACHE_SIZE_KB, DB_MMAP_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Statements cached per connection - covers every distinct query in database.py
+STATEMENT_CACHE_SIZE = 256
+
+# Applied to every new connection (journal_mode is persisted in the db file)
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}',
+    f'PRAGMA mmap_size = {DB_MMAP_SIZE}',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',
+)
+
+class ConnectionPool:
+    """Fixed-size pool of persistent SQLite connections"""
+
+    def __init__(self, db_name, size):
+        self.db_name = db_name
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Take an idle connection, opening a new one while under the size limit"""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get()
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left open"""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commit on success, roll back on error"""
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close every idle connection; busy ones are closed on release"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        logger.info("✅ Database connection pool closed")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_NAME, DB_POOL_SIZE)
+    return _pool
+
+def get_connection():
+    """Context manager yielding a pooled connection"""
+    return get_pool().connection()
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
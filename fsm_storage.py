@@ -0,0 +1,191 @@
+# fsm_storage.py - Persistent FSM storage: SQLite table behind a write-through LRU
+
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from aiogram.dispatcher.storage import BaseStorage
+from async_db import run_read, run_write
+from config import FSM_CACHE_SIZE, FSM_SWEEP_INTERVAL, STATE_TIMEOUT
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+def _empty():
+    return {'state': None, 'data': {}, 'bucket': {}, 'updated_at': None}
+
+def _is_empty(record):
+    return record['state'] is None and not record['data'] and not record['bucket']
+
+# Blocking helpers, run on the async_db executors
+def _load(key):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT state, data, bucket, updated_at FROM fsm_states WHERE chat_id = ? AND user_id = ?', key)
+        row = cursor.fetchone()
+    if not row:
+        return None
+    state, data, bucket, updated_at = row
+    return {'state': state, 'data': json.loads(data or '{}'), 'bucket': json.loads(bucket or '{}'),
+            'updated_at': updated_at}
+
+def _save(key, state, data, bucket, updated_at):
+    with get_connection() as conn:
+        conn.execute('''
+            INSERT INTO fsm_states (chat_id, user_id, state, data, bucket, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (chat_id, user_id) DO UPDATE SET
+                state = excluded.state, data = excluded.data, bucket = excluded.bucket, updated_at = excluded.updated_at
+        ''', (*key, state, data, bucket, updated_at))
+
+def _delete(key):
+    with get_connection() as conn:
+        conn.execute('DELETE FROM fsm_states WHERE chat_id = ? AND user_id = ?', key)
+
+def _sweep(cutoff):
+    """Delete states idle since before `cutoff`; returns (deleted, remaining)"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM fsm_states WHERE updated_at < ?', (cutoff,))
+        deleted = cursor.rowcount
+        cursor.execute('SELECT COUNT(*) FROM fsm_states')
+        return deleted, cursor.fetchone()[0]
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage kept in the fsm_states table, so flows survive restarts.
+
+    Reads are served from a bounded LRU (including "no state" entries, since
+    every update checks the state); writes update the LRU and the table.
+    States untouched for `ttl` seconds are treated as finished and swept.
+    """
+
+    def __init__(self, ttl=STATE_TIMEOUT, cache_size=FSM_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # (chat_id, user_id) -> record
+        # expired_on_read: stale states found (and dropped) by a read; expired_swept: rows the sweeper deleted
+        self._stats = {'hits': 0, 'misses': 0, 'expired_on_read': 0, 'expired_swept': 0, 'live': 0}
+
+    async def close(self):
+        self._cache.clear()
+
+    async def wait_closed(self):
+        pass
+
+    def _key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    def _remember(self, key, record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _get(self, key):
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            self._stats['hits'] += 1
+        else:
+            self._stats['misses'] += 1
+            loaded = await run_read(_load, key)
+            # A write for this key may have landed while we were reading
+            record = self._cache.get(key) or loaded or _empty()
+            self._remember(key, record)
+
+        if record['updated_at'] and time.time() - record['updated_at'] > self.ttl:
+            self._stats['expired_on_read'] += 1
+            record = _empty()
+            self._remember(key, record)
+            await run_write(_delete, key)
+        return record
+
+    async def _put(self, key, record):
+        if _is_empty(record):
+            record['updated_at'] = None
+            self._remember(key, record)
+            await run_write(_delete, key)
+            return
+
+        record['updated_at'] = time.time()
+        self._remember(key, record)
+        # Serialize now, so later changes to the cached record can't leak into this write
+        await run_write(_save, key, record['state'], json.dumps(record['data']), json.dumps(record['bucket']),
+                        record['updated_at'])
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        record = await self._get(self._key(chat, user))
+        state = record['state']
+        return state if state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        record = await self._get(self._key(chat, user))
+        return copy.deepcopy(record['data'])
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key = self._key(chat, user)
+        record = await self._get(key)
+        await self._put(key, dict(record, state=self.resolve_state(state)))
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        key = self._key(chat, user)
+        record = await self._get(key)
+        await self._put(key, dict(record, data=copy.deepcopy(data or {})))
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        key = self._key(chat, user)
+        record = await self._get(key)
+        new_data = copy.deepcopy(record['data'])
+        new_data.update(data or {}, **kwargs)
+        await self._put(key, dict(record, data=new_data))
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        key = self._key(chat, user)
+        record = await self._get(key)
+        await self._put(key, dict(record, state=None, data={} if with_data else record['data']))
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default=None):
+        record = await self._get(self._key(chat, user))
+        return copy.deepcopy(record['bucket'])
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        key = self._key(chat, user)
+        record = await self._get(key)
+        await self._put(key, dict(record, bucket=copy.deepcopy(bucket or {})))
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        key = self._key(chat, user)
+        record = await self._get(key)
+        new_bucket = copy.deepcopy(record['bucket'])
+        new_bucket.update(bucket or {}, **kwargs)
+        await self._put(key, dict(record, bucket=new_bucket))
+
+    async def sweep(self):
+        """Drop states idle for longer than the TTL from the table and the cache"""
+        cutoff = time.time() - self.ttl
+        deleted, live = await run_write(_sweep, cutoff)
+        for key in [k for k, r in self._cache.items() if r['updated_at'] and r['updated_at'] < cutoff]:
+            del self._cache[key]
+        self._stats['expired_swept'] += deleted
+        self._stats['live'] = live
+        if deleted:
+            logger.info(f"✅ Swept {deleted} expired FSM states ({live} live)")
+        return deleted
+
+    async def run_sweeper(self, interval=FSM_SWEEP_INTERVAL):
+        """Sweep expired states now and then every `interval` seconds"""
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"❌ FSM sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+    def get_metrics(self):
+        return {'cached': len(self._cache), **self._stats}
@@ -1,43 +1,77 @@
 # handlers/admin_handlers.py - Complete admin panel with smooth navigation
 
+import asyncio
 import logging
+import os
+import tempfile
+import activity_buffer
+import analytics
+import broadcast
+import cache_sync
+import callback_codec
+import callback_router
+import dashboard_cache
+import inventory
+import inventory_import
+import jobs
+import logos
+import outbound
+import outbox
+import screens
+import update_scheduler
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from config import ADMIN_IDS, ADMIN_CHANNEL_ID
-from database import (
-    get_all_users, get_all_transactions, update_transaction_status, 
-    update_balance, reward_exists, add_reward, update_reward_status,
-    get_reward, get_withdrawal, update_withdrawal_status, get_pending_withdrawals,
+from config import ADMIN_IDS, ADMIN_CHANNEL_ID, BOT_WORKERS, WORKER_INDEX
+from async_db import (
+    run_read, run_write,
+    get_pending_transactions_page, get_users_page, update_transaction_status, 
+    reward_exists, add_reward, update_reward_status,
+    get_reward, get_withdrawal, update_withdrawal_status, get_pending_withdrawals_page,
     get_transaction, get_referred_by, get_user, get_available_code
 )
-from utils import format_currency, truncate_text
+from utils import create_page_buttons, format_currency, truncate_text
+
+class AdminStates(StatesGroup):
+    import_inventory = State()
 
 def register_admin_handlers(dp: Dispatcher):
     # Admin command handlers
     dp.register_message_handler(admin_panel, commands=['admin'], user_id=ADMIN_IDS, state='*')
     dp.register_message_handler(stats_command, commands=['stats'], user_id=ADMIN_IDS)
     dp.register_message_handler(broadcast_command, commands=['broadcast'], user_id=ADMIN_IDS)
+    dp.register_message_handler(warm_logos_command, commands=['warm_logos'], user_id=ADMIN_IDS)
+    
+    # Broadcast handlers
+    callback_router.add(broadcast_confirm, callback_codec.BROADCAST_CONFIRM, user_id=ADMIN_IDS)
+    callback_router.add(broadcast_cancel, callback_codec.BROADCAST_CANCEL, user_id=ADMIN_IDS)
+    callback_router.add(broadcast_stop, callback_codec.BROADCAST_STOP, user_id=ADMIN_IDS)
     
     # Transaction handlers
-    dp.register_callback_query_handler(admin_valid, lambda c: c.data.startswith('admin_valid_'))
-    dp.register_callback_query_handler(admin_invalid, lambda c: c.data.startswith('admin_invalid_'))
-    dp.register_callback_query_handler(complete_buy_tx, lambda c: c.data.startswith('complete_tx_'))
-    dp.register_callback_query_handler(admin_invalid_payment, lambda c: c.data.startswith('admin_invalid_payment_'))
+    callback_router.add(admin_valid, callback_codec.ADMIN_VALID)
+    callback_router.add(admin_invalid, callback_codec.ADMIN_INVALID)
+    callback_router.add(complete_buy_tx, callback_codec.COMPLETE_TX)
+    callback_router.add(admin_invalid_payment, callback_codec.ADMIN_INVALID_PAYMENT)
     
     # Reward handlers
-    dp.register_callback_query_handler(reward_paid_handler, lambda c: c.data.startswith('reward_paid_'))
+    callback_router.add(reward_paid_handler, callback_codec.REWARD_PAID)
     
     # Withdrawal handlers
-    dp.register_callback_query_handler(wd_approve_handler, lambda c: c.data.startswith('wd_approve_'))
-    dp.register_callback_query_handler(wd_deny_handler, lambda c: c.data.startswith('wd_deny_'))
+    callback_router.add(wd_approve_handler, callback_codec.WD_APPROVE)
+    callback_router.add(wd_deny_handler, callback_codec.WD_DENY)
     
     # Admin panel navigation
-    dp.register_callback_query_handler(admin_transactions, lambda c: c.data == 'admin_transactions')
-    dp.register_callback_query_handler(admin_withdrawals, lambda c: c.data == 'admin_withdrawals')
-    dp.register_callback_query_handler(admin_users, lambda c: c.data == 'admin_users')
-    dp.register_callback_query_handler(admin_analytics, lambda c: c.data == 'admin_analytics')
-    dp.register_callback_query_handler(back_to_admin_panel, lambda c: c.data == 'admin_panel')
+    callback_router.add(admin_transactions, 'admin_transactions', 'admin_transactions_{after:position}')
+    callback_router.add(admin_withdrawals, 'admin_withdrawals', 'admin_withdrawals_{after:position}')
+    callback_router.add(admin_users, 'admin_users', 'admin_users_{after:position}')
+    callback_router.add(admin_analytics, 'admin_analytics', 'admin_analytics_{range_key}')
+    callback_router.add(back_to_admin_panel, 'admin_panel')
+    
+    # Inventory import
+    callback_router.add(import_inventory_start, 'admin_import', user_id=ADMIN_IDS)
+    dp.register_message_handler(import_inventory_file, content_types=['document'], user_id=ADMIN_IDS,
+                                state=AdminStates.import_inventory)
 
 async def admin_panel(message: types.Message | types.CallbackQuery, state: FSMContext = None):
     """Show admin panel with refresh functionality"""
@@ -56,57 +90,117 @@ async def admin_panel(message: types.Message | types.CallbackQuery, state: FSMCo
         await state.finish()
     
     # Get statistics
-    users = get_all_users()
-    pending_tx = get_all_transactions('pending')
-    pending_wd = get_pending_withdrawals()
-    
-    total_balance = sum(user[2] for user in users)
+    summary = await run_read(analytics.get_summary)
     
     text = f"""
 👑 ADMIN PANEL
 
 📊 Live Statistics:
-• Total Users: {len(users)}
-• Total Balance: {format_currency(total_balance)}
-• Pending Transactions: {len(pending_tx)}
-• Pending Withdrawals: {len(pending_wd)}
+• Total Users: {summary['users']}
+• Total Balance: {format_currency(summary['balance'])}
+• Pending Transactions: {summary['pending_tx']}
+• Pending Withdrawals: {summary['pending_wd']}
 
 💡 Quick Actions:
 """
     
     keyboard = InlineKeyboardMarkup(row_width=2)
     keyboard.add(
-        InlineKeyboardButton(f"📊 Transactions ({len(pending_tx)})", callback_data="admin_transactions"),
-        InlineKeyboardButton(f"💸 Withdrawals ({len(pending_wd)})", callback_data="admin_withdrawals")
+        InlineKeyboardButton(f"📊 Transactions ({summary['pending_tx']})", callback_data="admin_transactions"),
+        InlineKeyboardButton(f"💸 Withdrawals ({summary['pending_wd']})", callback_data="admin_withdrawals")
     )
     keyboard.add(
         InlineKeyboardButton("👥 Users List", callback_data="admin_users"),
         InlineKeyboardButton("📈 Analytics", callback_data="admin_analytics")
     )
     keyboard.add(
+        InlineKeyboardButton("📦 Import Inventory", callback_data="admin_import"),
         InlineKeyboardButton("🔄 Refresh", callback_data="admin_panel")
     )
     
-    try:
-        await chat_message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
-    except:
-        await chat_message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+    # Only the bot's own message can be edited - /admin gets a new one
+    if chat_message is not message:
+        try:
+            await outbound.edit_text(chat_message, text, reply_markup=keyboard, parse_mode="Markdown")
+            return
+        except:
+            pass
+    await outbound.answer(chat_message, text, reply_markup=keyboard, parse_mode="Markdown")
 
 async def back_to_admin_panel(query: types.CallbackQuery):
     """Handle back to admin panel navigation"""
     await admin_panel(query, None)
 
-async def admin_transactions(query: types.CallbackQuery):
+async def import_inventory_start(query: types.CallbackQuery):
+    """Ask for an inventory file to import"""
+    await query.answer()
+    await AdminStates.import_inventory.set()
+    
+    text = """
+📦 Import Inventory
+
+Send a CSV or TXT document:
+• CSV rows: card,code,denomination
+• TXT: one code per line, with the caption `Card Name | denomination`
+
+Codes already in stock are skipped.
+"""
+    await outbound.edit_text(query.message, text, reply_markup=screens.CANCEL, parse_mode="Markdown")
+
+async def import_inventory_file(message: types.Message, state: FSMContext):
+    """Stream an uploaded inventory file into the database"""
+    card_name = denomination = None
+    if message.caption:
+        parts = [part.strip() for part in message.caption.split('|')]
+        card_name = parts[0] or None
+        if len(parts) > 1:
+            try:
+                denomination = float(parts[1])
+            except ValueError:
+                await outbound.answer(message, "❌ Invalid denomination in caption. Use: `Card Name | 100`", parse_mode="Markdown")
+                return
+    
+    await state.finish()
+    status = await outbound.answer(message, f"⏳ Importing {message.document.file_name}...")
+    
+    fd, path = tempfile.mkstemp(suffix='.import')
+    os.close(fd)
+    try:
+        await message.document.download(destination_file=path)
+        # Runs for a while on big files - keep it off the single writer thread so normal writes aren't queued behind it
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, inventory_import.import_file, path, card_name, denomination)
+    except Exception as e:
+        logging.error(f"Inventory import failed: {e}")
+        await outbound.edit_text(status, f"❌ Import failed: {e}")
+        return
+    finally:
+        os.remove(path)
+    
+    text = f"""
+✅ Inventory Import Complete
+
+• Inserted: {result['inserted']}
+• Duplicates: {result['duplicates']}
+• Bad rows: {result['bad']}
+• Time: {result['seconds']:.1f}s
+"""
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("⬅️ Back to Admin Panel", callback_data="admin_panel"))
+    await outbound.edit_text(status, text, reply_markup=keyboard)
+
+async def admin_transactions(query: types.CallbackQuery, after: tuple = (None, None)):
     """Display pending transactions"""
     await query.answer()
     
-    pending_tx = get_all_transactions('pending')
+    direction, cursor = after
+    page = await get_pending_transactions_page(direction, cursor)
     
-    if not pending_tx:
+    if not page.rows:
         text = "📊 Pending Transactions\n\n✅ No pending transactions at the moment."
     else:
         text = "📊 Pending Transactions\n\n"
-        for i, tx in enumerate(pending_tx[:10], 1):  # Limit to 10 to avoid long messages
+        for i, tx in enumerate(page.rows, 1):
             tx_id = tx[0]
             user_id = tx[1]
             tx_type = tx[2]
@@ -122,22 +216,26 @@ async def admin_transactions(query: types.CallbackQuery):
             text += f"   [Manage in Admin Channel](#)\n\n"
     
     keyboard = InlineKeyboardMarkup()
+    nav_buttons = create_page_buttons('admin_transactions', page)
+    if nav_buttons:
+        keyboard.row(*nav_buttons)
     keyboard.add(InlineKeyboardButton("⬅️ Back to Admin Panel", callback_data="admin_panel"))
     keyboard.add(InlineKeyboardButton("🔄 Refresh", callback_data="admin_transactions"))
     
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
 
-async def admin_withdrawals(query: types.CallbackQuery):
+async def admin_withdrawals(query: types.CallbackQuery, after: tuple = (None, None)):
     """Display pending withdrawals"""
     await query.answer()
     
-    pending_wd = get_pending_withdrawals()
+    direction, cursor = after
+    page = await get_pending_withdrawals_page(direction, cursor)
     
-    if not pending_wd:
+    if not page.rows:
         text = "💸 Pending Withdrawals\n\n✅ No pending withdrawals at the moment."
     else:
         text = "💸 Pending Withdrawals\n\n"
-        for i, wd in enumerate(pending_wd[:10], 1):
+        for i, wd in enumerate(page.rows, 1):
             wd_id = wd[0]
             user_id = wd[1]
             method = wd[2]
@@ -155,147 +253,193 @@ async def admin_withdrawals(query: types.CallbackQuery):
             text += f"   [Manage in Admin Channel](#)\n\n"
     
     keyboard = InlineKeyboardMarkup()
+    nav_buttons = create_page_buttons('admin_withdrawals', page)
+    if nav_buttons:
+        keyboard.row(*nav_buttons)
     keyboard.add(InlineKeyboardButton("⬅️ Back to Admin Panel", callback_data="admin_panel"))
     keyboard.add(InlineKeyboardButton("🔄 Refresh", callback_data="admin_withdrawals"))
     
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
 
-async def admin_users(query: types.CallbackQuery):
+async def admin_users(query: types.CallbackQuery, after: tuple = (None, None)):
     """Display users list"""
     await query.answer()
     
-    users = get_all_users()
+    direction, cursor = after
+    page = await get_users_page(direction, cursor)
     
-    if not users:
+    if not page.rows:
         text = "👥 Users List\n\n❌ No users registered yet."
     else:
-        total_balance = sum(user[2] for user in users)
-        avg_balance = total_balance / len(users) if users else 0
+        summary = await run_read(analytics.get_summary)
+        total_users = summary['users']
+        total_balance = summary['balance']
+        avg_balance = total_balance / total_users if total_users else 0
         
         text = f"👥 Users List\n\n"
         text += f"**Summary:**\n"
-        text += f"• Total Users: {len(users)}\n"
+        text += f"• Total Users: {total_users}\n"
         text += f"• Total Balance: {format_currency(total_balance)}\n"
         text += f"• Average Balance: {format_currency(avg_balance)}\n\n"
         
-        text += "**Recent Users (Last 10):**\n"
-        for user in users[:10]:
+        text += "**Users (newest first):**\n"
+        for user in page.rows:
             user_id = user[0]
             username = user[1] or "No Username"
             balance = user[2]
-            joined = user[4] or "Unknown"
+            joined = (user[3] or "Unknown")[:10]
             
-            text += f"`{user_id}` | @{username} | {format_currency(balance)}\n"
-        
-        if len(users) > 10:
-            text += f"\n... and {len(users) - 10} more users"
+            text += f"`{user_id}` | @{username} | {format_currency(balance)} | {joined}\n"
     
     keyboard = InlineKeyboardMarkup()
+    nav_buttons = create_page_buttons('admin_users', page)
+    if nav_buttons:
+        keyboard.row(*nav_buttons)
     keyboard.add(InlineKeyboardButton("⬅️ Back to Admin Panel", callback_data="admin_panel"))
     keyboard.add(InlineKeyboardButton("🔄 Refresh", callback_data="admin_users"))
     
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
 
-async def admin_analytics(query: types.CallbackQuery):
-    """Display analytics overview"""
+async def admin_analytics(query: types.CallbackQuery, range_key: str = 'all'):
+    """Display analytics overview for a time range"""
     await query.answer()
     
-    users = get_all_users()
-    all_tx = get_all_transactions()
-    
-    completed_tx = [tx for tx in all_tx if tx[6] == 'completed']
-    pending_tx = [tx for tx in all_tx if tx[6] == 'pending']
-    failed_tx = [tx for tx in all_tx if tx[6] == 'failed']
+    if range_key not in analytics.RANGES:
+        range_key = 'all'
     
-    sell_tx = [tx for tx in completed_tx if tx[2] == 'sell']
-    buy_tx = [tx for tx in completed_tx if tx[2] == 'buy']
-    
-    total_balance = sum(user[2] for user in users)
-    total_sell_volume = sum(tx[5] for tx in sell_tx)
-    total_buy_volume = sum(tx[5] for tx in buy_tx)
-    total_volume = total_sell_volume + total_buy_volume
-    
-    # Calculate success rate
-    success_rate = (len(completed_tx) / len(all_tx)) * 100 if all_tx else 0
+    stats = await run_read(analytics.get_overview, range_key)
     
     text = f"""
-📈 Analytics Overview
+📈 Analytics Overview ({stats['label']})
 
 👥 **Users:**
-• Total Users: {len(users)}
-• Total Balance: {format_currency(total_balance)}
-• Avg Balance: {format_currency(total_balance / len(users) if users else 0)}
+• Total Users: {stats['users']}
+• New Users: {stats['new_users']}
+• Total Balance: {format_currency(stats['balance'])}
+• Avg Balance: {format_currency(stats['avg_balance'])}
 
 📊 **Transactions:**
-• Total: {len(all_tx)}
-• Completed: {len(completed_tx)}
-• Pending: {len(pending_tx)}
-• Failed: {len(failed_tx)}
-• Success Rate: {success_rate:.1f}%
+• Total: {stats['tx_total']}
+• Completed: {stats['tx_completed']}
+• Pending: {stats['tx_pending']}
+• Failed: {stats['tx_failed']}
+• Success Rate: {stats['success_rate']:.1f}%
 
 💰 **Volume:**
-• Sell Volume: {format_currency(total_sell_volume)}
-• Buy Volume: {format_currency(total_buy_volume)}
-• Total Volume: {format_currency(total_volume)}
+• Sell Volume: {format_currency(stats['sell_volume'])}
+• Buy Volume: {format_currency(stats['buy_volume'])}
+• Total Volume: {format_currency(stats['total_volume'])}
 
 🔄 **Breakdown:**
-• Sell Transactions: {len(sell_tx)}
-• Buy Transactions: {len(buy_tx)}
-• Avg Sell: {format_currency(total_sell_volume / len(sell_tx)) if sell_tx else '$0'}
-• Avg Buy: {format_currency(total_buy_volume / len(buy_tx)) if buy_tx else '$0'}
+• Sell Transactions: {stats['sell_count']}
+• Buy Transactions: {stats['buy_count']}
+• Avg Sell: {format_currency(stats['avg_sell'])}
+• Avg Buy: {format_currency(stats['avg_buy'])}
+
+💸 **Payouts:**
+• Withdrawals Paid: {stats['wd_paid']} ({format_currency(stats['wd_paid_amount'])})
+• Withdrawals Pending: {stats['wd_pending']} ({format_currency(stats['wd_pending_amount'])})
+• Rewards Paid: {format_currency(stats['rewards_paid_amount'])}
+• Rewards Pending: {format_currency(stats['rewards_pending_amount'])}
 """
     
-    keyboard = InlineKeyboardMarkup()
+    keyboard = InlineKeyboardMarkup(row_width=4)
+    keyboard.add(*[
+        InlineKeyboardButton(f"• {label} •" if key == range_key else label, callback_data=f"admin_analytics_{key}")
+        for key, label in analytics.RANGES.items()
+    ])
     keyboard.add(InlineKeyboardButton("⬅️ Back to Admin Panel", callback_data="admin_panel"))
     keyboard.add(InlineKeyboardButton("📊 Detailed Stats", callback_data="admin_detailed_stats"))
-    keyboard.add(InlineKeyboardButton("🔄 Refresh", callback_data="admin_analytics"))
+    keyboard.add(InlineKeyboardButton("🔄 Refresh", callback_data=f"admin_analytics_{range_key}"))
     
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
 
 async def stats_command(message: types.Message):
     """Show detailed statistics via command"""
     if message.from_user.id not in ADMIN_IDS:
         return
     
-    users = get_all_users()
-    all_tx = get_all_transactions()
-    
-    completed_tx = [tx for tx in all_tx if tx[6] == 'completed']
-    pending_tx = [tx for tx in all_tx if tx[6] == 'pending']
-    failed_tx = [tx for tx in all_tx if tx[6] == 'failed']
-    
-    sell_tx = [tx for tx in completed_tx if tx[2] == 'sell']
-    buy_tx = [tx for tx in completed_tx if tx[2] == 'buy']
+    # /stats [today|7d|30d|all]
+    range_key = message.get_args().strip().lower() or 'all'
+    if range_key not in analytics.RANGES:
+        await outbound.answer(message, f"Usage: /stats [{'|'.join(analytics.RANGES)}]")
+        return
     
-    total_balance = sum(user[2] for user in users)
-    total_sell_volume = sum(tx[5] for tx in sell_tx)
-    total_buy_volume = sum(tx[5] for tx in buy_tx)
+    stats = await run_read(analytics.get_overview, range_key)
+    
+    activity = activity_buffer.get_metrics()
+    dashboard = dashboard_cache.get_metrics()
+    stock = inventory.get_stock_levels()
+    fsm = Dispatcher.get_current().storage.get_metrics()
+    sending = outbound.get_metrics()
+    campaigns = broadcast.get_metrics()
+    job_counts = await run_read(jobs.get_counts)
+    job_stats = jobs.get_metrics()
+    outbox_counts = await run_read(outbox.get_counts)
+    notices = outbox.get_metrics()
+    routing = callback_router.get_metrics()
+    updates = update_scheduler.get_metrics()
+    if WORKER_INDEX is None:
+        process = "single process"
+    else:
+        sync = cache_sync.get_metrics()
+        process = (f"worker {WORKER_INDEX + 1} of {BOT_WORKERS} (figures below are this worker's), "
+                   f"cache sync {sync['published']} published / {sync['applied']} applied")
+    # Patterns are full of underscores, which Markdown would read as italics
+    top_routes = ', '.join(f"{pattern} ({hits})".replace('_', '\\_')
+                           for pattern, hits in list(routing['hits'].items())[:3] if hits)
     
     text = f"""
-📊 DETAILED STATISTICS
+📊 DETAILED STATISTICS ({stats['label']})
 
 👥 Users:
-• Total: {len(users)}
-• Total Balance: {format_currency(total_balance)}
-• Avg Balance: {format_currency(total_balance / len(users) if users else 0)}
+• Total: {stats['users']}
+• New: {stats['new_users']}
+• Total Balance: {format_currency(stats['balance'])}
+• Avg Balance: {format_currency(stats['avg_balance'])}
 
 📈 Transactions:
-• Total: {len(all_tx)}
-• Completed: {len(completed_tx)}
-• Pending: {len(pending_tx)}
-• Failed: {len(failed_tx)}
+• Total: {stats['tx_total']}
+• Completed: {stats['tx_completed']}
+• Pending: {stats['tx_pending']}
+• Failed: {stats['tx_failed']}
+• Success Rate: {stats['success_rate']:.1f}%
 
 💰 Volume:
-• Sell Volume: {format_currency(total_sell_volume)}
-• Buy Volume: {format_currency(total_buy_volume)}
-• Total Volume: {format_currency(total_sell_volume + total_buy_volume)}
+• Sell Volume: {format_currency(stats['sell_volume'])}
+• Buy Volume: {format_currency(stats['buy_volume'])}
+• Total Volume: {format_currency(stats['total_volume'])}
 
 🔍 Breakdown:
-• Sell Transactions: {len(sell_tx)}
-• Buy Transactions: {len(buy_tx)}
+• Sell Transactions: {stats['sell_count']}
+• Buy Transactions: {stats['buy_count']}
+• Avg Sell: {format_currency(stats['avg_sell'])}
+• Avg Buy: {format_currency(stats['avg_buy'])}
+
+💸 Payouts:
+• Withdrawals Paid: {stats['wd_paid']} ({format_currency(stats['wd_paid_amount'])})
+• Withdrawals Pending: {stats['wd_pending']} ({format_currency(stats['wd_pending_amount'])})
+• Withdrawals Denied: {stats['wd_denied']}
+• Rewards Paid: {format_currency(stats['rewards_paid_amount'])}
+• Rewards Pending: {format_currency(stats['rewards_pending_amount'])}
+
+⚙️ System:
+• Process: {process}
+• Activity Buffer: {activity['pending']} pending, {activity['flush_lag']:.1f}s flush lag
+• Last Flush: {activity['last_flush_rows']} rows in {activity['last_flush_ms']:.1f}ms
+• Dashboard Cache: {dashboard['size']} entries, {dashboard['hits']} hits / {dashboard['misses']} misses
+• Inventory: {sum(stock.values())} codes in stock ({len(stock)} card/denomination pairs)
+• FSM States: {fsm['live']} live, {fsm['cached']} cached, {fsm['expired_on_read']} expired on read, {fsm['expired_swept']} swept
+• Outbound Queue: {sending['queued']['user']} user / {sending['queued']['admin']} admin / {sending['queued']['broadcast']} broadcast, {sending['deferred']} throttled
+• Outbound Sent: {sending['sent']} sent, {sending['retried']} retried, {sending['failed']} failed
+• Broadcasts: {campaigns['running']} running
+• Jobs: {job_counts['queued']} queued, {job_stats['running']} running, {job_stats['retried']} retried, {job_counts['dead_letter']} dead-lettered
+• Outbox: {outbox_counts['pending']} pending, {outbox_counts['failed']} failed, {notices['retried']} retried, last batch {notices['last_batch']} in {notices['last_batch_ms']:.0f}ms
+• Callback Routes: {routing['routes']} routes, {routing['unmatched']} unmatched, {routing['rejected']} rejected; busiest: {top_routes or 'none yet'}
+• Update Shards: {updates['shards']} shards, {updates['queued']} queued (deepest {updates['deepest']}), {updates['failed']} failed, max wait {updates['max_wait_ms']:.0f}ms
 """
     
-    await message.answer(text, parse_mode="Markdown")
+    await outbound.answer(message, text, parse_mode="Markdown")
 
 async def broadcast_command(message: types.Message):
     """Broadcast message to all users"""
@@ -305,43 +449,80 @@ async def broadcast_command(message: types.Message):
     # Extract message to broadcast
     parts = message.text.split(maxsplit=1)
     if len(parts) < 2:
-        await message.answer("❌ Usage: /broadcast <message>")
+        await outbound.answer(message, "❌ Usage: /broadcast <message>")
         return
     
     broadcast_text = parts[1]
-    users = get_all_users()
+    broadcast_id, recipients = await run_write(broadcast.create, message.from_user.id, broadcast_text)
     
-    # Confirmation keyboard
+    # Confirmation keyboard - the campaign is stored, so callbacks only carry its id
     keyboard = InlineKeyboardMarkup()
     keyboard.add(
-        InlineKeyboardButton("✅ Confirm Broadcast", callback_data=f"confirm_broadcast:{len(users)}:{broadcast_text}"),
-        InlineKeyboardButton("❌ Cancel", callback_data="admin_panel")
+        InlineKeyboardButton("✅ Confirm Broadcast", callback_data=callback_codec.BROADCAST_CONFIRM.encode(broadcast_id)),
+        InlineKeyboardButton("❌ Cancel", callback_data=callback_codec.BROADCAST_CANCEL.encode(broadcast_id))
     )
     
-    await message.answer(
+    await outbound.answer(
+        message,
         f"📢 Broadcast Confirmation\n\n"
         f"Message: {broadcast_text}\n\n"
-        f"Will be sent to: {len(users)} users\n\n"
-        f"**Are you sure?**",
-        reply_markup=keyboard,
-        parse_mode="Markdown"
+        f"Will be sent to: {recipients} users\n\n"
+        f"Are you sure?",
+        reply_markup=keyboard
     )
 
+async def broadcast_confirm(query: types.CallbackQuery, broadcast_id: int):
+    """Start sending a confirmed broadcast"""
+    
+    if not await run_write(broadcast.mark_started, broadcast_id, query.message.chat.id, query.message.message_id):
+        await query.answer("⚠️ This broadcast was already started or cancelled")
+        return
+    
+    await query.answer("📢 Broadcast started!")
+    campaign = await run_read(broadcast.get, broadcast_id)
+    text, keyboard = broadcast.format_progress(campaign)
+    await outbound.edit_text(query.message, text, reply_markup=keyboard)
+    broadcast.start(broadcast_id)
+
+async def broadcast_cancel(query: types.CallbackQuery, broadcast_id: int):
+    """Discard a broadcast before it starts"""
+    await run_write(broadcast.mark_finished, broadcast_id, 'cancelled')
+    await admin_panel(query, None)
+
+async def broadcast_stop(query: types.CallbackQuery, broadcast_id: int):
+    """Stop a running broadcast"""
+    await query.answer("⏹ Stopping broadcast...")
+    await broadcast.stop(broadcast_id)
+
+async def warm_logos_command(message: types.Message):
+    """Upload every gift card logo once so they are sent by file_id; `/warm_logos force` re-uploads all"""
+    force = message.get_args().strip().lower() == 'force'
+    status = await outbound.answer(message, "⏳ Uploading gift card logos...")
+    result = await logos.warm(message.chat.id, force=force)
+    
+    text = f"""
+🖼 Logo Cache Warmed
+
+• Uploaded: {result['uploaded']}
+• Already cached: {result['cached']}
+• Failed: {len(result['failed'])}
+"""
+    if result['failed']:
+        text += "\n" + "\n".join(f"  - {name}" for name in result['failed'])
+    await outbound.edit_text(status, text)
+
 # Transaction approval handlers
-async def admin_valid(query: types.CallbackQuery):
+async def admin_valid(query: types.CallbackQuery, tx_id: str):
     """Approve sell transaction"""
-    from main import bot
-    
     if query.from_user.id not in ADMIN_IDS:
         return
     
     await query.answer("✅ Transaction approved!")
     
-    tx_id = query.data.split('_')[-1]
-    tx = get_transaction(tx_id)
+    tx = await get_transaction(tx_id)
     
     if not tx:
-        await query.message.edit_text(query.message.text + "\n\n❌ Transaction not found")
+        await outbound.edit_text(query.message, query.message.text + "\n\n❌ Transaction not found")
         return
     
     user_id = tx[1]
@@ -349,24 +530,23 @@ async def admin_valid(query: types.CallbackQuery):
     calculated = tx[5]
     
     if tx_type == 'sell':
-        # Update transaction
-        update_transaction_status(tx_id, 'completed')
-        
-        # Add balance
-        update_balance(user_id, calculated, add=True)
-        
-        # Notify user
-        await bot.send_message(
-            user_id,
-            f"✅ Sale Approved!\n\n"
-            f"Transaction ID: `{tx_id}`\n"
-            f"Amount: {format_currency(calculated)}\n\n"
-            f"Your balance has been credited!",
+        # Status, balance and the user's notification are committed together
+        settled = await update_transaction_status(tx_id, 'completed', credit=calculated, notify=dict(
+            chat_id=user_id,
+            text=f"✅ Sale Approved!\n\n"
+                 f"Transaction ID: `{tx_id}`\n"
+                 f"Amount: {format_currency(calculated)}\n\n"
+                 f"Your balance has been credited!",
             parse_mode="Markdown"
-        )
+        ))
+        if not settled:
+            # Already settled (e.g. a double tap) - the first tap updated the message
+            return
+        outbox.wake()
         
         # Update admin message
-        await query.message.edit_text(
+        await outbound.edit_text(
+            query.message,
             query.message.text + "\n\n✅ APPROVED - Balance updated",
             parse_mode="Markdown"
         )
@@ -374,84 +554,84 @@ async def admin_valid(query: types.CallbackQuery):
         # Trigger referral reward
         await trigger_referral_reward(tx_id, query.message)
 
-async def admin_invalid(query: types.CallbackQuery):
+# ADMIN_INVALID issue -> reason the seller is given
+REJECT_REASONS = {'used': "Code already used", 'code': "Invalid code", 'other': "Invalid card"}
+
+async def admin_invalid(query: types.CallbackQuery, tx_id: str, issue: str):
     """Reject transaction"""
-    from main import bot
-    
     if query.from_user.id not in ADMIN_IDS:
         return
     
     await query.answer("❌ Transaction rejected!")
     
-    tx_id = query.data.split('_')[-1]
-    tx = get_transaction(tx_id)
+    tx = await get_transaction(tx_id)
     
     if not tx:
-        await query.message.edit_text(query.message.text + "\n\n❌ Transaction not found")
+        await outbound.edit_text(query.message, query.message.text + "\n\n❌ Transaction not found")
         return
     
-    update_transaction_status(tx_id, 'failed', 'Invalid card')
-    
-    await bot.send_message(
-        tx[1],
-        f"❌ Sale Rejected\n\nTransaction ID: `{tx_id}`\nReason: Invalid card\n\nPlease try again with a valid card.",
+    reason = REJECT_REASONS.get(issue, "Invalid card")
+    settled = await update_transaction_status(tx_id, 'failed', reason, notify=dict(
+        chat_id=tx[1],
+        text=f"❌ Sale Rejected\n\nTransaction ID: `{tx_id}`\nReason: {reason}\n\nPlease try again with a valid card.",
         parse_mode="Markdown"
-    )
+    ))
+    if not settled:
+        return
+    outbox.wake()
     
-    await query.message.edit_text(
-        query.message.text + "\n\n❌ REJECTED - User notified",
+    await outbound.edit_text(
+        query.message,
+        query.message.text + f"\n\n❌ REJECTED ({reason}) - User notified",
         parse_mode="Markdown"
     )
 
-async def admin_invalid_payment(query: types.CallbackQuery):
+async def admin_invalid_payment(query: types.CallbackQuery, tx_id: str):
     """Handle invalid payment for buy transactions"""
-    from main import bot
-    
     if query.from_user.id not in ADMIN_IDS:
         return
     
     await query.answer("❌ Payment marked as invalid!")
     
-    tx_id = query.data.split('_')[-1]
-    tx = get_transaction(tx_id)
+    tx = await get_transaction(tx_id)
     
     if not tx:
-        await query.message.edit_text(query.message.text + "\n\n❌ Transaction not found")
+        await outbound.edit_text(query.message, query.message.text + "\n\n❌ Transaction not found")
         return
     
-    # Update transaction status
-    update_transaction_status(tx_id, 'failed', 'Invalid payment')
-    
-    # Notify user
-    await bot.send_message(
-        tx[1],
-        f"❌ Payment Verification Failed\n\n"
-        f"Transaction ID: `{tx_id}`\n"
-        f"Reason: Invalid payment or transaction hash\n\n"
-        f"Please check your payment details and try again. Contact support if you believe this is an error: @SupportHandle",
+    # Update transaction status and queue the user's notification
+    settled = await update_transaction_status(tx_id, 'failed', 'Invalid payment', notify=dict(
+        chat_id=tx[1],
+        text=f"❌ Payment Verification Failed\n\n"
+             f"Transaction ID: `{tx_id}`\n"
+             f"Reason: Invalid payment or transaction hash\n\n"
+             f"Please check your payment details and try again. Contact support if you believe this is an error: @SupportHandle",
         parse_mode="Markdown"
-    )
+    ))
+    if not settled:
+        return
+    outbox.wake()
     
     # Update admin message
-    await query.message.edit_text(
+    await outbound.edit_text(
+        query.message,
         query.message.text + "\n\n❌ PAYMENT INVALID - User notified",
         parse_mode="Markdown"
     )
 
-async def complete_buy_tx(query: types.CallbackQuery):
+async def complete_buy_tx(query: types.CallbackQuery, tx_id: str):
     """Complete buy transaction by sending code"""
-    from main import bot
-    
     if query.from_user.id not in ADMIN_IDS:
         return
     
     await query.answer("✅ Purchase completed!")
     
-    tx_id = query.data.split('_')[-1]
-    tx = get_transaction(tx_id)
+    tx = await get_transaction(tx_id)
     
     if not tx or tx[2] != 'buy':
-        await query.message.edit_text(query.message.text + "\n\n❌ Invalid buy transaction")
+        await outbound.edit_text(query.message, query.message.text + "\n\n❌ Invalid buy transaction")
+        return
+    if tx[6] != 'pending':
         return
     
     user_id = tx[1]
@@ -459,26 +639,29 @@ async def complete_buy_tx(query: types.CallbackQuery):
     denomination = tx[4]
     
     # Get code from inventory
-    code = get_available_code(card_name, denomination)
+    code = await get_available_code(card_name, denomination)
     
     if code:
-        # Update transaction
-        update_transaction_status(tx_id, 'completed')
-        
-        # Send code to user
-        await bot.send_message(
-            user_id,
-            f"✅ Purchase Complete!\n\n"
-            f"Transaction ID: `{tx_id}`\n"
-            f"Card: {card_name}\n"
-            f"Denomination: ${denomination:.0f}\n\n"
-            f"Your Gift Card Code:\n`{code}`\n\n"
-            f"Enjoy your purchase! 🎉",
+        # Complete the transaction and queue the code for the user together
+        settled = await update_transaction_status(tx_id, 'completed', notify=dict(
+            chat_id=user_id,
+            text=f"✅ Purchase Complete!\n\n"
+                 f"Transaction ID: `{tx_id}`\n"
+                 f"Card: {card_name}\n"
+                 f"Denomination: ${denomination:.0f}\n\n"
+                 f"Your Gift Card Code:\n`{code}`\n\n"
+                 f"Enjoy your purchase! 🎉",
             parse_mode="Markdown"
-        )
+        ))
+        if not settled:
+            # Another tap settled it in the meantime - this code was never sent
+            await run_write(inventory.release_code, card_name, code, denomination)
+            return
+        outbox.wake()
         
         # Update admin message
-        await query.message.edit_text(
+        await outbound.edit_text(
+            query.message,
             query.message.text + "\n\n✅ DELIVERED - Code sent to user",
             parse_mode="Markdown"
         )
@@ -487,40 +670,40 @@ async def complete_buy_tx(query: types.CallbackQuery):
         await trigger_referral_reward(tx_id, query.message)
     else:
         # Out of stock
-        update_transaction_status(tx_id, 'failed', 'Out of stock')
-        
-        await bot.send_message(
-            user_id,
-            f"❌ Purchase Failed\n\n"
-            f"Transaction ID: `{tx_id}`\n"
-            f"Reason: Out of stock\n\n"
-            f"Refund will be processed shortly. Please contact support: @SupportHandle",
+        settled = await update_transaction_status(tx_id, 'failed', 'Out of stock', notify=dict(
+            chat_id=user_id,
+            text=f"❌ Purchase Failed\n\n"
+                 f"Transaction ID: `{tx_id}`\n"
+                 f"Reason: Out of stock\n\n"
+                 f"Refund will be processed shortly. Please contact support: @SupportHandle",
             parse_mode="Markdown"
-        )
+        ))
+        if not settled:
+            return
+        outbox.wake()
         
-        await query.message.edit_text(
+        await outbound.edit_text(
+            query.message,
             query.message.text + "\n\n❌ OUT OF STOCK - Refund needed",
             parse_mode="Markdown"
         )
 
 async def trigger_referral_reward(tx_id, admin_message):
     """Create referral reward if applicable"""
-    from main import bot
-    
-    tx = get_transaction(tx_id)
+    tx = await get_transaction(tx_id)
     if not tx:
         return
     
     user_id = tx[1]
-    referred_by = get_referred_by(user_id)
+    referred_by = await get_referred_by(user_id)
     
-    if referred_by and not reward_exists(referred_by, user_id):
+    if referred_by and not await reward_exists(referred_by, user_id):
         # Create reward
-        reward_id = add_reward(referred_by, user_id, tx_id, 5.0)
+        reward_id = await add_reward(referred_by, user_id, tx_id, 5.0)
         
         # Get user info
-        referrer = get_user(referred_by)
-        referred = get_user(user_id)
+        referrer = await get_user(referred_by)
+        referred = await get_user(user_id)
         
         # Notify admin
         reward_text = f"""
@@ -536,133 +719,122 @@ Status: ⏳ Pending Payment
 """
         
         keyboard = InlineKeyboardMarkup()
-        keyboard.add(InlineKeyboardButton("✅ Mark as Paid", callback_data=f"reward_paid_{reward_id}"))
+        keyboard.add(InlineKeyboardButton("✅ Mark as Paid", callback_data=callback_codec.REWARD_PAID.encode(reward_id)))
         
         try:
-            await bot.send_message(
+            await outbound.send_message(
                 ADMIN_CHANNEL_ID,
                 reward_text,
                 reply_markup=keyboard,
                 parse_mode="Markdown"
             )
-        except:
-            pass
+        except Exception as e:
+            # The reward is saved; it just has no "Mark as Paid" post to settle it from
+            logging.error(f"Referral reward {reward_id} admin post failed: {e}")
 
-async def reward_paid_handler(query: types.CallbackQuery):
+async def reward_paid_handler(query: types.CallbackQuery, reward_id: int):
     """Mark referral reward as paid"""
-    from main import bot
-    
     if query.from_user.id not in ADMIN_IDS:
         return
     
     await query.answer("✅ Reward marked as paid!")
     
-    reward_id = int(query.data.split('_')[-1])
-    reward = get_reward(reward_id)
+    reward = await get_reward(reward_id)
     
     if not reward:
-        await query.message.edit_text(query.message.text + "\n\n❌ Reward not found")
+        await outbound.edit_text(query.message, query.message.text + "\n\n❌ Reward not found")
         return
     
     referrer_id = reward[1]
     amount = reward[3]
     
-    # Update reward status
-    update_reward_status(reward_id, 'paid')
-    
-    # Add to referrer balance
-    update_balance(referrer_id, amount, add=True)
-    
-    # Notify referrer
-    await bot.send_message(
-        referrer_id,
-        f"🎉 Referral Reward Paid!\n\n"
-        f"You've earned {format_currency(amount)} for referring a friend!\n\n"
-        f"Your balance has been credited. Keep sharing and earning!",
+    # Status, referrer balance and notification are committed together
+    settled = await update_reward_status(reward_id, 'paid', credit=amount, notify=dict(
+        chat_id=referrer_id,
+        text=f"🎉 Referral Reward Paid!\n\n"
+             f"You've earned {format_currency(amount)} for referring a friend!\n\n"
+             f"Your balance has been credited. Keep sharing and earning!",
         parse_mode="Markdown"
-    )
+    ))
+    if not settled:
+        return
+    outbox.wake()
     
     # Update admin message
-    await query.message.edit_text(
+    await outbound.edit_text(
+        query.message,
         query.message.text + "\n\n✅ PAID - Balance updated",
         parse_mode="Markdown"
     )
 
-async def wd_approve_handler(query: types.CallbackQuery):
+async def wd_approve_handler(query: types.CallbackQuery, wd_id: str):
     """Approve withdrawal"""
-    from main import bot
-    
     if query.from_user.id not in ADMIN_IDS:
         return
     
     await query.answer("✅ Withdrawal approved!")
     
-    wd_id = query.data.split('_')[-1]
-    wd = get_withdrawal(wd_id)
+    wd = await get_withdrawal(wd_id)
     
     if not wd:
-        await query.message.edit_text(query.message.text + "\n\n❌ Withdrawal not found")
+        await outbound.edit_text(query.message, query.message.text + "\n\n❌ Withdrawal not found")
         return
     
     user_id = wd[1]
     net_amount = wd[5]
     
-    # Update status
-    update_withdrawal_status(wd_id, 'paid')
-    
-    # Notify user
-    await bot.send_message(
-        user_id,
-        f"✅ Withdrawal Approved!\n\n"
-        f"Withdrawal ID: `{wd_id}`\n"
-        f"Amount: {format_currency(net_amount)}\n\n"
-        f"Your funds have been processed and should arrive within 24-48 hours.",
+    # Update status and queue the user's notification
+    settled = await update_withdrawal_status(wd_id, 'paid', notify=dict(
+        chat_id=user_id,
+        text=f"✅ Withdrawal Approved!\n\n"
+             f"Withdrawal ID: `{wd_id}`\n"
+             f"Amount: {format_currency(net_amount)}\n\n"
+             f"Your funds have been processed and should arrive within 24-48 hours.",
         parse_mode="Markdown"
-    )
+    ))
+    if not settled:
+        return
+    outbox.wake()
     
     # Update admin message
-    await query.message.edit_text(
+    await outbound.edit_text(
+        query.message,
         query.message.text + "\n\n✅ APPROVED - Funds processed",
         parse_mode="Markdown"
     )
 
-async def wd_deny_handler(query: types.CallbackQuery):
+async def wd_deny_handler(query: types.CallbackQuery, wd_id: str):
     """Deny withdrawal and refund"""
-    from main import bot
-    
     if query.from_user.id not in ADMIN_IDS:
         return
     
     await query.answer("❌ Withdrawal denied!")
     
-    wd_id = query.data.split('_')[-1]
-    wd = get_withdrawal(wd_id)
+    wd = await get_withdrawal(wd_id)
     
     if not wd:
-        await query.message.edit_text(query.message.text + "\n\n❌ Withdrawal not found")
+        await outbound.edit_text(query.message, query.message.text + "\n\n❌ Withdrawal not found")
         return
     
     user_id = wd[1]
     amount = wd[3]
     
-    # Update status
-    update_withdrawal_status(wd_id, 'denied', 'Denied by admin')
-    
-    # Refund balance
-    update_balance(user_id, amount, add=True)
-    
-    # Notify user
-    await bot.send_message(
-        user_id,
-        f"❌ Withdrawal Denied\n\n"
-        f"Withdrawal ID: `{wd_id}`\n"
-        f"Amount: {format_currency(amount)}\n\n"
-        f"Your funds have been refunded to your balance. Please contact support for more information: @SupportHandle",
+    # Status, refund and notification are committed together
+    settled = await update_withdrawal_status(wd_id, 'denied', 'Denied by admin', credit=amount, notify=dict(
+        chat_id=user_id,
+        text=f"❌ Withdrawal Denied\n\n"
+             f"Withdrawal ID: `{wd_id}`\n"
+             f"Amount: {format_currency(amount)}\n\n"
+             f"Your funds have been refunded to your balance. Please contact support for more information: @SupportHandle",
         parse_mode="Markdown"
-    )
+    ))
+    if not settled:
+        return
+    outbox.wake()
     
     # Update admin message
-    await query.message.edit_text(
+    await outbound.edit_text(
+        query.message,
         query.message.text + "\n\n❌ DENIED - Amount refunded",
         parse_mode="Markdown"
     )
\ No newline at end of file
@@ -1,15 +1,20 @@
 # handlers/buy_handlers.py - Enhanced buy flow with smooth navigation
 
 import logging
+import callback_codec
+import callback_router
+import screens
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import ADMIN_CHANNEL_ID, PAYMENT_WALLETS
-from database import get_random_rate, get_gift_card_logo, add_transaction, update_last_activity
-from utils import paginate_cards, format_rate_table, create_cancel_button, create_confirmation_keyboard, format_currency
+from async_db import get_random_rate, add_transaction, update_last_activity
+from utils import format_rate_table, format_currency
+import jobs
+import logos
+import outbound
 import uuid
-import asyncio
 
 class BuyStates(StatesGroup):
     select_card = State()
@@ -19,62 +24,34 @@ class BuyStates(StatesGroup):
     confirm = State()
 
 def register_buy_handlers(dp: Dispatcher):
-    dp.register_callback_query_handler(buy_start, lambda c: c.data == 'buy_start', state='*')
-    dp.register_callback_query_handler(select_card_page, lambda c: c.data.startswith('buy_page_'), state=BuyStates.select_card)
-    dp.register_callback_query_handler(select_card, lambda c: c.data.startswith('buy_') and not c.data.startswith('buy_page_'), state=BuyStates.select_card)
+    callback_router.add(buy_start, 'buy_start', state='*')
+    callback_router.add(select_card_page, callback_codec.BUY_PAGE, state=BuyStates.select_card)
+    callback_router.add(select_card, callback_codec.BUY_CARD, state=BuyStates.select_card)
     dp.register_message_handler(enter_amount, state=BuyStates.enter_amount)
-    dp.register_callback_query_handler(select_payment_method, lambda c: c.data.startswith('pay_'), state=BuyStates.select_payment_method)
+    callback_router.add(select_payment_method, 'pay_{payment_method}', state=BuyStates.select_payment_method)
     dp.register_message_handler(submit_payment, state=BuyStates.payment)
-    dp.register_callback_query_handler(confirm_buy, lambda c: c.data == 'confirm_buy', state=BuyStates.confirm)
+    callback_router.add(confirm_buy, 'confirm_buy', state=BuyStates.confirm)
 
 async def buy_start(query: types.CallbackQuery, state: FSMContext):
     """Start buy flow - show gift card selection"""
     await query.answer()
-    update_last_activity(query.from_user.id)
+    await update_last_activity(query.from_user.id)
     
-    text = """
-💳 Buy Gift Card
-
-Step 1/4: Select Gift Card
-
-Choose the gift card you want to buy from the list below.
-
-💡 All cards are US-based and delivered instantly!
-"""
-    
-    keyboard = paginate_cards(page=0, callback_prefix="buy")
-    
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, screens.BUY_PICKER_TEXT, reply_markup=screens.card_page("buy", 0), parse_mode="Markdown")
     await BuyStates.select_card.set()
 
-async def select_card_page(query: types.CallbackQuery, state: FSMContext):
+async def select_card_page(query: types.CallbackQuery, state: FSMContext, page: int):
     """Handle pagination for card selection"""
     await query.answer()
-    page = int(query.data.split('_')[-1])
     
-    text = """
-💳 Buy Gift Card
-
-Step 1/4: Select Gift Card
+    await outbound.edit_text(query.message, screens.BUY_PICKER_TEXT, reply_markup=screens.card_page("buy", page), parse_mode="Markdown")
 
-Choose the gift card you want to buy from the list below.
-
-💡 All cards are US-based and delivered instantly!
-"""
-    
-    keyboard = paginate_cards(page=page, callback_prefix="buy")
-    
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
-
-async def select_card(query: types.CallbackQuery, state: FSMContext):
+async def select_card(query: types.CallbackQuery, state: FSMContext, card_name: str):
     """Handle gift card selection and show rates"""
     await query.answer()
     
-    # Extract card name (remove "buy_" prefix)
-    card_name = query.data.replace('buy_', '')
-    
     # Get rate for this card
-    rate = get_random_rate(card_name, is_buy=True)
+    rate = await get_random_rate(card_name, is_buy=True)
     
     # Save to state
     await state.update_data(gift_card=card_name, rate=rate)
@@ -96,36 +73,30 @@ Card: {card_name}
 Enter the denomination you want to buy (e.g., 100):
 """
     
-    # Get logo
-    logo = get_gift_card_logo(card_name)
-    
-    keyboard = create_cancel_button(with_back=True)
+    keyboard = screens.CANCEL_WITH_BACK
     
     # Send with or without logo
     try:
         await query.message.delete()
-        if logo:
-            await query.message.answer_photo(logo, caption=text, reply_markup=keyboard, parse_mode="Markdown")
-        else:
-            await query.message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+        await logos.answer_with_logo(query.message, card_name, text, reply_markup=keyboard, parse_mode="Markdown")
     except:
-        await query.message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+        await outbound.answer(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
     
     await BuyStates.enter_amount.set()
 
 async def enter_amount(message: types.Message, state: FSMContext):
     """Handle amount input"""
-    update_last_activity(message.from_user.id)
+    await update_last_activity(message.from_user.id)
     
     try:
         amount = float(message.text)
         
         if amount < 10:
-            await message.answer("⚠️ Minimum amount is $10. Please enter a valid amount:", reply_markup=create_cancel_button())
+            await outbound.answer(message, "⚠️ Minimum amount is $10. Please enter a valid amount:", reply_markup=screens.CANCEL)
             return
         
         if amount > 10000:
-            await message.answer("⚠️ Maximum amount is $10,000. Please enter a valid amount:", reply_markup=create_cancel_button())
+            await outbound.answer(message, "⚠️ Maximum amount is $10,000. Please enter a valid amount:", reply_markup=screens.CANCEL)
             return
         
         # Get data from state
@@ -161,17 +132,16 @@ Rate: +{rate:.1f}%
             ))
         keyboard.add(InlineKeyboardButton("❌ Cancel", callback_data="cancel_action"))
         
-        await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+        await outbound.answer(message, text, reply_markup=keyboard, parse_mode="Markdown")
         await BuyStates.select_payment_method.set()
         
     except ValueError:
-        await message.answer("❌ Invalid amount. Please enter numbers only (e.g., 100):", reply_markup=create_cancel_button())
+        await outbound.answer(message, "❌ Invalid amount. Please enter numbers only (e.g., 100):", reply_markup=screens.CANCEL)
 
-async def select_payment_method(query: types.CallbackQuery, state: FSMContext):
+async def select_payment_method(query: types.CallbackQuery, state: FSMContext, payment_method: str):
     """Handle payment method selection"""
     await query.answer()
     
-    payment_method = query.data.replace('pay_', '')
     wallet_info = PAYMENT_WALLETS.get(payment_method)
     
     if not wallet_info:
@@ -207,17 +177,17 @@ Send exactly {format_currency(data['calculated'])} to:
 After payment, send your transaction hash/ID:
 """
     
-    await query.message.edit_text(text, reply_markup=create_cancel_button(), parse_mode="Markdown")
+    await outbound.edit_text(query.message, text, reply_markup=screens.CANCEL, parse_mode="Markdown")
     await BuyStates.payment.set()
 
 async def submit_payment(message: types.Message, state: FSMContext):
     """Handle payment hash submission"""
-    update_last_activity(message.from_user.id)
+    await update_last_activity(message.from_user.id)
     
     tx_hash = message.text.strip()
     
     if len(tx_hash) < 20:
-        await message.answer("⚠️ Invalid transaction hash. Please send the complete hash from your wallet:", reply_markup=create_cancel_button())
+        await outbound.answer(message, "⚠️ Invalid transaction hash. Please send the complete hash from your wallet:", reply_markup=screens.CANCEL)
         return
     
     # Save hash to state
@@ -247,24 +217,14 @@ TX Hash: `{tx_hash[:20]}...`
 Card will be delivered after verification!
 """
     
-    keyboard = create_confirmation_keyboard("confirm_buy", "cancel_action")
+    keyboard = screens.CONFIRM_BUY
     
-    await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.answer(message, text, reply_markup=keyboard, parse_mode="Markdown")
     await BuyStates.confirm.set()
 
 async def confirm_buy(query: types.CallbackQuery, state: FSMContext):
-    """Final confirmation and submission to admin"""
+    """Final confirmation - save the purchase; the admin post is sent by a background job"""
     await query.answer("📤 Processing your purchase...")
-    from main import bot
-    
-    # Show processing message
-    processing_msg = await query.message.edit_text(
-        "⏳ Processing your purchase...\n\nVerifying payment on blockchain...",
-        parse_mode="Markdown"
-    )
-    
-    # Simulate processing
-    await asyncio.sleep(2)
     
     # Generate transaction ID
     tx_id = f"TX{uuid.uuid4().hex[:8].upper()}"
@@ -274,55 +234,27 @@ async def confirm_buy(query: types.CallbackQuery, state: FSMContext):
     user_id = query.from_user.id
     username = query.from_user.username
     
-    # Save transaction to database
-    add_transaction(
+    # Save transaction to database, queueing the admin post in the same write
+    await add_transaction(
         tx_id, 
         user_id, 
         'buy', 
         data['gift_card'], 
         data['denomination'], 
-        data['calculated']
+        data['calculated'],
+        job=('buy_admin_post', {
+            'tx_id': tx_id,
+            'user_id': user_id,
+            'username': username,
+            'gift_card': data['gift_card'],
+            'denomination': data['denomination'],
+            'calculated': data['calculated'],
+            'rate': data['rate'],
+            'wallet_info': data['wallet_info'],
+            'tx_hash': data['tx_hash'],
+        })
     )
-    
-    # Prepare admin notification
-    admin_text = f"""
-💳 NEW PURCHASE REQUEST
-
-Transaction ID: `{tx_id}`
-User: @{username or 'Unknown'} (ID: {user_id})
-
-Gift Card: {data['gift_card']}
-Denomination: ${data['denomination']:.0f}
-Amount Paid: {format_currency(data['calculated'])}
-Rate: +{data['rate']:.1f}%
-
-Payment Method: {data['wallet_info']['name']}
-Network: {data['wallet_info']['network']}
-Wallet: `{data['wallet_info']['address']}`
-
-Payment Hash:
-`{data['tx_hash']}`
-
-Status: ⏳ Awaiting Verification
-"""
-    
-    # Admin action buttons
-    admin_keyboard = InlineKeyboardMarkup(row_width=2)
-    admin_keyboard.add(
-        InlineKeyboardButton("✅ Verify & Deliver", callback_data=f"complete_tx_{tx_id}"),
-        InlineKeyboardButton("❌ Invalid Payment", callback_data=f"admin_invalid_payment_{tx_id}")
-    )
-    
-    # Send to admin channel
-    try:
-        await bot.send_message(
-            ADMIN_CHANNEL_ID,
-            admin_text,
-            reply_markup=admin_keyboard,
-            parse_mode="Markdown"
-        )
-    except Exception as e:
-        print(f"Error sending to admin: {e}")
+    jobs.wake()
     
     # Notify user
     success_text = f"""
@@ -341,12 +273,49 @@ You'll receive your gift card code once payment is confirmed!
 Need help? Contact @SupportHandle
 """
     
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("🏠 Back to Menu", callback_data="main_menu"))
-    keyboard.add(InlineKeyboardButton("📜 View Transactions", callback_data="transactions"))
-    
-    await processing_msg.edit_text(success_text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, success_text, reply_markup=screens.TRADE_DONE, parse_mode="Markdown")
     
     # Clear state
     await state.finish()
-    update_last_activity(user_id)
\ No newline at end of file
+    await update_last_activity(user_id)
+
+@jobs.handles('buy_admin_post')
+async def post_purchase_to_admin(purchase):
+    """Job: post a submitted purchase to the admin channel for payment verification"""
+    tx_id = purchase['tx_id']
+    wallet_info = purchase['wallet_info']
+    admin_text = f"""
+💳 NEW PURCHASE REQUEST
+
+Transaction ID: `{tx_id}`
+User: @{purchase['username'] or 'Unknown'} (ID: {purchase['user_id']})
+
+Gift Card: {purchase['gift_card']}
+Denomination: ${purchase['denomination']:.0f}
+Amount Paid: {format_currency(purchase['calculated'])}
+Rate: +{purchase['rate']:.1f}%
+
+Payment Method: {wallet_info['name']}
+Network: {wallet_info['network']}
+Wallet: `{wallet_info['address']}`
+
+Payment Hash:
+`{purchase['tx_hash']}`
+
+Status: ⏳ Awaiting Verification
+"""
+    
+    # Admin action buttons
+    admin_keyboard = InlineKeyboardMarkup(row_width=2)
+    admin_keyboard.add(
+        InlineKeyboardButton("✅ Verify & Deliver", callback_data=callback_codec.COMPLETE_TX.encode(tx_id)),
+        InlineKeyboardButton("❌ Invalid Payment", callback_data=callback_codec.ADMIN_INVALID_PAYMENT.encode(tx_id))
+    )
+    
+    # Send to admin channel - awaited, so a failed post is retried
+    await outbound.send_message(
+        ADMIN_CHANNEL_ID,
+        admin_text,
+        reply_markup=admin_keyboard,
+        parse_mode="Markdown"
+    )
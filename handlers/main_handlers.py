@@ -1,23 +1,27 @@
 # handlers/main_handlers.py - Enhanced main menu with dashboard
 
+import callback_router
+import dashboard_cache
+import outbound
+import screens
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from database import (add_user, get_user_by_referral_code, get_referral_code, 
-                     get_user_stats, get_user_transactions, get_trending_cards,
+from async_db import (add_user, get_user_by_referral_code, get_referral_code, 
+                     get_user_stats, get_user_transactions_page, get_trending_cards,
                      update_last_activity)
 from config import BOT_USERNAME
-from utils import create_back_button, format_currency, format_transaction_status
+from utils import create_page_buttons, format_currency, format_transaction_status
 
 def register_main_handlers(dp: Dispatcher):
     dp.register_message_handler(start_handler, commands=['start'], state='*')
-    dp.register_callback_query_handler(show_main_menu, lambda c: c.data == 'main_menu', state='*')
-    dp.register_callback_query_handler(cancel_handler, lambda c: c.data == 'cancel_action', state='*')
-    dp.register_callback_query_handler(rates_handler, lambda c: c.data == 'rates')
-    dp.register_callback_query_handler(transactions_handler, lambda c: c.data == 'transactions')
-    dp.register_callback_query_handler(help_handler, lambda c: c.data == 'help')
-    dp.register_callback_query_handler(refer_earn_handler, lambda c: c.data == 'refer_earn')
-    dp.register_callback_query_handler(balance_withdraw_handler, lambda c: c.data == 'balance_withdraw')
+    callback_router.add(show_main_menu, 'main_menu', state='*')
+    callback_router.add(cancel_handler, 'cancel_action', state='*')
+    callback_router.add(rates_handler, 'rates')
+    callback_router.add(transactions_handler, 'transactions', 'transactions_{after:position}')
+    callback_router.add(help_handler, 'help')
+    callback_router.add(refer_earn_handler, 'refer_earn')
+    callback_router.add(balance_withdraw_handler, 'balance_withdraw')
 
 async def start_handler(message: types.Message, state: FSMContext):
     """Handle /start command with referral support"""
@@ -30,16 +34,17 @@ async def start_handler(message: types.Message, state: FSMContext):
     
     referred_by = None
     if payload:
-        referrer = get_user_by_referral_code(payload)
+        referrer = await get_user_by_referral_code(payload)
         if referrer:
             referred_by = referrer[0]
-            await message.answer(
+            await outbound.answer(
+                message,
                 f"🎉 Welcome! You were referred by @{referrer[1] or 'User'}!\n"
                 f"Complete your first transaction and you both earn $5! 💰"
             )
     
-    add_user(message.from_user.id, message.from_user.username, referred_by)
-    update_last_activity(message.from_user.id)
+    await add_user(message.from_user.id, message.from_user.username, referred_by)
+    await update_last_activity(message.from_user.id)
     await show_main_menu(message, state)
 
 async def show_main_menu(message: types.Message | types.CallbackQuery, state: FSMContext = None):
@@ -55,13 +60,30 @@ async def show_main_menu(message: types.Message | types.CallbackQuery, state: FS
         user_id = message.from_user.id
         chat_message = message
     
-    update_last_activity(user_id)
-    
-    # Get user statistics
-    stats = get_user_stats(user_id)
-    
-    # Get trending cards
-    trending = get_trending_cards(5)
+    await update_last_activity(user_id)
+    
+    # Trending cards are shared by every user's dashboard
+    trending = await get_trending_cards(5)
+    
+    # Serve the cached render unless balance, transactions or referrals changed
+    dashboard = dashboard_cache.get(user_id, trending)
+    if dashboard is None:
+        read_token = dashboard_cache.token()
+        stats = await get_user_stats(user_id)
+        dashboard = render_dashboard(stats, trending)
+        dashboard_cache.put(user_id, trending, dashboard, read_token)
+    
+    # Only the bot's own message can be edited - /start gets a new one
+    if chat_message is not message:
+        try:
+            await outbound.edit_text(chat_message, dashboard, reply_markup=screens.MAIN_MENU, parse_mode="Markdown")
+            return
+        except:
+            pass
+    await outbound.answer(chat_message, dashboard, reply_markup=screens.MAIN_MENU, parse_mode="Markdown")
+
+def render_dashboard(stats, trending):
+    """Build the dashboard text from user stats and the trending list"""
     trending_text = ""
     if trending:
         trending_text = "\n\n🔥 Trending Cards:\n" + "\n".join([
@@ -69,8 +91,7 @@ async def show_main_menu(message: types.Message | types.CallbackQuery, state: FS
             for i, card in enumerate(trending)
         ])
     
-    # Create dashboard text
-    dashboard = f"""
+    return f"""
 🏦 TOPO EXCHANGE Dashboard
 
 👤 User: @{stats['username'] or 'Unknown'}
@@ -80,29 +101,6 @@ async def show_main_menu(message: types.Message | types.CallbackQuery, state: FS
 
 Choose an option below:
 """
-    
-    # Create main menu keyboard
-    keyboard = InlineKeyboardMarkup(row_width=2)
-    keyboard.add(
-        InlineKeyboardButton("🛒 Sell Gift Card", callback_data="sell_start"),
-        InlineKeyboardButton("💳 Buy Gift Card", callback_data="buy_start")
-    )
-    keyboard.add(
-        InlineKeyboardButton("📈 View Rates", callback_data="rates"),
-        InlineKeyboardButton("📜 My Transactions", callback_data="transactions")
-    )
-    keyboard.add(
-        InlineKeyboardButton("💰 Balance & Withdraw", callback_data="balance_withdraw"),
-        InlineKeyboardButton("👥 Refer & Earn $5", callback_data="refer_earn")
-    )
-    keyboard.add(
-        InlineKeyboardButton("🆘 Help & Support", callback_data="help")
-    )
-    
-    try:
-        await chat_message.edit_text(dashboard, reply_markup=keyboard, parse_mode="Markdown")
-    except:
-        await chat_message.answer(dashboard, reply_markup=keyboard, parse_mode="Markdown")
 
 async def cancel_handler(query: types.CallbackQuery, state: FSMContext):
     """Handle cancel button - return to main menu"""
@@ -114,32 +112,20 @@ async def rates_handler(query: types.CallbackQuery):
     """Display current rates"""
     await query.answer()
     
-    text = """
-📈 Current Rates
-
-Our rates vary by gift card and market conditions.
-
-Sell Rates: 5% - 25% discount
-Buy Rates: 10% - 30% premium
-
-💡 Tip: Rates are calculated dynamically when you select a card.
-
-Popular cards usually have better rates!
-"""
-    
-    await query.message.edit_text(text, reply_markup=create_back_button(), parse_mode="Markdown")
+    await outbound.edit_text(query.message, screens.RATES_TEXT, reply_markup=screens.BACK, parse_mode="Markdown")
 
-async def transactions_handler(query: types.CallbackQuery):
+async def transactions_handler(query: types.CallbackQuery, after: tuple = (None, None)):
     """Display user transaction history"""
     await query.answer()
     
-    transactions = get_user_transactions(query.from_user.id, limit=10)
+    direction, cursor = after
+    page = await get_user_transactions_page(query.from_user.id, direction, cursor)
     
-    if not transactions:
+    if not page.rows:
         text = "📜 Transaction History\n\nNo transactions yet. Start trading to see your history!"
     else:
-        text = "📜 Transaction History (Last 10)\n\n"
-        for tx in transactions:
+        text = "📜 Transaction History\n\n"
+        for tx in page.rows:
             tx_type = "🛒 Sell" if tx[1] == 'sell' else "💳 Buy"
             status = format_transaction_status(tx[5])
             text += f"{tx[0]}\n"
@@ -147,62 +133,31 @@ async def transactions_handler(query: types.CallbackQuery):
             text += f"Status: {status}\n"
             text += f"Date: {tx[6][:16]}\n\n"
     
-    await query.message.edit_text(text, reply_markup=create_back_button(), parse_mode="Markdown")
+    keyboard = InlineKeyboardMarkup()
+    nav_buttons = create_page_buttons('transactions', page)
+    if nav_buttons:
+        keyboard.row(*nav_buttons)
+    keyboard.add(InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu"))
+    
+    await outbound.edit_text(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
 
 async def help_handler(query: types.CallbackQuery):
     """Display help information"""
     await query.answer()
     
-    text = """
-🆘 Help & Support
-
-How to Sell:
-1. Click "🛒 Sell Gift Card"
-2. Select your gift card
-3. Enter the amount
-4. Upload photo or code
-5. Wait for verification
-
-How to Buy:
-1. Click "💳 Buy Gift Card"
-2. Select gift card
-3. Enter amount
-4. Pay with crypto
-5. Receive your code
-
-Withdrawals:
-- Minimum: $30 (Crypto) or $100 (Bank)
-- Crypto: No fees
-- Bank: 7% fee
-
-Referrals:
-- Earn $5 per referral
-- Your friend earns $5 too
-- Unlimited earnings!
-
-Need Help?
-Contact support: @SupportHandle
-
-Available 24/7 🕐
-"""
-    
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("💬 Contact Support", url="https://t.me/SupportHandle"))
-    keyboard.add(InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu"))
-    
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, screens.HELP_TEXT, reply_markup=screens.HELP_KEYBOARD, parse_mode="Markdown")
 
 async def refer_earn_handler(query: types.CallbackQuery):
     """Display referral information"""
     await query.answer()
     
-    from database import get_referrals_count, get_pending_rewards_amount, get_paid_rewards_amount
+    from async_db import get_referrals_count, get_pending_rewards_amount, get_paid_rewards_amount
     
-    code = get_referral_code(query.from_user.id)
+    code = await get_referral_code(query.from_user.id)
     link = f"https://t.me/{BOT_USERNAME}?start={code}"
-    count = get_referrals_count(query.from_user.id)
-    pending = get_pending_rewards_amount(query.from_user.id)
-    paid = get_paid_rewards_amount(query.from_user.id)
+    count = await get_referrals_count(query.from_user.id)
+    pending = await get_pending_rewards_amount(query.from_user.id)
+    paid = await get_paid_rewards_amount(query.from_user.id)
     
     text = f"""
 👥 Refer & Earn $5
@@ -229,19 +184,19 @@ How it Works:
     keyboard.add(InlineKeyboardButton("📤 Share Link", url=f"https://t.me/share/url?url={link}&text=Join TOPO EXCHANGE and get $5 bonus!"))
     keyboard.add(InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu"))
     
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
 
 async def balance_withdraw_handler(query: types.CallbackQuery):
     """Display balance and withdrawal options"""
     await query.answer()
     
-    from database import get_referrals_count, get_pending_rewards_amount, get_paid_rewards_amount, get_user_withdrawals
+    from async_db import get_referrals_count, get_pending_rewards_amount, get_paid_rewards_amount, get_user_withdrawals
     
-    balance = get_user_stats(query.from_user.id)['balance']
-    referrals = get_referrals_count(query.from_user.id)
-    pending_rewards = get_pending_rewards_amount(query.from_user.id)
-    paid_rewards = get_paid_rewards_amount(query.from_user.id)
-    withdrawals = get_user_withdrawals(query.from_user.id)
+    balance = (await get_user_stats(query.from_user.id))['balance']
+    referrals = await get_referrals_count(query.from_user.id)
+    pending_rewards = await get_pending_rewards_amount(query.from_user.id)
+    paid_rewards = await get_paid_rewards_amount(query.from_user.id)
+    withdrawals = await get_user_withdrawals(query.from_user.id)
     
     wd_text = ""
     if withdrawals:
@@ -272,4 +227,4 @@ Withdrawal Options:
         keyboard.add(InlineKeyboardButton("⚠️ Insufficient Balance ($30 min)", callback_data="insufficient"))
     keyboard.add(InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu"))
     
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
\ No newline at end of file
+    await outbound.edit_text(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
\ No newline at end of file
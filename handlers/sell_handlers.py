@@ -1,15 +1,20 @@
 # handlers/sell_handlers.py - Enhanced sell flow with smooth navigation
 
 import logging
+import callback_codec
+import callback_router
+import outbound
+import screens
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import ADMIN_CHANNEL_ID
-from database import get_random_rate, get_gift_card_logo, add_transaction, update_last_activity
-from utils import paginate_cards, format_rate_table, create_cancel_button, create_confirmation_keyboard, format_currency
+from async_db import get_random_rate, add_transaction, update_last_activity
+from utils import format_rate_table, format_currency
+import jobs
+import logos
 import uuid
-import asyncio
 
 class SellStates(StatesGroup):
     select_card = State()
@@ -18,61 +23,33 @@ class SellStates(StatesGroup):
     confirm = State()
 
 def register_sell_handlers(dp: Dispatcher):
-    dp.register_callback_query_handler(sell_start, lambda c: c.data == 'sell_start', state='*')
-    dp.register_callback_query_handler(select_card_page, lambda c: c.data.startswith('sell_page_'), state=SellStates.select_card)
-    dp.register_callback_query_handler(select_card, lambda c: c.data.startswith('sell_') and not c.data.startswith('sell_page_'), state=SellStates.select_card)
+    callback_router.add(sell_start, 'sell_start', state='*')
+    callback_router.add(select_card_page, callback_codec.SELL_PAGE, state=SellStates.select_card)
+    callback_router.add(select_card, callback_codec.SELL_CARD, state=SellStates.select_card)
     dp.register_message_handler(enter_amount, state=SellStates.enter_amount)
     dp.register_message_handler(upload_code, state=SellStates.upload_code, content_types=['photo', 'text'])
-    dp.register_callback_query_handler(confirm_sell, lambda c: c.data == 'confirm_sell', state=SellStates.confirm)
+    callback_router.add(confirm_sell, 'confirm_sell', state=SellStates.confirm)
 
 async def sell_start(query: types.CallbackQuery, state: FSMContext):
     """Start sell flow - show gift card selection"""
     await query.answer()
-    update_last_activity(query.from_user.id)
+    await update_last_activity(query.from_user.id)
     
-    text = """
-🛒 Sell Your Gift Card
-
-Step 1/4: Select Gift Card
-
-Choose the gift card you want to sell from the list below.
-
-💡 All cards are US-based
-"""
-    
-    keyboard = paginate_cards(page=0, callback_prefix="sell")
-    
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, screens.SELL_PICKER_TEXT, reply_markup=screens.card_page("sell", 0), parse_mode="Markdown")
     await SellStates.select_card.set()
 
-async def select_card_page(query: types.CallbackQuery, state: FSMContext):
+async def select_card_page(query: types.CallbackQuery, state: FSMContext, page: int):
     """Handle pagination for card selection"""
     await query.answer()
-    page = int(query.data.split('_')[-1])
     
-    text = """
-🛒 Sell Your Gift Card
+    await outbound.edit_text(query.message, screens.SELL_PICKER_TEXT, reply_markup=screens.card_page("sell", page), parse_mode="Markdown")
 
-Step 1/4: Select Gift Card
-
-Choose the gift card you want to sell from the list below.
-
-💡 All cards are US-based
-"""
-    
-    keyboard = paginate_cards(page=page, callback_prefix="sell")
-    
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
-
-async def select_card(query: types.CallbackQuery, state: FSMContext):
+async def select_card(query: types.CallbackQuery, state: FSMContext, card_name: str):
     """Handle gift card selection and show rates"""
     await query.answer()
     
-    # Extract card name (remove "sell_" prefix)
-    card_name = query.data.replace('sell_', '')
-    
     # Get rate for this card
-    rate = get_random_rate(card_name, is_buy=False)
+    rate = await get_random_rate(card_name, is_buy=False)
     
     # Save to state
     await state.update_data(gift_card=card_name, rate=rate)
@@ -94,36 +71,30 @@ Card: {card_name}
 Enter the face value of your card (e.g., 100):
 """
     
-    # Get logo
-    logo = get_gift_card_logo(card_name)
-    
-    keyboard = create_cancel_button(with_back=True)
+    keyboard = screens.CANCEL_WITH_BACK
     
     # Send with or without logo
     try:
         await query.message.delete()
-        if logo:
-            await query.message.answer_photo(logo, caption=text, reply_markup=keyboard, parse_mode="Markdown")
-        else:
-            await query.message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+        await logos.answer_with_logo(query.message, card_name, text, reply_markup=keyboard, parse_mode="Markdown")
     except:
-        await query.message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+        await outbound.answer(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
     
     await SellStates.enter_amount.set()
 
 async def enter_amount(message: types.Message, state: FSMContext):
     """Handle amount input"""
-    update_last_activity(message.from_user.id)
+    await update_last_activity(message.from_user.id)
     
     try:
         amount = float(message.text)
         
         if amount < 10:
-            await message.answer("⚠️ Minimum amount is $10. Please enter a valid amount:", reply_markup=create_cancel_button())
+            await outbound.answer(message, "⚠️ Minimum amount is $10. Please enter a valid amount:", reply_markup=screens.CANCEL)
             return
         
         if amount > 10000:
-            await message.answer("⚠️ Maximum amount is $10,000. Please enter a valid amount:", reply_markup=create_cancel_button())
+            await outbound.answer(message, "⚠️ Maximum amount is $10,000. Please enter a valid amount:", reply_markup=screens.CANCEL)
             return
         
         # Get data from state
@@ -154,15 +125,15 @@ Rate: -{rate:.1f}%
 💡 Make sure all details are visible and readable!
 """
         
-        await message.answer(text, reply_markup=create_cancel_button(), parse_mode="Markdown")
+        await outbound.answer(message, text, reply_markup=screens.CANCEL, parse_mode="Markdown")
         await SellStates.upload_code.set()
         
     except ValueError:
-        await message.answer("❌ Invalid amount. Please enter numbers only (e.g., 100):", reply_markup=create_cancel_button())
+        await outbound.answer(message, "❌ Invalid amount. Please enter numbers only (e.g., 100):", reply_markup=screens.CANCEL)
 
 async def upload_code(message: types.Message, state: FSMContext):
     """Handle code/photo upload and show confirmation"""
-    update_last_activity(message.from_user.id)
+    await update_last_activity(message.from_user.id)
     
     # Save photo or text to state
     if message.photo:
@@ -198,24 +169,14 @@ Rate: -{data['rate']:.1f}%
 Ready to submit?
 """
     
-    keyboard = create_confirmation_keyboard("confirm_sell", "cancel_action")
+    keyboard = screens.CONFIRM_SELL
     
-    await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.answer(message, text, reply_markup=keyboard, parse_mode="Markdown")
     await SellStates.confirm.set()
 
 async def confirm_sell(query: types.CallbackQuery, state: FSMContext):
-    """Final confirmation and submission to admin"""
+    """Final confirmation - save the sale; the admin post is sent by a background job"""
     await query.answer("📤 Submitting your sale...")
-    from main import bot
-    
-    # Show processing message
-    processing_msg = await query.message.edit_text(
-        "⏳ Processing your sale...\n\nPlease wait while we verify your card.",
-        parse_mode="Markdown"
-    )
-    
-    # Simulate processing
-    await asyncio.sleep(2)
     
     # Generate transaction ID
     tx_id = f"TX{uuid.uuid4().hex[:8].upper()}"
@@ -225,73 +186,28 @@ async def confirm_sell(query: types.CallbackQuery, state: FSMContext):
     user_id = query.from_user.id
     username = query.from_user.username
     
-    # Save transaction to database
-    add_transaction(
+    # Save transaction to database, queueing the admin post in the same write
+    await add_transaction(
         tx_id, 
         user_id, 
         'sell', 
         data['gift_card'], 
         data['denomination'], 
-        data['calculated']
-    )
-    
-    # Prepare admin notification
-    admin_text = f"""
-🛒 NEW SALE REQUEST
-
-Transaction ID: `{tx_id}`
-User: @{username or 'Unknown'} (ID: {user_id})
-
-Gift Card: {data['gift_card']}
-Face Value: ${data['denomination']:.0f}
-Payout: {format_currency(data['calculated'])}
-Rate: -{data['rate']:.1f}%
-
-Status: ⏳ Awaiting Verification
-"""
-    
-    # Admin action buttons
-    admin_keyboard = InlineKeyboardMarkup(row_width=2)
-    admin_keyboard.add(
-        InlineKeyboardButton("✅ Valid", callback_data=f"admin_valid_{tx_id}"),
-        InlineKeyboardButton("❌ Used Code", callback_data=f"admin_invalid_used_{tx_id}"),
-    )
-    admin_keyboard.add(
-        InlineKeyboardButton("⚠️ Invalid Code", callback_data=f"admin_invalid_code_{tx_id}"),
-        InlineKeyboardButton("🔄 Other Issue", callback_data=f"admin_invalid_other_{tx_id}")
+        data['calculated'],
+        job=('sell_admin_post', {
+            'tx_id': tx_id,
+            'user_id': user_id,
+            'username': username,
+            'gift_card': data['gift_card'],
+            'denomination': data['denomination'],
+            'calculated': data['calculated'],
+            'rate': data['rate'],
+            'photo_id': data.get('photo_id'),
+            'is_document': data.get('is_document', False),
+            'code_text': data.get('code_text'),
+        })
     )
-    
-    # Send to admin channel with photo or text
-    try:
-        if data.get('photo_id'):
-            if data.get('is_document'):
-                await bot.send_document(
-                    ADMIN_CHANNEL_ID,
-                    data['photo_id'],
-                    caption=admin_text,
-                    reply_markup=admin_keyboard,
-                    parse_mode="Markdown"
-                )
-            else:
-                await bot.send_photo(
-                    ADMIN_CHANNEL_ID,
-                    data['photo_id'],
-                    caption=admin_text,
-                    reply_markup=admin_keyboard,
-                    parse_mode="Markdown"
-                )
-        else:
-            await bot.send_message(
-                ADMIN_CHANNEL_ID,
-                admin_text + f"\n\nCode:\n`{data.get('code_text', 'No code')}`",
-                reply_markup=admin_keyboard,
-                parse_mode="Markdown"
-            )
-        logging.info(f"✅ Sell transaction {tx_id} sent to admin channel")
-    except Exception as e:
-        logging.error(f"❌ Error sending to admin channel: {e}")
-        # Still notify user even if admin notification fails
-        pass
+    jobs.wake()
     
     # Notify user
     success_text = f"""
@@ -310,12 +226,56 @@ You'll receive a notification once verified and funds will be added to your bala
 Need help? Contact @SupportHandle
 """
     
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("🏠 Back to Menu", callback_data="main_menu"))
-    keyboard.add(InlineKeyboardButton("📜 View Transactions", callback_data="transactions"))
-    
-    await processing_msg.edit_text(success_text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, success_text, reply_markup=screens.TRADE_DONE, parse_mode="Markdown")
     
     # Clear state
     await state.finish()
-    update_last_activity(user_id)
\ No newline at end of file
+    await update_last_activity(user_id)
+
+@jobs.handles('sell_admin_post')
+async def post_sale_to_admin(sale):
+    """Job: post a submitted sale to the admin channel for verification"""
+    tx_id = sale['tx_id']
+    admin_text = f"""
+🛒 NEW SALE REQUEST
+
+Transaction ID: `{tx_id}`
+User: @{sale['username'] or 'Unknown'} (ID: {sale['user_id']})
+
+Gift Card: {sale['gift_card']}
+Face Value: ${sale['denomination']:.0f}
+Payout: {format_currency(sale['calculated'])}
+Rate: -{sale['rate']:.1f}%
+
+Status: ⏳ Awaiting Verification
+"""
+    
+    # Admin action buttons
+    admin_keyboard = InlineKeyboardMarkup(row_width=2)
+    admin_keyboard.add(
+        InlineKeyboardButton("✅ Valid", callback_data=callback_codec.ADMIN_VALID.encode(tx_id)),
+        InlineKeyboardButton("❌ Used Code", callback_data=callback_codec.ADMIN_INVALID.encode(tx_id, 'used')),
+    )
+    admin_keyboard.add(
+        InlineKeyboardButton("⚠️ Invalid Code", callback_data=callback_codec.ADMIN_INVALID.encode(tx_id, 'code')),
+        InlineKeyboardButton("🔄 Other Issue", callback_data=callback_codec.ADMIN_INVALID.encode(tx_id, 'other'))
+    )
+    
+    # Send to admin channel with photo or text - awaited, so a failed post is retried
+    if sale['photo_id']:
+        send = outbound.send_document if sale['is_document'] else outbound.send_photo
+        await send(
+            ADMIN_CHANNEL_ID,
+            sale['photo_id'],
+            caption=admin_text,
+            reply_markup=admin_keyboard,
+            parse_mode="Markdown"
+        )
+    else:
+        await outbound.send_message(
+            ADMIN_CHANNEL_ID,
+            admin_text + f"\n\nCode:\n`{sale['code_text'] or 'No code'}`",
+            reply_markup=admin_keyboard,
+            parse_mode="Markdown"
+        )
+    logging.info(f"✅ Sell transaction {tx_id} sent to admin channel")
@@ -1,12 +1,17 @@
 # handlers/withdraw_handlers.py - Enhanced withdrawal flow
 
+import callback_codec
+import callback_router
+import screens
 from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import ADMIN_CHANNEL_ID
-from database import get_balance, update_balance, add_withdrawal, update_last_activity
-from utils import create_cancel_button, create_confirmation_keyboard, format_currency
+from async_db import get_balance, add_withdrawal, update_last_activity
+from utils import format_currency
+import jobs
+import outbound
 import uuid
 
 class WithdrawStates(StatesGroup):
@@ -15,19 +20,22 @@ class WithdrawStates(StatesGroup):
     details = State()
     confirm = State()
 
+def method_label(method):
+    return "🔗 Crypto (USDT)" if method == 'crypto' else "🏦 Bank Transfer"
+
 def register_withdraw_handlers(dp: Dispatcher):
-    dp.register_callback_query_handler(withdraw_start, lambda c: c.data == 'withdraw_start', state='*')
-    dp.register_callback_query_handler(select_method, lambda c: c.data.startswith('wd_method_'), state=WithdrawStates.method)
+    callback_router.add(withdraw_start, 'withdraw_start', state='*')
+    callback_router.add(select_method, 'wd_method_{method}', state=WithdrawStates.method)
     dp.register_message_handler(enter_amount, state=WithdrawStates.amount)
     dp.register_message_handler(enter_details, state=WithdrawStates.details)
-    dp.register_callback_query_handler(confirm_withdrawal, lambda c: c.data == 'confirm_wd', state=WithdrawStates.confirm)
+    callback_router.add(confirm_withdrawal, 'confirm_wd', state=WithdrawStates.confirm)
 
 async def withdraw_start(query: types.CallbackQuery, state: FSMContext):
     """Start withdrawal flow"""
     await query.answer()
-    update_last_activity(query.from_user.id)
+    await update_last_activity(query.from_user.id)
     
-    balance = get_balance(query.from_user.id)
+    balance = await get_balance(query.from_user.id)
     
     if balance < 30:
         text = f"""
@@ -41,9 +49,7 @@ Minimum withdrawal amounts:
 
 Keep trading to increase your balance!
 """
-        keyboard = InlineKeyboardMarkup()
-        keyboard.add(InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu"))
-        await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+        await outbound.edit_text(query.message, text, reply_markup=screens.BACK, parse_mode="Markdown")
         return
     
     text = f"""
@@ -72,15 +78,13 @@ Choose your withdrawal method:
     
     keyboard.add(InlineKeyboardButton("⬅️ Back", callback_data="balance_withdraw"))
     
-    await query.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
     await WithdrawStates.method.set()
 
-async def select_method(query: types.CallbackQuery, state: FSMContext):
-    """Handle method selection"""
+async def select_method(query: types.CallbackQuery, state: FSMContext, method: str):
+    """Handle method selection (crypto or bank)"""
     await query.answer()
     
-    method = query.data.split('_')[-1]  # crypto or bank
-    
     if method == 'crypto':
         min_amount = 30
         fee_pct = 0
@@ -92,7 +96,7 @@ async def select_method(query: types.CallbackQuery, state: FSMContext):
     
     await state.update_data(method=method, min_amount=min_amount, fee_pct=fee_pct)
     
-    balance = get_balance(query.from_user.id)
+    balance = await get_balance(query.from_user.id)
     
     text = f"""
 💸 Withdraw Funds
@@ -109,29 +113,31 @@ Maximum: {format_currency(balance)}
 💡 Enter withdrawal amount:
 """
     
-    await query.message.edit_text(text, reply_markup=create_cancel_button(), parse_mode="Markdown")
+    await outbound.edit_text(query.message, text, reply_markup=screens.CANCEL, parse_mode="Markdown")
     await WithdrawStates.amount.set()
 
 async def enter_amount(message: types.Message, state: FSMContext):
     """Handle amount input"""
-    update_last_activity(message.from_user.id)
+    await update_last_activity(message.from_user.id)
     
     try:
         amount = float(message.text)
         data = await state.get_data()
-        balance = get_balance(message.from_user.id)
+        balance = await get_balance(message.from_user.id)
         
         if amount < data['min_amount']:
-            await message.answer(
+            await outbound.answer(
+                message,
                 f"⚠️ Minimum withdrawal is ${data['min_amount']}. Please enter a valid amount:",
-                reply_markup=create_cancel_button()
+                reply_markup=screens.CANCEL
             )
             return
         
         if amount > balance:
-            await message.answer(
+            await outbound.answer(
+                message,
                 f"⚠️ Insufficient balance. Your balance: {format_currency(balance)}. Please enter a valid amount:",
-                reply_markup=create_cancel_button()
+                reply_markup=screens.CANCEL
             )
             return
         
@@ -180,30 +186,31 @@ Routing Number: [If USA]
 Send all details in one message:
 """
         
-        await message.answer(prompt, reply_markup=create_cancel_button(), parse_mode="Markdown")
+        await outbound.answer(message, prompt, reply_markup=screens.CANCEL, parse_mode="Markdown")
         await WithdrawStates.details.set()
         
     except ValueError:
-        await message.answer("❌ Invalid amount. Please enter numbers only (e.g., 100):", reply_markup=create_cancel_button())
+        await outbound.answer(message, "❌ Invalid amount. Please enter numbers only (e.g., 100):", reply_markup=screens.CANCEL)
 
 async def enter_details(message: types.Message, state: FSMContext):
     """Handle details input and show confirmation"""
-    update_last_activity(message.from_user.id)
+    await update_last_activity(message.from_user.id)
     
     details = message.text.strip()
     data = await state.get_data()
     
     if len(details) < 10:
-        await message.answer(
+        await outbound.answer(
+            message,
             "⚠️ Details seem incomplete. Please provide full information:",
-            reply_markup=create_cancel_button()
+            reply_markup=screens.CANCEL
         )
         return
     
     await state.update_data(details=details)
     
     # Show confirmation
-    method_name = "🔗 Crypto (USDT)" if data['method'] == 'crypto' else "🏦 Bank Transfer"
+    method_name = method_label(data['method'])
     
     # Truncate details for display
     display_details = details[:100] + "..." if len(details) > 100 else details
@@ -229,15 +236,14 @@ Details:
 Ready to submit?
 """
     
-    keyboard = create_confirmation_keyboard("confirm_wd", "cancel_action")
+    keyboard = screens.CONFIRM_WITHDRAWAL
     
-    await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.answer(message, text, reply_markup=keyboard, parse_mode="Markdown")
     await WithdrawStates.confirm.set()
 
 async def confirm_withdrawal(query: types.CallbackQuery, state: FSMContext):
     """Process withdrawal request"""
     await query.answer("Processing withdrawal...")
-    from main import bot
     
     # Get data
     data = await state.get_data()
@@ -247,58 +253,40 @@ async def confirm_withdrawal(query: types.CallbackQuery, state: FSMContext):
     # Generate withdrawal ID
     wd_id = f"WD{uuid.uuid4().hex[:8].upper()}"
     
-    # Deduct from balance
-    update_balance(user_id, data['amount'], add=False)
-    
-    # Save to database
-    add_withdrawal(
+    # Deduct from balance and save, queueing the admin post in the same write
+    submitted = await add_withdrawal(
         wd_id,
         user_id,
         data['method'],
         data['amount'],
         data['fee'],
         data['net_amount'],
-        data['details']
-    )
-    
-    # Notify admin
-    method_name = "🔗 Crypto (USDT)" if data['method'] == 'crypto' else "🏦 Bank Transfer"
-    
-    admin_text = f"""
-💸 NEW WITHDRAWAL REQUEST
-
-Withdrawal ID: `{wd_id}`
-User: @{username or 'Unknown'} (ID: {user_id})
-
-Method: {method_name}
-Amount: {format_currency(data['amount'])}
-Fee: {format_currency(data['fee'])}
-Net Amount: {format_currency(data['net_amount'])}
-
-Details:
-{data['details']}
-
-Status: ⏳ Pending Approval
-"""
-    
-    admin_keyboard = InlineKeyboardMarkup(row_width=2)
-    admin_keyboard.add(
-        InlineKeyboardButton("✅ Approve", callback_data=f"wd_approve_{wd_id}"),
-        InlineKeyboardButton("❌ Deny", callback_data=f"wd_deny_{wd_id}")
+        data['details'],
+        job=('withdrawal_admin_post', {
+            'wd_id': wd_id,
+            'user_id': user_id,
+            'username': username,
+            'method': data['method'],
+            'amount': data['amount'],
+            'fee': data['fee'],
+            'net_amount': data['net_amount'],
+            'details': data['details'],
+        })
     )
-    
-    try:
-        await bot.send_message(
-            ADMIN_CHANNEL_ID,
-            admin_text,
-            reply_markup=admin_keyboard,
-            parse_mode="Markdown"
+    if not submitted:
+        balance = await get_balance(user_id)
+        await outbound.edit_text(
+            query.message,
+            f"⚠️ Insufficient balance. Your balance: {format_currency(balance)}. Nothing was withdrawn.",
+            reply_markup=screens.BACK
         )
-    except Exception as e:
-        print(f"Error sending to admin: {e}")
+        await state.finish()
+        return
+    jobs.wake()
     
     # Notify user
-    new_balance = get_balance(user_id)
+    method_name = method_label(data['method'])
+    new_balance = await get_balance(user_id)
     
     success_text = f"""
 ✅ Withdrawal Submitted!
@@ -321,8 +309,43 @@ Need help? Contact @SupportHandle
     keyboard = InlineKeyboardMarkup()
     keyboard.add(InlineKeyboardButton("🏠 Back to Menu", callback_data="main_menu"))
     
-    await query.message.edit_text(success_text, reply_markup=keyboard, parse_mode="Markdown")
+    await outbound.edit_text(query.message, success_text, reply_markup=keyboard, parse_mode="Markdown")
     
     # Clear state
     await state.finish()
-    update_last_activity(user_id)
\ No newline at end of file
+    await update_last_activity(user_id)
+
+@jobs.handles('withdrawal_admin_post')
+async def post_withdrawal_to_admin(withdrawal):
+    """Job: post a withdrawal request to the admin channel for approval"""
+    wd_id = withdrawal['wd_id']
+    admin_text = f"""
+💸 NEW WITHDRAWAL REQUEST
+
+Withdrawal ID: `{wd_id}`
+User: @{withdrawal['username'] or 'Unknown'} (ID: {withdrawal['user_id']})
+
+Method: {method_label(withdrawal['method'])}
+Amount: {format_currency(withdrawal['amount'])}
+Fee: {format_currency(withdrawal['fee'])}
+Net Amount: {format_currency(withdrawal['net_amount'])}
+
+Details:
+{withdrawal['details']}
+
+Status: ⏳ Pending Approval
+"""
+    
+    admin_keyboard = InlineKeyboardMarkup(row_width=2)
+    admin_keyboard.add(
+        InlineKeyboardButton("✅ Approve", callback_data=callback_codec.WD_APPROVE.encode(wd_id)),
+        InlineKeyboardButton("❌ Deny", callback_data=callback_codec.WD_DENY.encode(wd_id))
+    )
+    
+    # Awaited, so a failed post is retried
+    await outbound.send_message(
+        ADMIN_CHANNEL_ID,
+        admin_text,
+        reply_markup=admin_keyboard,
+        parse_mode="Markdown"
+    )
@@ -0,0 +1,136 @@
+# inventory.py - Reservation engine for buy-side gift card codes
+
+import logging
+import threading
+import cache_sync
+from collections import deque
+from config import INVENTORY_PREFETCH_BATCH
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_queues = {}   # (card, denomination) -> deque of prefetched available inventory ids
+_cursors = {}  # (card, denomination) -> highest id prefetched so far
+_stock = {}    # (card, denomination) -> number of available codes
+
+def _key(gift_card_name, denomination):
+    return (gift_card_name, float(denomination))
+
+def load_stock():
+    """Count available codes per card and denomination (index-only scan)"""
+    global _stock
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT gift_card_name, denomination, COUNT(*)
+            FROM inventory
+            WHERE available = TRUE
+            GROUP BY gift_card_name, denomination
+        ''')
+        stock = {_key(card, denom): count for card, denom, count in cursor.fetchall()}
+
+    with _lock:
+        _stock = stock
+        _queues.clear()
+        _cursors.clear()
+    logger.info(f"✅ Inventory loaded: {sum(stock.values())} codes across {len(stock)} card/denomination pairs")
+
+def get_stock(gift_card_name, denomination):
+    return _stock.get(_key(gift_card_name, denomination), 0)
+
+def get_stock_levels():
+    """Copy of {(card, denomination): available codes}"""
+    with _lock:
+        return dict(_stock)
+
+def _adjust_stock(key, delta):
+    _apply_stock(*key, delta)
+    cache_sync.publish('stock', *key, delta)
+
+def _apply_stock(gift_card_name, denomination, delta):
+    key = _key(gift_card_name, denomination)
+    with _lock:
+        _stock[key] = max(_stock.get(key, 0) + delta, 0)
+
+cache_sync.subscribe('stock', _apply_stock)
+cache_sync.subscribe('stock_reload', load_stock)
+
+def _refill(cursor, key):
+    """Prefetch the next batch of available ids after the queue's cursor"""
+    with _lock:
+        after = _cursors.get(key, 0)
+    cursor.execute('''
+        SELECT id FROM inventory
+        WHERE gift_card_name = ? AND denomination = ? AND available = TRUE AND id > ?
+        ORDER BY id LIMIT ?
+    ''', (key[0], key[1], after, INVENTORY_PREFETCH_BATCH))
+    ids = [row[0] for row in cursor.fetchall()]
+    if ids:
+        with _lock:
+            _queues.setdefault(key, deque()).extend(ids)
+            _cursors[key] = max(_cursors.get(key, 0), ids[-1])
+    return bool(ids)
+
+def _next_id(key):
+    with _lock:
+        queue = _queues.get(key)
+        return queue.popleft() if queue else None
+
+def claim_code(gift_card_name, denomination):
+    """Reserve and claim one code, or return None when out of stock"""
+    key = _key(gift_card_name, denomination)
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        while True:
+            inv_id = _next_id(key)
+            if inv_id is None:
+                if not _refill(cursor, key):
+                    break
+                continue
+
+            # Guarded on available, so a code is never handed out twice
+            cursor.execute('UPDATE inventory SET available = FALSE WHERE id = ? AND available = TRUE RETURNING code',
+                          (inv_id,))
+            row = cursor.fetchone()
+            if row:
+                conn.commit()
+                _adjust_stock(key, -1)
+                return row[0]
+
+        # Nothing past the cursor - claim straight from the table in case ids behind it came free
+        cursor.execute('''
+            UPDATE inventory SET available = FALSE
+            WHERE id = (
+                SELECT id FROM inventory
+                WHERE gift_card_name = ? AND denomination = ? AND available = TRUE
+                ORDER BY id LIMIT 1
+            ) AND available = TRUE
+            RETURNING code
+        ''', key)
+        row = cursor.fetchone()
+
+    if not row:
+        with _lock:
+            _stock[key] = 0
+        return None
+
+    with _lock:
+        _cursors[key] = 0
+    _adjust_stock(key, -1)
+    return row[0]
+
+def release_code(gift_card_name, code, denomination):
+    """Put back a claimed code that was never delivered; claim_code() finds it again once past the cursor"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE inventory SET available = TRUE WHERE code = ? AND available = FALSE', (code,))
+        released = cursor.rowcount
+    if released:
+        _adjust_stock(_key(gift_card_name, denomination), 1)
+
+def add_code(gift_card_name, code, denomination):
+    with get_connection() as conn:
+        conn.execute('INSERT INTO inventory (gift_card_name, code, denomination) VALUES (?, ?, ?)',
+                     (gift_card_name, code, denomination))
+    _adjust_stock(_key(gift_card_name, denomination), 1)
@@ -0,0 +1,123 @@
+# inventory_import.py - Streaming bulk import of gift card codes
+#
+# Usage:
+#   python inventory_import.py codes.csv                        # rows of: card,code,denomination
+#   python inventory_import.py codes.txt --card Amazon --denomination 100
+
+import argparse
+import csv
+import logging
+import time
+import cache_sync
+import catalog
+import inventory
+from config import IMPORT_CHUNK_SIZE
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+MAX_CODE_LENGTH = 128
+
+def _parse_row(row, default_card, default_denomination):
+    """(card, code, denomination) from a CSV row, or None if it can't be used"""
+    if len(row) == 1:
+        card, code, denomination = default_card, row[0], default_denomination
+    elif len(row) == 2:
+        card, (code, denomination) = default_card, row
+    elif len(row) == 3:
+        card, code, denomination = row
+    else:
+        return None
+
+    try:
+        denomination = float(denomination)
+    except (TypeError, ValueError):
+        return None
+
+    if not card or not code or len(code) > MAX_CODE_LENGTH or denomination <= 0:
+        return None
+    return card, code, denomination
+
+def _is_header(row):
+    return any(cell.lower() in ('code', 'codes') for cell in row)
+
+def _insert_chunk(chunk):
+    """Insert one chunk in its own transaction; returns rows actually inserted"""
+    with get_connection() as conn:
+        before = conn.total_changes
+        conn.executemany('INSERT OR IGNORE INTO inventory (gift_card_name, code, denomination) VALUES (?, ?, ?)',
+                         chunk)
+        return conn.total_changes - before
+
+def import_codes(lines, gift_card_name=None, denomination=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """Stream codes from an iterable of text lines into the inventory table.
+
+    Lines are either `card,code,denomination`, `code,denomination` or a bare
+    `code`; missing fields come from gift_card_name / denomination. Codes
+    already in the table (UNIQUE code) are counted as duplicates.
+    """
+    valid_cards = set(catalog.get_snapshot().logos)
+    result = {'inserted': 0, 'duplicates': 0, 'bad': 0}
+    chunk = []
+    first_row = True
+    started = time.perf_counter()
+
+    for row in csv.reader(lines):
+        row = [cell.strip() for cell in row]
+        if not any(row):
+            continue
+        if first_row:
+            first_row = False
+            if _is_header(row):
+                continue
+
+        parsed = _parse_row(row, gift_card_name, denomination)
+        if not parsed or parsed[0] not in valid_cards:
+            result['bad'] += 1
+            continue
+
+        chunk.append(parsed)
+        if len(chunk) >= chunk_size:
+            inserted = _insert_chunk(chunk)
+            result['inserted'] += inserted
+            result['duplicates'] += len(chunk) - inserted
+            chunk = []
+
+    if chunk:
+        inserted = _insert_chunk(chunk)
+        result['inserted'] += inserted
+        result['duplicates'] += len(chunk) - inserted
+
+    if result['inserted']:
+        inventory.load_stock()
+        cache_sync.publish('stock_reload')
+
+    result['seconds'] = time.perf_counter() - started
+    logger.info(f"✅ Inventory import: {result['inserted']} inserted, {result['duplicates']} duplicates, "
+                f"{result['bad']} bad rows in {result['seconds']:.1f}s")
+    return result
+
+def import_file(path, gift_card_name=None, denomination=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import a CSV/TXT file without reading it all into memory"""
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+        return import_codes(f, gift_card_name, denomination, chunk_size)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import gift card codes into inventory")
+    parser.add_argument('path', help="CSV (card,code,denomination) or TXT (one code per line)")
+    parser.add_argument('--card', help="Gift card name for rows that don't include one")
+    parser.add_argument('--denomination', type=float, help="Denomination for rows that don't include one")
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="Rows per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    from database import init_db
+    init_db()
+    result = import_file(args.path, args.card, args.denomination, args.chunk_size)
+    print(f"Inserted: {result['inserted']}")
+    print(f"Duplicates: {result['duplicates']}")
+    print(f"Bad rows: {result['bad']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+# jobs.py - Durable background jobs: a queue table worked by a pool of async workers
+#
+# Jobs are enqueued inside the transaction that makes them necessary, so a
+# committed row always has its follow-up work queued. Failures are retried with
+# backoff and, after JOB_MAX_ATTEMPTS, moved to dead_letter.
+#
+# Usage:
+#   python jobs.py --requeue-dead    # move every dead-lettered job back to the queue
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from config import JOB_WORKERS, JOB_POLL_INTERVAL, JOB_LEASE, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY, JOB_RETRY_MAX_DELAY
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}  # kind -> async function(payload)
+
+_wakeup = asyncio.Event()
+_running = set()
+_next_retry = None  # monotonic time of the earliest retry scheduled by this process
+_stats = {'done': 0, 'retried': 0, 'dead': 0}
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_queue (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            payload TEXT,
+            attempts INTEGER DEFAULT 0,
+            run_at REAL,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # claim() takes the oldest due jobs; a claimed job's run_at is pushed past its lease
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_job_queue_run_at ON job_queue (run_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dead_letter (
+            job_id INTEGER PRIMARY KEY,
+            kind TEXT,
+            payload TEXT,
+            attempts INTEGER,
+            last_error TEXT,
+            created_at DATETIME,
+            failed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def handles(kind):
+    """Decorator registering the coroutine that runs jobs of `kind`"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+def enqueue(cursor, kind, payload, delay=0):
+    """Queue a job inside the caller's transaction; call wake() once it has committed"""
+    cursor.execute('INSERT INTO job_queue (kind, payload, run_at) VALUES (?, ?, ?)',
+                   (kind, json.dumps(payload), time.time() + delay))
+
+def wake():
+    """Have the workers look for new jobs now rather than at the next poll"""
+    _wakeup.set()
+
+# Blocking helpers, run on the database writer thread
+def claim(limit, lease=JOB_LEASE):
+    """Lease up to `limit` due jobs; a worker that dies leaves them to be retried when the lease runs out"""
+    now = time.time()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE job_queue SET run_at = ?, attempts = attempts + 1
+            WHERE job_id IN (SELECT job_id FROM job_queue WHERE run_at <= ? ORDER BY run_at LIMIT ?)
+            RETURNING job_id, kind, payload, attempts
+        ''', (now + lease, now, limit))
+        return cursor.fetchall()
+
+def complete(job_id):
+    with get_connection() as conn:
+        conn.execute('DELETE FROM job_queue WHERE job_id = ?', (job_id,))
+
+def retry(job_id, error, delay):
+    with get_connection() as conn:
+        conn.execute('UPDATE job_queue SET run_at = ?, last_error = ? WHERE job_id = ?',
+                     (time.time() + delay, error, job_id))
+
+def release(job_id):
+    """Hand back an interrupted job without counting the attempt"""
+    with get_connection() as conn:
+        conn.execute('UPDATE job_queue SET run_at = ?, attempts = attempts - 1 WHERE job_id = ?',
+                     (time.time(), job_id))
+
+def bury(job_id, error):
+    """Move a job that keeps failing to dead_letter"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO dead_letter (job_id, kind, payload, attempts, last_error, created_at)
+            SELECT job_id, kind, payload, attempts, ?, created_at FROM job_queue WHERE job_id = ?
+        ''', (error, job_id))
+        cursor.execute('DELETE FROM job_queue WHERE job_id = ?', (job_id,))
+
+def requeue_dead(cursor):
+    """Put every dead-lettered job back in the queue with a fresh set of attempts"""
+    cursor.execute('''
+        INSERT INTO job_queue (job_id, kind, payload, attempts, run_at, last_error, created_at)
+        SELECT job_id, kind, payload, 0, ?, last_error, created_at FROM dead_letter
+    ''', (time.time(),))
+    requeued = cursor.rowcount
+    cursor.execute('DELETE FROM dead_letter')
+    return requeued
+
+def get_counts():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM job_queue')
+        queued = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM dead_letter')
+        dead = cursor.fetchone()[0]
+    return {'queued': queued, 'dead_letter': dead}
+
+def _retry_delay(attempts):
+    return min(JOB_RETRY_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+
+def _schedule_wakeup(delay):
+    global _next_retry
+    due = time.monotonic() + delay
+    if _next_retry is None or due < _next_retry:
+        _next_retry = due
+
+async def _run(job_id, kind, payload, attempts):
+    from async_db import run_write
+
+    try:
+        handler = HANDLERS.get(kind)
+        if handler is None:
+            raise LookupError(f"no handler for job kind '{kind}'")
+        await handler(json.loads(payload))
+    except asyncio.CancelledError:
+        await run_write(release, job_id)
+        raise
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if attempts >= JOB_MAX_ATTEMPTS:
+            _stats['dead'] += 1
+            await run_write(bury, job_id, error)
+            logger.error(f"❌ Job {job_id} ({kind}) failed {attempts} times, moved to dead letter: {error}")
+        else:
+            _stats['retried'] += 1
+            delay = _retry_delay(attempts)
+            await run_write(retry, job_id, error, delay)
+            _schedule_wakeup(delay)
+            logger.warning(f"⚠️ Job {job_id} ({kind}) failed, retrying in {delay}s: {error}")
+    else:
+        _stats['done'] += 1
+        await run_write(complete, job_id)
+    finally:
+        # A worker is free again
+        _wakeup.set()
+
+async def run_workers(workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+    """Claim due jobs and run up to `workers` of them at a time"""
+    global _next_retry
+    from async_db import run_write
+
+    try:
+        while True:
+            _wakeup.clear()
+            free = workers - len(_running)
+            if free > 0:
+                try:
+                    for job in await run_write(claim, free):
+                        task = asyncio.create_task(_run(*job))
+                        _running.add(task)
+                        task.add_done_callback(_running.discard)
+                except Exception as e:
+                    logger.error(f"❌ Claiming jobs failed: {e}")
+
+            timeout = poll_interval
+            if _next_retry is not None:
+                timeout = min(timeout, max(_next_retry - time.monotonic(), 0))
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                _next_retry = None
+    finally:
+        # Shutting down: give running jobs a moment, then hand the rest back to the queue
+        if _running:
+            await asyncio.wait(list(_running), timeout=5)
+        for task in list(_running):
+            task.cancel()
+        await asyncio.gather(*_running, return_exceptions=True)
+
+def get_metrics():
+    return {'running': len(_running), **_stats}
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the background job queue")
+    parser.add_argument('--requeue-dead', action='store_true', help="Move dead-lettered jobs back to the queue")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if not args.requeue_dead:
+        parser.print_help()
+        return
+
+    from database import init_db
+    init_db()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        logger.info(f"✅ Requeued {requeue_dead(cursor)} dead-lettered jobs")
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,38 @@
-# keep_alive.py - UPDATED
-from flask import Flask, jsonify
-from threading import Thread
+# keep_alive.py - aiohttp server for health checks and webhook updates (runs in the bot's event loop)
 import logging
-import os
-import time
+from aiohttp import web
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+from config import WEBHOOK_SECRET
 
-app = Flask('')
+async def home(request):
+    return web.Response(text="🤖 TOPO EXCHANGE Bot - Active ✅")
 
-@app.route('/')
-def home():
-    return "🤖 TOPO EXCHANGE Bot - Active ✅"
+async def health(request):
+    return web.json_response({"status": "healthy", "service": "telegram_bot"})
 
-@app.route('/health')
-def health():
-    return jsonify({"status": "healthy", "service": "telegram_bot"})
+async def ping(request):
+    return web.Response(text="pong")
 
-@app.route('/ping')
-def ping():
-    return "pong"
+class SecretWebhookHandler(WebhookRequestHandler):
+    """Webhook handler that only accepts updates carrying our secret token"""
 
-def run():
-    """Run the Flask server"""
-    port = int(os.environ.get('PORT', 10000))
-    logging.info(f"🌐 Starting keep-alive server on port {port}")
-    
-    # Simple Flask server - Render handles the production serving
-    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
+    async def post(self):
+        if WEBHOOK_SECRET and self.request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            raise web.HTTPUnauthorized()
+        return await super().post()
 
-def keep_alive():
-    """Start the keep-alive server"""
-    thread = Thread(target=run, daemon=True)
-    thread.start()
-    logging.info("✅ Keep-alive server started")
\ No newline at end of file
+def create_app():
+    """Application with the health routes; webhook mode adds its route on top"""
+    app = web.Application()
+    app.router.add_get('/', home)
+    app.router.add_get('/health', health)
+    app.router.add_get('/ping', ping)
+    return app
+
+async def keep_alive(host, port):
+    """Serve the health routes alongside polling; returns the runner to clean up on shutdown"""
+    runner = web.AppRunner(create_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"✅ Keep-alive server listening on {host}:{port}")
+    return runner
@@ -0,0 +1,185 @@
+# logos.py - Gift card logos: rasterized to PNG once, uploaded once, then sent by Telegram file_id
+#
+# A card whose logo isn't uploaded yet is shown as text while a logo_upload job
+# uploads it in the background (to the admin channel, deleted right after);
+# from then on users get it by file_id. /warm_logos uploads them all up front.
+
+import asyncio
+import io
+import logging
+import requests
+from aiogram.types import InputFile
+from aiogram.utils.exceptions import BadRequest
+import catalog
+import jobs
+import outbound
+from async_db import run_write
+from config import ADMIN_CHANNEL_ID, LOGO_SIZE
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+# SVG rendering needs cairosvg and the cairo library; without them SVG logos are skipped
+try:
+    import cairosvg
+except (ImportError, OSError):
+    cairosvg = None
+
+# Raster logos are re-encoded with Pillow (a cairosvg dependency); without it they are skipped
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Bigger downloads aren't logos (Telegram takes photos up to 10 MB)
+MAX_LOGO_BYTES = 5 * 1024 * 1024
+# Telegram rejects photos more than 20 times wider than tall or vice versa
+MAX_ASPECT_RATIO = 20
+
+# Some logo hosts (Wikimedia) refuse requests without a descriptive User-Agent
+HEADERS = {'User-Agent': 'TopoExchangeBot/1.0 (logo cache)'}
+
+# Cards whose logo couldn't be fetched or rasterized - sent as text until the next warm()
+_unavailable = set()
+# Cards with a logo_upload job queued by this process
+_queued = set()
+
+def _to_png(data, size):
+    """Raster image bytes (any format Pillow reads) as a PNG at most `size` px wide, or None"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        logger.warning(f"⚠️ Unreadable logo image: {e}")
+        return None
+    if max(image.size) > MAX_ASPECT_RATIO * min(image.size):
+        logger.warning(f"⚠️ Logo is {image.width}x{image.height}, too narrow for Telegram")
+        return None
+
+    # Flattened onto white like the SVG logos, so transparent ones don't turn black
+    image = image.convert('RGBA')
+    flat = Image.new('RGB', image.size, 'white')
+    flat.paste(image, mask=image.getchannel('A'))
+    if flat.width > size:
+        flat = flat.resize((size, max(1, round(flat.height * size / flat.width))), Image.LANCZOS)
+    out = io.BytesIO()
+    flat.save(out, format='PNG')
+    return out.getvalue()
+
+def rasterize(url, size=LOGO_SIZE):
+    """PNG bytes for a logo URL, or None if it can't be turned into one"""
+    response = requests.get(url, headers=HEADERS, timeout=15, stream=True)
+    response.raise_for_status()
+    data = response.raw.read(MAX_LOGO_BYTES + 1, decode_content=True)
+    if len(data) > MAX_LOGO_BYTES:
+        logger.warning(f"⚠️ {url} is over {MAX_LOGO_BYTES} bytes, skipped")
+        return None
+
+    is_svg = url.lower().split('?')[0].endswith('.svg') or 'svg' in response.headers.get('Content-Type', '')
+    if is_svg:
+        if cairosvg is None:
+            logger.warning(f"⚠️ cairosvg not available, can't rasterize {url}")
+            return None
+        return cairosvg.svg2png(bytestring=data, output_width=size, background_color='white')
+    if Image is None:
+        logger.warning(f"⚠️ Pillow not available, can't convert {url}")
+        return None
+    return _to_png(data, size)
+
+def set_file_id(name, file_id):
+    """Store (or clear, with None) a card's uploaded logo and refresh the catalog"""
+    with get_connection() as conn:
+        conn.execute('UPDATE gift_cards SET logo_file_id = ? WHERE name = ?', (file_id, name))
+    catalog.invalidate()
+
+async def _upload(send, name):
+    """Rasterize and upload a logo with `send(InputFile)`; returns the sent message or None.
+
+    Download errors are raised; a logo that can't be made into a PNG is marked unavailable.
+    """
+    url = catalog.get_snapshot().logos.get(name)
+    if not url or name in _unavailable:
+        return None
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(None, rasterize, url)
+    if not png:
+        _unavailable.add(name)
+        return None
+
+    sent = await send(InputFile(io.BytesIO(png), filename="logo.png"))
+    await run_write(set_file_id, name, sent.photo[-1].file_id)
+    logger.info(f"✅ Cached logo for {name}")
+    return sent
+
+def _enqueue_upload(name):
+    with get_connection() as conn:
+        jobs.enqueue(conn.cursor(), 'logo_upload', {'name': name})
+
+async def _schedule_upload(name):
+    if name in _queued or name in _unavailable or not catalog.get_snapshot().logos.get(name):
+        return
+    _queued.add(name)
+    await run_write(_enqueue_upload, name)
+    jobs.wake()
+
+@jobs.handles('logo_upload')
+async def upload_logo(payload):
+    """Job: upload a card's logo via the admin channel so later replies can send it by file_id"""
+    name = payload['name']
+    if catalog.get_snapshot().file_ids.get(name):
+        _queued.discard(name)
+        return
+    # A download error is raised and the job retried; the name stays queued meanwhile
+    sent = await _upload(lambda photo: outbound.send_photo(ADMIN_CHANNEL_ID, photo, disable_notification=True), name)
+    _queued.discard(name)
+    if sent:
+        try:
+            await sent.delete()
+        except Exception:
+            pass
+
+async def answer_with_logo(message, name, text, **kwargs):
+    """Reply with the card's logo captioned with `text`, or just `text` while it isn't uploaded yet"""
+    file_id = catalog.get_snapshot().file_ids.get(name)
+    if file_id:
+        try:
+            return await outbound.send_photo(message.chat.id, file_id, caption=text, priority=outbound.PRIORITY_USER,
+                                             **kwargs)
+        except BadRequest as e:
+            # file_ids are per bot - e.g. the token changed; upload it again
+            logger.warning(f"⚠️ Cached logo for {name} rejected ({e}), re-uploading")
+            await run_write(set_file_id, name, None)
+
+    await _schedule_upload(name)
+    return await outbound.answer(message, text, **kwargs)
+
+async def warm(chat_id, force=False):
+    """Upload every card logo that has no file_id yet (all of them with `force`), via `chat_id`.
+
+    Returns {uploaded, cached, failed}; failed lists the card names.
+    """
+    result = {'uploaded': 0, 'cached': 0, 'failed': []}
+    snapshot = catalog.get_snapshot()
+    _unavailable.clear()
+    _queued.clear()
+
+    for name, _ in snapshot.cards:
+        if snapshot.file_ids.get(name) and not force:
+            result['cached'] += 1
+            continue
+        try:
+            sent = await _upload(lambda photo: outbound.send_photo(chat_id, photo, disable_notification=True), name)
+        except Exception as e:
+            logger.warning(f"⚠️ Logo upload for {name} failed: {e}")
+            sent = None
+
+        if not sent:
+            result['failed'].append(name)
+            continue
+        result['uploaded'] += 1
+        # Only the file_id is needed, not the message
+        try:
+            await sent.delete()
+        except Exception:
+            pass
+    return result
@@ -3,7 +3,7 @@ import logging
 import asyncio
 import sys
 from aiogram import Bot, Dispatcher, executor
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 
 # Import config
 from config import BOT_TOKEN, ADMIN_IDS
@@ -17,7 +17,23 @@ from handlers.admin_handlers import register_admin_handlers
 from handlers.withdraw_handlers import register_withdraw_handlers
 
 # Import utilities
-from database import init_db
+import activity_buffer
+import async_db
+import broadcast
+import cache_sync
+import callback_router
+import catalog
+import counters
+import inventory
+import jobs
+import keep_alive
+import outbound
+import outbox
+import trending
+import update_scheduler
+import workers
+from db_pool import close_pool
+from fsm_storage import SQLiteStorage
 
 # Configure logging
 logging.basicConfig(
@@ -27,49 +43,149 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Initialize bot and dispatcher GLOBALLY
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+bot = Bot(token=BOT_TOKEN, server=TelegramAPIServer.from_base(config.TELEGRAM_API_URL) if config.TELEGRAM_API_URL else TELEGRAM_PRODUCTION)
+storage = SQLiteStorage()
 dp = Dispatcher(bot, storage=storage)
 
+# Long-running tasks started on startup and cancelled on shutdown
+background_tasks = []
+
+# Multi-process mode (workers.py): the front process only receives updates, workers handle them
+IS_FRONT = config.BOT_WORKERS > 1 and config.WORKER_INDEX is None
+# Worker 0 (or the only process) runs the tasks there must be just one of
+IS_PRIMARY = config.WORKER_INDEX in (None, 0)
+
+# Health check server when polling (webhook mode serves them from its own app)
+web_runner = None
+
 # Register all handlers ONCE at module level
 register_main_handlers(dp)
 register_sell_handlers(dp)
 register_buy_handlers(dp)
 register_withdraw_handlers(dp)
 register_admin_handlers(dp)
+# Callback queries go through one prefix-trie router built from the routes above
+callback_router.install(dp)
+# Updates are queued per user and handled by shard workers (see update_scheduler.py)
+update_scheduler.install(dp)
+if IS_FRONT:
+    # ...which in multi-process mode live in the worker processes
+    workers.install(dp)
+
+async def start_services(dispatcher):
+    """Database, caches and background workers - everything that handles updates"""
+    # Initialize database
+    try:
+        await async_db.init_db()
+        await async_db.run_read(catalog.load)
+        await async_db.run_read(trending.rebuild)
+        await async_db.run_read(inventory.load_stock)
+        if config.WORKER_INDEX is not None:
+            await async_db.run_read(cache_sync.enable, config.WORKER_INDEX)
+        logger.info("✅ Database initialized")
+    except Exception as e:
+        logger.error(f"❌ Database initialization failed: {e}")
+        raise
+    
+    # Start background workers
+    background_tasks.append(asyncio.create_task(activity_buffer.run_flusher()))
+    if IS_PRIMARY:
+        background_tasks.append(asyncio.create_task(counters.run_reconciler()))
+    background_tasks.append(asyncio.create_task(storage.run_sweeper()))
+    background_tasks.append(asyncio.create_task(outbound.run_scheduler(bot)))
+    background_tasks.append(asyncio.create_task(jobs.run_workers()))
+    background_tasks.append(asyncio.create_task(outbox.run_dispatcher()))
+    if config.WORKER_INDEX is not None:
+        background_tasks.append(asyncio.create_task(cache_sync.run_sync()))
+    # Last, so it's stopped first - updates still queued at shutdown need everything above
+    background_tasks.append(asyncio.create_task(update_scheduler.run_workers(dispatcher)))
+    
+    # Pick up broadcasts interrupted by the last shutdown
+    if IS_PRIMARY:
+        await broadcast.resume()
+
+async def stop_services():
+    """Stop what start_services() started, flushing buffered writes"""
+    # Pause broadcasts (they resume from their checkpoint), then give queued notifications a chance to go out
+    await broadcast.shutdown()
+    left = await outbound.drain()
+    if left:
+        logger.warning(f"⚠️ {left} outbound messages still queued at shutdown")
+    
+    # Stop background workers, newest first - job workers and the outbox still need the outbound scheduler while they wind down
+    for task in reversed(background_tasks):
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    
+    # Write out buffered activity
+    try:
+        flushed = await async_db.run_write(activity_buffer.flush)
+        logger.info(f"✅ Flushed {flushed} buffered activity updates")
+    except Exception as e:
+        logger.error(f"❌ Final activity flush failed: {e}")
+    
+    # Hand the last cache changes to the other workers
+    if config.WORKER_INDEX is not None:
+        try:
+            await async_db.run_write(cache_sync.exchange)
+        except Exception as e:
+            logger.error(f"❌ Final cache sync failed: {e}")
+    
+    # Close storage
+    await storage.close()
+    await storage.wait_closed()
+    
+    # Drain pending queries, then close pooled database connections
+    async_db.shutdown()
+    close_pool()
 
 async def on_startup(dispatcher):
     """Execute on bot startup"""
+    global web_runner
     logger.info("🚀 Bot startup initiated...")
 
-    # CRITICAL: Webhook cleanup for polling mode
-    try:
-        logger.info("🔄 Clearing any existing webhooks...")
+    if config.BOT_MODE == 'webhook':
+        # Keep pending updates - Telegram queued them while we were restarting
+        await bot.set_webhook(
+            config.WEBHOOK_URL,
+            secret_token=config.WEBHOOK_SECRET or None,
+            allowed_updates=['message', 'callback_query']
+        )
+        logger.info(f"✅ Webhook set to {config.WEBHOOK_URL}")
+    else:
+        # CRITICAL: Webhook cleanup for polling mode
+        try:
+            logger.info("🔄 Clearing any existing webhooks...")
 
-        # Delete webhook with drop pending updates
-        await bot.delete_webhook(drop_pending_updates=True)
-        await asyncio.sleep(1)
+            # Delete webhook with drop pending updates
+            await bot.delete_webhook(drop_pending_updates=True)
+            await asyncio.sleep(1)
 
-        logger.info("✅ Webhooks cleared successfully")
+            logger.info("✅ Webhooks cleared successfully")
 
-    except Exception as e:
-        logger.warning(f"⚠️ Webhook cleanup warning: {e}")
-        # Continue anyway - polling usually works even if this fails
+        except Exception as e:
+            logger.warning(f"⚠️ Webhook cleanup warning: {e}")
+            # Continue anyway - polling usually works even if this fails
+
+        if config.SERVE_HEALTH_CHECKS:
+            web_runner = await keep_alive.keep_alive(config.WEB_SERVER_HOST, config.WEB_SERVER_PORT)
     
-    # Initialize database
-    try:
-        init_db()
-        logger.info("✅ Database initialized")
-    except Exception as e:
-        logger.error(f"❌ Database initialization failed: {e}")
-        raise
+    if IS_FRONT:
+        # Migrations run once here, before any worker opens the database
+        await async_db.init_db()
+        await workers.start(config.BOT_WORKERS)
+    else:
+        await start_services(dispatcher)
     
     # Get bot info
     try:
         me = await bot.get_me()
         config.BOT_USERNAME = me.username
         logger.info(f"✅ Bot authenticated: @{me.username} (ID: {me.id})")
-        logger.info("🔥 Polling mode active - Bot will stay alive!")
+        mode = "Webhook" if config.BOT_MODE == 'webhook' else "Long Polling"
+        if IS_FRONT:
+            mode += f" ({config.BOT_WORKERS} workers)"
+        logger.info(f"🔥 {mode} mode active - Bot will stay alive!")
         
         # Notify admins
         for admin_id in ADMIN_IDS:
@@ -79,7 +195,7 @@ async def on_startup(dispatcher):
                     "🚀 **Bot Started Successfully!**\n\n"
                     f"Bot: @{me.username}\n"
                     f"Status: ✅ Online\n"
-                    f"Mode: Long Polling\n\n"
+                    f"Mode: {mode}\n\n"
                     f"Use /admin to access admin panel",
                     parse_mode="Markdown"
                 )
@@ -94,12 +210,16 @@ async def on_shutdown(dispatcher):
     """Execute on bot shutdown"""
     logger.info("⚠️ Bot shutting down...")
     
-    # Clean shutdown
-    try:
-        await bot.delete_webhook()
-        logger.info("✅ Webhook cleaned up")
-    except Exception as e:
-        logger.warning(f"⚠️ Webhook cleanup warning: {e}")
+    # Clean shutdown - a webhook stays registered so Telegram holds updates until we're back
+    if config.BOT_MODE != 'webhook':
+        try:
+            await bot.delete_webhook()
+            logger.info("✅ Webhook cleaned up")
+        except Exception as e:
+            logger.warning(f"⚠️ Webhook cleanup warning: {e}")
+    
+    if web_runner:
+        await web_runner.cleanup()
     
     # Notify admins
     for admin_id in ADMIN_IDS:
@@ -112,22 +232,58 @@ async def on_shutdown(dispatcher):
         except:
             pass
     
-    # Close storage and bot
-    await storage.close()
-    await storage.wait_closed()
+    if IS_FRONT:
+        # Workers finish their queued updates and stop their own services
+        await workers.stop()
+        async_db.shutdown()
+        close_pool()
+    else:
+        await stop_services()
     await bot.close()
     
     logger.info("✅ Bot shutdown complete")
 
+async def on_worker_startup(dispatcher):
+    """Execute on worker process startup (multi-process mode)"""
+    await start_services(dispatcher)
+    me = await bot.get_me()
+    config.BOT_USERNAME = me.username
+    logger.info(f"✅ Worker {config.WORKER_INDEX} ready")
+
+async def on_worker_shutdown(dispatcher):
+    """Execute on worker process shutdown"""
+    await stop_services()
+    await bot.close()
+    logger.info(f"✅ Worker {config.WORKER_INDEX} stopped")
+
 def main():
     """Main entry point"""
+    if config.WORKER_INDEX is not None:
+        workers.run_worker(dp, on_worker_startup, on_worker_shutdown)
+        return
+    
     logger.info("🚀 Starting TOPO EXCHANGE Bot...")
     logger.info(f"📋 Configuration:")
     logger.info(f"   - Admins: {len(ADMIN_IDS)}")
     logger.info(f"   - Channel: {config.ADMIN_CHANNEL_ID}")
     logger.info(f"   - Database: {config.DB_NAME}")
+    logger.info(f"   - Mode: {config.BOT_MODE}")
+    logger.info(f"   - Workers: {config.BOT_WORKERS}")
     
     try:
+        if config.BOT_MODE == 'webhook':
+            # Updates arrive on the same aiohttp server (and event loop) that serves the health routes
+            webhook = executor.Executor(dp, skip_updates=False)
+            webhook.on_startup(on_startup, polling=False)
+            webhook.on_shutdown(on_shutdown, polling=False)
+            webhook.set_webhook(
+                config.WEBHOOK_PATH,
+                request_handler=keep_alive.SecretWebhookHandler,
+                web_app=keep_alive.create_app()
+            )
+            webhook.run_app(host=config.WEB_SERVER_HOST, port=config.WEB_SERVER_PORT, access_log=None)
+            return
+        
         # Start polling with optimized settings
         executor.start_polling(
             dp,
@@ -136,7 +292,7 @@ def main():
             on_shutdown=on_shutdown,
             timeout=30,  # Timeout for long polling
             relax=0.5,  # Delay between failed requests
-            fast=False,  # Disable fast mode for stability
+            fast=False,  # Hand each batch to the update scheduler in order
             allowed_updates=['message', 'callback_query']  # Only process these
         )
     except KeyboardInterrupt:
@@ -0,0 +1,265 @@
+# migrations.py - Versioned schema migrations
+
+import logging
+import cache_sync
+import counters
+import jobs
+import outbox
+import rollups
+from config import GIFT_CARDS
+
+logger = logging.getLogger(__name__)
+
+def _001_base_schema(cursor):
+    """Tables as originally created by init_db, plus the approved gift cards"""
+    # Users table with balance
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            registered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            referral_code TEXT UNIQUE,
+            referred_by INTEGER,
+            balance REAL DEFAULT 0.0,
+            last_activity DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Gift cards table (simplified - no country)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS gift_cards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            logo_url TEXT
+        )
+    ''')
+
+    # Rates table (simplified)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            gift_card_name TEXT UNIQUE,
+            min_rate REAL DEFAULT 5.0,
+            max_rate REAL DEFAULT 25.0,
+            buy_min_rate REAL DEFAULT 10.0,
+            buy_max_rate REAL DEFAULT 30.0,
+            FOREIGN KEY (gift_card_name) REFERENCES gift_cards(name)
+        )
+    ''')
+
+    # Transactions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            tx_id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            type TEXT,
+            gift_card_name TEXT,
+            denomination REAL,
+            calculated_amount REAL,
+            status TEXT DEFAULT 'pending',
+            reason TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            completed_at DATETIME,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    ''')
+
+    # Inventory for buy side
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            gift_card_name TEXT,
+            code TEXT UNIQUE,
+            denomination REAL,
+            available BOOLEAN DEFAULT TRUE,
+            FOREIGN KEY (gift_card_name) REFERENCES gift_cards(name)
+        )
+    ''')
+
+    # Rewards table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rewards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            referrer_id INTEGER,
+            referred_id INTEGER,
+            amount REAL DEFAULT 5.0,
+            status TEXT DEFAULT 'pending',
+            tx_id TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Withdrawals table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS withdrawals (
+            wd_id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            method TEXT,
+            amount REAL,
+            fee REAL,
+            net_amount REAL,
+            details TEXT,
+            status TEXT DEFAULT 'pending',
+            reason TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    ''')
+
+    # Insert approved gift cards
+    cursor.executemany('INSERT OR IGNORE INTO gift_cards (name, logo_url) VALUES (?, ?)',
+                       [(card['name'], card['logo']) for card in GIFT_CARDS])
+    cursor.executemany('INSERT OR IGNORE INTO rates (gift_card_name) VALUES (?)',
+                       [(card['name'],) for card in GIFT_CARDS])
+
+def _002_hot_query_indexes(cursor):
+    """Covering indexes for the per-user, per-status and per-card lookups"""
+    # get_user_transactions(_page) / get_user_stats; page indexes end in the row id to seek on (created_at, id)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_page ON transactions (user_id, created_at, tx_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_status ON transactions (user_id, status)')
+    # get_pending_transactions_page, get_all_transactions(status), trending.rebuild
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_status_page ON transactions (status, created_at, tx_id)')
+    # get_referrals_count
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users (referred_by)')
+    # get_pending_rewards_amount / get_paid_rewards_amount / reward_exists
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rewards_referrer_status ON rewards (referrer_id, status, amount)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rewards_referrer_referred ON rewards (referrer_id, referred_id)')
+    # get_pending_withdrawals(_page) / get_user_withdrawals
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_status_page ON withdrawals (status, created_at, wd_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_user_created ON withdrawals (user_id, created_at)')
+    # get_available_code
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_inventory_lookup '
+                   'ON inventory (gift_card_name, denomination, available)')
+
+def _003_analytics_indexes(cursor):
+    """Covering indexes for the time-ranged analytics aggregates"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_created_summary '
+                   'ON transactions (created_at, type, status, calculated_amount)')
+    # Also serves get_users_page: it already ends in the user_id rowid
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_registered ON users (registered_at)')
+
+def _004_daily_rollups(cursor):
+    """Daily rollup tables, backfilled from existing history"""
+    rollups.create_tables(cursor)
+    rollups.backfill(cursor)
+
+def _005_counters(cursor):
+    """Running totals for the admin panel, seeded from the tables"""
+    counters.create_table(cursor)
+    counters.reconcile(cursor)
+
+def _006_fsm_states(cursor):
+    """Persistent FSM states for fsm_storage.SQLiteStorage"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            chat_id INTEGER,
+            user_id INTEGER,
+            state TEXT,
+            data TEXT,
+            bucket TEXT,
+            updated_at REAL,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)')
+
+def _007_broadcasts(cursor):
+    """Broadcast campaigns with a resume checkpoint, and users we can no longer reach"""
+    cursor.execute('ALTER TABLE users ADD COLUMN is_blocked INTEGER DEFAULT 0')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            broadcast_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER,
+            text TEXT,
+            status TEXT DEFAULT 'draft',
+            total INTEGER DEFAULT 0,
+            last_user_id INTEGER DEFAULT 0,
+            delivered INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            chat_id INTEGER,
+            message_id INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            finished_at DATETIME
+        )
+    ''')
+    # broadcast.resume() on startup
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)')
+
+def _008_logo_file_ids(cursor):
+    """Telegram file_id of each uploaded gift card logo (logos.py)"""
+    cursor.execute('ALTER TABLE gift_cards ADD COLUMN logo_file_id TEXT')
+
+def _009_job_queue(cursor):
+    """Durable background job queue and dead letter table"""
+    jobs.create_tables(cursor)
+
+def _010_outbox(cursor):
+    """Notification outbox written alongside settlements"""
+    outbox.create_tables(cursor)
+
+def _011_cache_events(cursor):
+    """Cache change events shared between worker processes (cache_sync.py)"""
+    cache_sync.create_tables(cursor)
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, "Base schema", _001_base_schema),
+    (2, "Indexes for hot queries", _002_hot_query_indexes),
+    (3, "Indexes for analytics ranges", _003_analytics_indexes),
+    (4, "Daily rollups", _004_daily_rollups),
+    (5, "Admin panel counters", _005_counters),
+    (6, "FSM state storage", _006_fsm_states),
+    (7, "Broadcast campaigns", _007_broadcasts),
+    (8, "Gift card logo file_ids", _008_logo_file_ids),
+    (9, "Background job queue", _009_job_queue),
+    (10, "Notification outbox", _010_outbox),
+    (11, "Cache sync events", _011_cache_events),
+]
+
+def get_schema_version(conn):
+    """Highest applied migration, 0 for a fresh database"""
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+def migrate(conn):
+    """Apply every pending migration, each in its own transaction"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    if conn.in_transaction:
+        conn.commit()
+
+    applied = 0
+    for version, description, func in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+
+        # IMMEDIATE takes the write lock up front, so concurrent starters queue here
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have applied it while we waited for the lock
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            func(conn.cursor())
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"❌ Migration {version} ({description}) failed")
+            raise
+
+        applied += 1
+        logger.info(f"✅ Applied migration {version}: {description}")
+
+    if applied:
+        conn.execute('PRAGMA optimize')
+
+    return get_schema_version(conn)
@@ -0,0 +1,227 @@
+# outbound.py - Rate-limited, prioritised delivery of outgoing bot messages
+#
+# Every message the bot sends or edits goes through here, so sends, edits and
+# handler replies share the global and per-chat limits. Callback query answers,
+# deletes and the startup/shutdown admin notices (sent before the scheduler
+# starts or after it stops) go to Telegram directly.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter
+from aiogram.utils.exceptions import (BotBlocked, BotKicked, CantInitiateConversation, ChatNotFound,
+                                      MessageNotModified, RetryAfter, UserDeactivated)
+from config import (OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_GROUP_RATE, OUTBOUND_BURST,
+                    OUTBOUND_MAX_IN_FLIGHT, OUTBOUND_MAX_RETRIES)
+
+logger = logging.getLogger(__name__)
+
+# Lower goes first
+PRIORITY_USER = 0       # notifications a user is waiting for
+PRIORITY_ADMIN = 1      # admin channel posts
+PRIORITY_BROADCAST = 2  # bulk sends
+
+PRIORITY_NAMES = {PRIORITY_USER: 'user', PRIORITY_ADMIN: 'admin', PRIORITY_BROADCAST: 'broadcast'}
+
+# Recipients that will never get a message until they talk to the bot again
+UNREACHABLE = (BotBlocked, BotKicked, CantInitiateConversation, ChatNotFound, UserDeactivated)
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `capacity`"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _level(self, now):
+        return min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)"""
+        level = self._level(now)
+        return 0 if level >= 1 else (1 - level) / self.rate
+
+    def take(self, now):
+        self.tokens = self._level(now) - 1
+        self.updated = now
+
+    def pause_until(self, until):
+        """Hold back until `until` (a RetryAfter), then allow a single send"""
+        self.tokens = 1
+        self.updated = until
+
+    def is_full(self, now):
+        return self._level(now) >= self.capacity
+
+class _Job:
+    __slots__ = ('chat_id', 'method', 'args', 'kwargs', 'priority', 'future', 'attempts')
+
+    def __init__(self, chat_id, method, args, kwargs, priority, future):
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+
+_pending = []   # heap of (priority, seq, job) - allowed to go as soon as the global limit lets it
+_deferred = []  # heap of (not_before, seq, job) - waiting on its chat's limit or a RetryAfter
+_seq = itertools.count()
+_wakeup = asyncio.Event()
+_buckets = {}   # chat_id -> TokenBucket
+_global = TokenBucket(OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_RATE)
+_in_flight = set()
+_depth = Counter()  # priority -> jobs queued or deferred
+_stats = {'sent': 0, 'retried': 0, 'failed': 0}
+
+# Drop idle per-chat buckets beyond this many
+MAX_BUCKETS = 10000
+
+def _chat_bucket(chat_id):
+    bucket = _buckets.get(chat_id)
+    if bucket is None:
+        # Private chats allow about one message a second, groups and channels about 20 a minute
+        rate = OUTBOUND_CHAT_RATE if chat_id > 0 else OUTBOUND_GROUP_RATE / 60
+        bucket = _buckets[chat_id] = TokenBucket(rate, OUTBOUND_BURST)
+    return bucket
+
+def _prune_buckets(now):
+    for chat_id in [c for c, b in _buckets.items() if b.is_full(now)]:
+        del _buckets[chat_id]
+
+def _log_failure(future):
+    # An edit that changed nothing isn't a failure
+    if not future.cancelled() and future.exception() and not isinstance(future.exception(), MessageNotModified):
+        logger.warning(f"⚠️ Outbound message failed: {future.exception()}")
+
+def _queue(chat_id, method, args, kwargs, priority):
+    future = asyncio.get_event_loop().create_future()
+    future.add_done_callback(_log_failure)
+    job = _Job(int(chat_id), method, args, kwargs, priority, future)
+    heapq.heappush(_pending, (priority, next(_seq), job))
+    _depth[priority] += 1
+    _wakeup.set()
+    return future
+
+def submit(chat_id, method, *args, priority=PRIORITY_ADMIN, **kwargs):
+    """Queue `bot.<method>(chat_id, *args, **kwargs)`; returns a future for the result.
+
+    Awaiting the future is optional - failures are logged either way.
+    """
+    return _queue(chat_id, method, (chat_id,) + args, kwargs, priority)
+
+def send_message(chat_id, text, priority=PRIORITY_ADMIN, **kwargs):
+    return submit(chat_id, 'send_message', text, priority=priority, **kwargs)
+
+def send_photo(chat_id, photo, priority=PRIORITY_ADMIN, **kwargs):
+    return submit(chat_id, 'send_photo', photo, priority=priority, **kwargs)
+
+def send_document(chat_id, document, priority=PRIORITY_ADMIN, **kwargs):
+    return submit(chat_id, 'send_document', document, priority=priority, **kwargs)
+
+def edit_message_text(chat_id, message_id, text, priority=PRIORITY_ADMIN, **kwargs):
+    return _queue(chat_id, 'edit_message_text', (text, chat_id, message_id), kwargs, priority)
+
+# Handler replies: someone is waiting on these
+def answer(message, text, priority=PRIORITY_USER, **kwargs):
+    """Queued `message.answer(text, ...)`"""
+    return send_message(message.chat.id, text, priority=priority, **kwargs)
+
+def edit_text(message, text, priority=PRIORITY_USER, **kwargs):
+    """Queued `message.edit_text(text, ...)`"""
+    return edit_message_text(message.chat.id, message.message_id, text, priority=priority, **kwargs)
+
+def _finish(job):
+    _depth[job.priority] -= 1
+
+async def _deliver(bot, job, slots):
+    try:
+        result = await getattr(bot, job.method)(*job.args, **job.kwargs)
+    except RetryAfter as e:
+        job.attempts += 1
+        if job.attempts > OUTBOUND_MAX_RETRIES:
+            _finish(job)
+            _stats['failed'] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        # Telegram told us exactly how long to back off this chat
+        _stats['retried'] += 1
+        not_before = time.monotonic() + e.timeout
+        _chat_bucket(job.chat_id).pause_until(not_before)
+        heapq.heappush(_deferred, (not_before, next(_seq), job))
+        _wakeup.set()
+    except Exception as e:
+        _finish(job)
+        _stats['failed'] += 1
+        if not job.future.done():
+            job.future.set_exception(e)
+    else:
+        _finish(job)
+        _stats['sent'] += 1
+        if not job.future.done():
+            job.future.set_result(result)
+    finally:
+        slots.release()
+
+async def run_scheduler(bot):
+    """Send queued messages in priority order within the global and per-chat limits"""
+    slots = asyncio.Semaphore(OUTBOUND_MAX_IN_FLIGHT)
+
+    while True:
+        now = time.monotonic()
+        while _deferred and _deferred[0][0] <= now:
+            _, seq, job = heapq.heappop(_deferred)
+            heapq.heappush(_pending, (job.priority, seq, job))
+
+        if not _pending:
+            if len(_buckets) > MAX_BUCKETS:
+                _prune_buckets(now)
+            _wakeup.clear()
+            timeout = _deferred[0][0] - now if _deferred else None
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        wait = _global.delay(now)
+        if wait > 0:
+            await asyncio.sleep(wait)
+            continue
+
+        _, seq, job = heapq.heappop(_pending)
+        if job.future.cancelled():
+            _finish(job)
+            continue
+
+        bucket = _chat_bucket(job.chat_id)
+        wait = bucket.delay(now)
+        if wait > 0:
+            # Park it without holding up other chats
+            heapq.heappush(_deferred, (now + wait, seq, job))
+            continue
+
+        bucket.take(now)
+        _global.take(now)
+        await slots.acquire()
+        task = asyncio.create_task(_deliver(bot, job, slots))
+        _in_flight.add(task)
+        task.add_done_callback(_in_flight.discard)
+
+async def drain(timeout=5):
+    """Wait (up to `timeout` seconds) for queued messages to go out, e.g. before shutdown"""
+    deadline = time.monotonic() + timeout
+    while (sum(_depth.values()) or _in_flight) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return sum(_depth.values())
+
+def get_metrics():
+    queued = {name: _depth[priority] for priority, name in PRIORITY_NAMES.items()}
+    return {'queued': queued, 'deferred': len(_deferred), 'in_flight': len(_in_flight), **_stats}
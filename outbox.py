@@ -0,0 +1,192 @@
+# outbox.py - Transactional outbox: user notifications stored with the change they announce, sent by a dispatcher
+#
+# add() runs inside the settlement's transaction, so a committed approval always
+# has its message queued and a rolled-back one never does. Each message carries
+# an idempotency key (e.g. "tx:<id>:completed"); the key is unique, so settling
+# twice can't queue it twice. The dispatcher sends due messages in batches
+# through the outbound scheduler and retries failures with backoff. Delivery is
+# at-least-once - a crash between sending and recording it repeats that message.
+
+import asyncio
+import json
+import logging
+import time
+import outbound
+from config import (OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_LEASE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY,
+                    OUTBOX_RETRY_MAX_DELAY, OUTBOX_RETENTION_DAYS)
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+# How often sent messages past OUTBOX_RETENTION_DAYS are deleted (seconds)
+PURGE_INTERVAL = 3600
+
+_wakeup = asyncio.Event()
+_next_retry = None  # monotonic time of the earliest retry scheduled by this process
+_stats = {'sent': 0, 'retried': 0, 'failed': 0, 'last_batch': 0, 'last_batch_ms': 0.0}
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT UNIQUE,
+            chat_id INTEGER,
+            payload TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            run_at REAL,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            sent_at DATETIME
+        )
+    ''')
+    # Only pending rows are ever claimed; sent and failed ones stay out of the index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (run_at) WHERE status = 'pending'")
+
+def add(cursor, key, chat_id, text, **kwargs):
+    """Queue a message inside the caller's transaction; call wake() once it has committed.
+
+    Returns False if a message with this key was already queued.
+    """
+    cursor.execute('INSERT OR IGNORE INTO outbox (idempotency_key, chat_id, payload, run_at) VALUES (?, ?, ?, ?)',
+                   (key, chat_id, json.dumps({'text': text, **kwargs}), time.time()))
+    return cursor.rowcount == 1
+
+def wake():
+    """Have the dispatcher send new messages now rather than at the next poll"""
+    _wakeup.set()
+
+# Blocking helpers, run on the database writer thread
+def claim(limit, lease=OUTBOX_LEASE):
+    """Lease up to `limit` due messages; if the dispatcher dies they are sent again when the lease runs out"""
+    now = time.time()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE outbox SET run_at = ?, attempts = attempts + 1
+            WHERE outbox_id IN (
+                SELECT outbox_id FROM outbox WHERE status = 'pending' AND run_at <= ? ORDER BY run_at LIMIT ?
+            )
+            RETURNING outbox_id, chat_id, payload, attempts
+        ''', (now + lease, now, limit))
+        return cursor.fetchall()
+
+def record(sent, retries, failed, blocked_ids, released):
+    """Store a batch's outcome in one transaction.
+
+    sent: ids; retries: (id, delay, error); failed: (id, error); released: ids handed back unsent
+    """
+    now = time.time()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("UPDATE outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP WHERE outbox_id = ?",
+                           [(outbox_id,) for outbox_id in sent])
+        cursor.executemany('UPDATE outbox SET run_at = ?, last_error = ? WHERE outbox_id = ?',
+                           [(now + delay, error, outbox_id) for outbox_id, delay, error in retries])
+        cursor.executemany("UPDATE outbox SET status = 'failed', last_error = ? WHERE outbox_id = ?",
+                           [(error, outbox_id) for outbox_id, error in failed])
+        cursor.executemany('UPDATE outbox SET run_at = ?, attempts = attempts - 1 WHERE outbox_id = ?',
+                           [(now, outbox_id) for outbox_id in released])
+        cursor.executemany('UPDATE users SET is_blocked = 1 WHERE user_id = ?', [(uid,) for uid in blocked_ids])
+
+def purge(days=OUTBOX_RETENTION_DAYS):
+    """Delete sent messages older than `days`; their keys no longer block a new message"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM outbox WHERE status = 'sent' AND sent_at < datetime('now', ?)", (f'-{days} days',))
+        return cursor.rowcount
+
+def get_counts():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status')
+        counts = dict(cursor.fetchall())
+    return {status: counts.get(status, 0) for status in ('pending', 'sent', 'failed')}
+
+def _retry_delay(attempts):
+    return min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_DELAY)
+
+async def _send(chat_id, payload):
+    kwargs = json.loads(payload)
+    await outbound.send_message(chat_id, kwargs.pop('text'), priority=outbound.PRIORITY_USER, **kwargs)
+
+async def _dispatch(batch):
+    """Send a claimed batch concurrently and record the outcome"""
+    global _next_retry
+    from async_db import run_write
+
+    sends = [asyncio.ensure_future(_send(chat_id, payload)) for _, chat_id, payload, _ in batch]
+    try:
+        await asyncio.wait(sends)
+    finally:
+        sent, retries, failed, blocked_ids, released = [], [], [], [], []
+        for (outbox_id, chat_id, _, attempts), send in zip(batch, sends):
+            if not send.done() or send.cancelled():
+                send.cancel()
+                released.append(outbox_id)
+                continue
+            error = send.exception()
+            if error is None:
+                sent.append(outbox_id)
+            elif isinstance(error, outbound.UNREACHABLE):
+                # Retrying won't help until the user talks to the bot again
+                failed.append((outbox_id, f"{type(error).__name__}: {error}"))
+                blocked_ids.append(chat_id)
+            elif attempts >= OUTBOX_MAX_ATTEMPTS:
+                failed.append((outbox_id, f"{type(error).__name__}: {error}"))
+                logger.error(f"❌ Notification {outbox_id} to {chat_id} failed {attempts} times, giving up: {error}")
+            else:
+                delay = _retry_delay(attempts)
+                retries.append((outbox_id, delay, f"{type(error).__name__}: {error}"))
+                due = time.monotonic() + delay
+                if _next_retry is None or due < _next_retry:
+                    _next_retry = due
+
+        await run_write(record, sent, retries, failed, blocked_ids, released)
+        _stats['sent'] += len(sent)
+        _stats['retried'] += len(retries)
+        _stats['failed'] += len(failed)
+        if retries:
+            logger.warning(f"⚠️ {len(retries)} notifications failed, retrying with backoff")
+
+async def run_dispatcher(batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL):
+    """Send due outbox messages, up to `batch_size` at a time"""
+    global _next_retry
+    from async_db import run_write
+
+    last_purge = 0
+    while True:
+        _wakeup.clear()
+        batch = []
+        try:
+            batch = await run_write(claim, batch_size)
+            if batch:
+                started = time.perf_counter()
+                await _dispatch(batch)
+                _stats['last_batch'] = len(batch)
+                _stats['last_batch_ms'] = (time.perf_counter() - started) * 1000
+
+            if time.monotonic() - last_purge >= PURGE_INTERVAL:
+                last_purge = time.monotonic()
+                purged = await run_write(purge)
+                if purged:
+                    logger.info(f"🧹 Purged {purged} sent notifications from the outbox")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Outbox dispatch failed: {e}")
+
+        # A full batch means more may be due already
+        if len(batch) == batch_size:
+            continue
+
+        timeout = poll_interval
+        if _next_retry is not None:
+            timeout = min(timeout, max(_next_retry - time.monotonic(), 0))
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            _next_retry = None
+
+def get_metrics():
+    return dict(_stats)
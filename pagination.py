@@ -0,0 +1,80 @@
+# pagination.py - Keyset (cursor) pagination over (timestamp, id) ordered lists
+
+from collections import namedtuple
+from datetime import datetime, timezone
+from config import PAGE_SIZE
+
+# rows newest first; newer/older are cursors for the Prev/Next buttons, None at either end
+Page = namedtuple('Page', ['rows', 'newer', 'older'])
+
+NEWER = 'p'
+OLDER = 'n'
+
+def encode_cursor(timestamp, key):
+    """Compact cursor for a CURRENT_TIMESTAMP string and a row id"""
+    dt = datetime.strptime(timestamp[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return f"{int(dt.timestamp())}_{key}"
+
+def decode_cursor(cursor):
+    """(timestamp, key) from encode_cursor(); raises ValueError if malformed"""
+    epoch, key = cursor.split('_', 1)
+    timestamp = datetime.fromtimestamp(int(epoch), timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    return timestamp, key
+
+def parse_position(param):
+    """(direction, cursor) from the `{direction}_{cursor}` tail of a Prev/Next button; raises ValueError if malformed"""
+    direction, cursor = param.split('_', 1)
+    if direction not in (NEWER, OLDER):
+        raise ValueError(f"Unknown page direction '{direction}'")
+    return direction, cursor
+
+def fetch_page(cursor, select, order, key_index, where='', params=(), direction=None, after=None,
+               limit=PAGE_SIZE, key_type=str):
+    """Run `select` for one page, newest first, seeking past `after` in `direction`.
+
+    `order` is the (timestamp column, unique id column) pair the list is sorted
+    by and `key_index` the positions of those two columns in each row. Every
+    page is an index seek, so deep pages cost the same as the first one.
+    """
+    ts_column, id_column = order
+    conditions = [where] if where else []
+    args = list(params)
+
+    position = None
+    if after and direction in (NEWER, OLDER):
+        try:
+            timestamp, key = decode_cursor(after)
+            position = (timestamp, key_type(key))
+        except ValueError:
+            position = None
+
+    if position:
+        conditions.append(f"({ts_column}, {id_column}) {'>' if direction == NEWER else '<'} (?, ?)")
+        args.extend(position)
+
+    sort = 'ASC' if position and direction == NEWER else 'DESC'
+    sql = select
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += f' ORDER BY {ts_column} {sort}, {id_column} {sort} LIMIT ?'
+    args.append(limit + 1)
+
+    cursor.execute(sql, args)
+    rows = cursor.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    if position and not rows:
+        # Everything past the cursor is gone (processed or deleted) - start over
+        return fetch_page(cursor, select, order, key_index, where, params, limit=limit, key_type=key_type)
+
+    if position and direction == NEWER:
+        rows.reverse()
+        has_newer, has_older = more, True
+    else:
+        has_newer, has_older = position is not None, more
+
+    ts_index, id_index = key_index
+    newer = encode_cursor(rows[0][ts_index], rows[0][id_index]) if rows and has_newer else None
+    older = encode_cursor(rows[-1][ts_index], rows[-1][id_index]) if rows and has_older else None
+    return Page(rows, newer, older)
@@ -0,0 +1,105 @@
+# rollups.py - Daily pre-aggregated stats for transactions, withdrawals and rewards
+#
+# Usage:
+#   python rollups.py --backfill    # rebuild every rollup table from the raw rows
+
+import argparse
+import logging
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+# source table -> (rollup table, key columns, key expressions, amount column, id column)
+ROLLUPS = {
+    'transactions': ('daily_transaction_stats', 'day, gift_card_name, type, status',
+                     'date(created_at), gift_card_name, type, status', 'calculated_amount', 'tx_id'),
+    'withdrawals': ('daily_withdrawal_stats', 'day, method, status',
+                    'date(created_at), method, status', 'amount', 'wd_id'),
+    'rewards': ('daily_reward_stats', 'day, status',
+                'date(created_at), status', 'amount', 'id'),
+}
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_transaction_stats (
+            day TEXT,
+            gift_card_name TEXT,
+            type TEXT,
+            status TEXT,
+            count INTEGER DEFAULT 0,
+            amount REAL DEFAULT 0.0,
+            PRIMARY KEY (day, gift_card_name, type, status)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_withdrawal_stats (
+            day TEXT,
+            method TEXT,
+            status TEXT,
+            count INTEGER DEFAULT 0,
+            amount REAL DEFAULT 0.0,
+            PRIMARY KEY (day, method, status)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_reward_stats (
+            day TEXT,
+            status TEXT,
+            count INTEGER DEFAULT 0,
+            amount REAL DEFAULT 0.0,
+            PRIMARY KEY (day, status)
+        ) WITHOUT ROWID
+    ''')
+
+def _bump(cursor, source, row_id, sign):
+    """Add (sign=1) or remove (sign=-1) one source row's current state from its rollup bucket"""
+    table, columns, keys, amount, id_column = ROLLUPS[source]
+    cursor.execute(f'''
+        INSERT INTO {table} ({columns}, count, amount)
+        SELECT {keys}, ?, ? * COALESCE({amount}, 0) FROM {source} WHERE {id_column} = ?
+        ON CONFLICT ({columns}) DO UPDATE SET count = count + excluded.count, amount = amount + excluded.amount
+    ''', (sign, sign, row_id))
+
+# Call these on the writer's cursor, inside the same transaction as the row change:
+# once with sign=-1 before an update and with sign=1 after it (or after an insert)
+def record_transaction(cursor, tx_id, sign=1):
+    _bump(cursor, 'transactions', tx_id, sign)
+
+def record_withdrawal(cursor, wd_id, sign=1):
+    _bump(cursor, 'withdrawals', wd_id, sign)
+
+def record_reward(cursor, reward_id, sign=1):
+    _bump(cursor, 'rewards', reward_id, sign)
+
+def backfill(cursor):
+    """Rebuild every rollup table from the raw rows"""
+    for source, (table, columns, keys, amount, _) in ROLLUPS.items():
+        cursor.execute(f'DELETE FROM {table}')
+        group_by = ', '.join(str(i) for i in range(1, columns.count(',') + 2))
+        cursor.execute(f'''
+            INSERT INTO {table} ({columns}, count, amount)
+            SELECT {keys}, COUNT(*), COALESCE(SUM({amount}), 0) FROM {source}
+            GROUP BY {group_by}
+        ''')
+        logger.info(f"✅ Rebuilt {table}: {cursor.rowcount} rows")
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the daily rollup tables")
+    parser.add_argument('--backfill', action='store_true', help="Rebuild every rollup table from the raw rows")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if not args.backfill:
+        parser.print_help()
+        return
+
+    from database import init_db
+    init_db()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        backfill(cursor)
+
+if __name__ == '__main__':
+    main()
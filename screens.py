@@ -0,0 +1,141 @@
+# screens.py - Static keyboards and screen texts, built and serialized once at import
+#
+# Most screens look the same for every user: the main menu buttons, each page
+# of the card pickers, cancel/back/confirm rows, the rates and help pages.
+# Building InlineKeyboardMarkup objects and having aiogram serialize them again
+# on every update is wasted work, so they are built here once and kept as the
+# JSON string Telegram receives - aiogram passes a str reply_markup through
+# as-is. Strings are immutable, so a handler can't change a shared keyboard.
+# Per-user screens (dashboard, rates for a card, transaction pages) are still
+# built per update.
+
+from types import MappingProxyType
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.utils.payload import prepare_arg
+from config import GIFT_CARDS, CARDS_PER_PAGE
+from utils import create_back_button, create_cancel_button, create_confirmation_keyboard, paginate_cards
+
+CARD_PAGE_COUNT = (len(GIFT_CARDS) + CARDS_PER_PAGE - 1) // CARDS_PER_PAGE
+
+def freeze(keyboard):
+    """The keyboard as the JSON string aiogram would send for it"""
+    return prepare_arg(keyboard)
+
+def _main_menu():
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        InlineKeyboardButton("🛒 Sell Gift Card", callback_data="sell_start"),
+        InlineKeyboardButton("💳 Buy Gift Card", callback_data="buy_start")
+    )
+    keyboard.add(
+        InlineKeyboardButton("📈 View Rates", callback_data="rates"),
+        InlineKeyboardButton("📜 My Transactions", callback_data="transactions")
+    )
+    keyboard.add(
+        InlineKeyboardButton("💰 Balance & Withdraw", callback_data="balance_withdraw"),
+        InlineKeyboardButton("👥 Refer & Earn $5", callback_data="refer_earn")
+    )
+    keyboard.add(
+        InlineKeyboardButton("🆘 Help & Support", callback_data="help")
+    )
+    return keyboard
+
+def _trade_done():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("🏠 Back to Menu", callback_data="main_menu"))
+    keyboard.add(InlineKeyboardButton("📜 View Transactions", callback_data="transactions"))
+    return keyboard
+
+def _help():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("💬 Contact Support", url="https://t.me/SupportHandle"))
+    keyboard.add(InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu"))
+    return keyboard
+
+# Keyboards
+MAIN_MENU = freeze(_main_menu())
+BACK = freeze(create_back_button())
+CANCEL = freeze(create_cancel_button())
+CANCEL_WITH_BACK = freeze(create_cancel_button(with_back=True))
+CONFIRM_SELL = freeze(create_confirmation_keyboard("confirm_sell"))
+CONFIRM_BUY = freeze(create_confirmation_keyboard("confirm_buy"))
+CONFIRM_WITHDRAWAL = freeze(create_confirmation_keyboard("confirm_wd"))
+TRADE_DONE = freeze(_trade_done())  # after a sell or buy is submitted
+HELP_KEYBOARD = freeze(_help())
+
+# (callback_prefix, page) -> card picker page, for every page of both pickers
+CARD_PAGES = MappingProxyType({
+    (prefix, page): freeze(paginate_cards(page=page, callback_prefix=prefix))
+    for prefix in ('sell', 'buy') for page in range(CARD_PAGE_COUNT)
+})
+
+def card_page(prefix, page):
+    """A card picker page; out of range pages (old buttons after GIFT_CARDS shrank) get the nearest one"""
+    return CARD_PAGES[prefix, min(max(page, 0), CARD_PAGE_COUNT - 1)]
+
+# Texts
+SELL_PICKER_TEXT = """
+🛒 Sell Your Gift Card
+
+Step 1/4: Select Gift Card
+
+Choose the gift card you want to sell from the list below.
+
+💡 All cards are US-based
+"""
+
+BUY_PICKER_TEXT = """
+💳 Buy Gift Card
+
+Step 1/4: Select Gift Card
+
+Choose the gift card you want to buy from the list below.
+
+💡 All cards are US-based and delivered instantly!
+"""
+
+RATES_TEXT = """
+📈 Current Rates
+
+Our rates vary by gift card and market conditions.
+
+Sell Rates: 5% - 25% discount
+Buy Rates: 10% - 30% premium
+
+💡 Tip: Rates are calculated dynamically when you select a card.
+
+Popular cards usually have better rates!
+"""
+
+HELP_TEXT = """
+🆘 Help & Support
+
+How to Sell:
+1. Click "🛒 Sell Gift Card"
+2. Select your gift card
+3. Enter the amount
+4. Upload photo or code
+5. Wait for verification
+
+How to Buy:
+1. Click "💳 Buy Gift Card"
+2. Select gift card
+3. Enter amount
+4. Pay with crypto
+5. Receive your code
+
+Withdrawals:
+- Minimum: $30 (Crypto) or $100 (Bank)
+- Crypto: No fees
+- Bank: 7% fee
+
+Referrals:
+- Earn $5 per referral
+- Your friend earns $5 too
+- Unlimited earnings!
+
+Need Help?
+Contact support: @SupportHandle
+
+Available 24/7 🕐
+"""
@@ -0,0 +1,92 @@
+# trending.py - Sliding-window leaderboard of completed sales per gift card
+
+import logging
+import threading
+import time
+import cache_sync
+from collections import Counter
+from datetime import datetime, timezone
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Sales count towards trending for 7 days, tracked in hourly buckets
+WINDOW_HOURS = 7 * 24
+
+_lock = threading.Lock()
+_buckets = {}        # epoch hour -> Counter(card name -> sales)
+_totals = Counter()  # card name -> sales across all live buckets
+_loaded = False
+
+def _current_hour():
+    return int(time.time() // 3600)
+
+def _hour_of(created_at):
+    """Epoch hour of a CURRENT_TIMESTAMP string (UTC)"""
+    dt = datetime.strptime(created_at[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() // 3600)
+
+def _expire(now_hour):
+    """Drop buckets that slid out of the window (caller holds the lock)"""
+    cutoff = now_hour - WINDOW_HOURS
+    for hour in [h for h in _buckets if h <= cutoff]:
+        _totals.subtract(_buckets.pop(hour))
+    # Counter.subtract keeps zero/negative entries around
+    for card in [c for c, n in _totals.items() if n <= 0]:
+        del _totals[card]
+
+def rebuild():
+    """Load the last 7 days of completed sales from the database"""
+    global _buckets, _totals, _loaded
+    since_hour = _current_hour() - WINDOW_HOURS + 1
+    since = datetime.fromtimestamp(since_hour * 3600, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT gift_card_name, CAST(strftime('%s', created_at) AS INTEGER) / 3600 AS hour, COUNT(*)
+            FROM transactions
+            WHERE status = 'completed' AND created_at >= ?
+            GROUP BY gift_card_name, hour
+        ''', (since,))
+        rows = cursor.fetchall()
+
+    buckets = {}
+    totals = Counter()
+    for card, hour, count in rows:
+        buckets.setdefault(hour, Counter())[card] += count
+        totals[card] += count
+
+    with _lock:
+        _buckets, _totals, _loaded = buckets, totals, True
+    logger.info(f"✅ Trending leaderboard loaded: {sum(totals.values())} sales across {len(buckets)} hours")
+
+def record_sale(card_name, created_at, delta=1):
+    """Count (or with delta=-1, uncount) a sale created at `created_at`"""
+    _record(card_name, created_at, delta)
+    cache_sync.publish('sale', card_name, created_at, delta)
+
+def _record(card_name, created_at, delta):
+    hour = _hour_of(created_at)
+    with _lock:
+        if not _loaded:
+            return  # rebuild() will pick it up from the database
+        now_hour = _current_hour()
+        if hour <= now_hour - WINDOW_HOURS:
+            return
+        _buckets.setdefault(hour, Counter())[card_name] += delta
+        _totals[card_name] += delta
+        _expire(now_hour)
+
+cache_sync.subscribe('sale', _record)
+
+def is_loaded():
+    return _loaded
+
+def get_trending_cards(limit=5):
+    """Top cards by completed sales in the window, as (name, count) tuples"""
+    if not _loaded:
+        rebuild()
+    with _lock:
+        _expire(_current_hour())
+        return _totals.most_common(limit)
@@ -0,0 +1,108 @@
+# update_scheduler.py - Updates sharded by user onto worker queues: each user in order, different users in parallel
+#
+# The middleware takes every incoming update off the polling/webhook path and
+# puts it on queue user_id % UPDATE_SHARDS. Each queue has one worker that runs
+# its updates through the dispatcher one at a time, so a user's second tap on
+# "✅ Confirm" only runs after the first one has finished (and moved the FSM
+# state on), while users on other shards are handled concurrently. A full
+# queue makes the middleware wait, which slows polling down instead of
+# buffering without limit.
+
+import asyncio
+import contextvars
+import logging
+import time
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from config import UPDATE_SHARDS, UPDATE_QUEUE_SIZE, BOT_WORKERS, WORKER_INDEX
+
+logger = logging.getLogger(__name__)
+
+_queues = []
+_busy = []  # per shard: is its worker handling an update right now
+_stats = {'processed': 0, 'failed': 0, 'max_wait_ms': 0.0}
+
+# Set in worker tasks, so the middleware lets the updates they replay through
+_in_worker = contextvars.ContextVar('update_scheduler_in_worker', default=False)
+
+def shard_key(update):
+    """The user an update belongs to (its update_id if there's no user)"""
+    event = update.message or update.edited_message or update.callback_query
+    if event is not None and event.from_user is not None:
+        return event.from_user.id
+    return update.update_id
+
+# Spacing of the keys this process gets: all of them, or in worker i of K those with key % K == i
+KEY_STRIDE = BOT_WORKERS if WORKER_INDEX is not None else 1
+
+def shard_index(key, shards, stride=KEY_STRIDE):
+    """The shard queue a key goes to"""
+    # Dividing by the stride first spreads a worker's keys over all its shards;
+    # key % shards alone would leave all but ~shards/K of them idle
+    return key // stride % shards
+
+class UpdateScheduler(BaseMiddleware):
+    """Queues updates on their user's shard instead of handling them where they arrived"""
+
+    async def on_pre_process_update(self, update, data):
+        # Workers not running (yet, or any more): handle it inline as before
+        if _in_worker.get() or not _queues:
+            return
+        await _queues[shard_index(shard_key(update), len(_queues))].put((update, time.monotonic()))
+        raise CancelHandler()
+
+def install(dp):
+    """Put the scheduler in front of the dispatcher; updates are queued once run_workers() is running"""
+    dp.middleware.setup(UpdateScheduler())
+
+async def _work(dp, shard, queue):
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    _in_worker.set(True)
+
+    while True:
+        update, queued_at = await queue.get()
+        _busy[shard] = True
+        _stats['max_wait_ms'] = max(_stats['max_wait_ms'], (time.monotonic() - queued_at) * 1000)
+        try:
+            # Own task, so own context: aiogram's StateFilter caches the FSM state in a
+            # context variable, and the next update must not see this one's
+            await asyncio.create_task(dp.updates_handler.notify(update))
+            _stats['processed'] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _stats['failed'] += 1
+            logger.error(f"❌ Update {update.update_id} failed on shard {shard}: {type(e).__name__}: {e}")
+        finally:
+            _busy[shard] = False
+            queue.task_done()
+
+async def run_workers(dp, shards=UPDATE_SHARDS, queue_size=UPDATE_QUEUE_SIZE):
+    """Create the shard queues and work them until cancelled"""
+    queues = [asyncio.Queue(queue_size) for _ in range(shards)]
+    _busy[:] = [False] * shards
+    workers = [asyncio.create_task(_work(dp, shard, queue)) for shard, queue in enumerate(queues)]
+    _queues[:] = queues
+    logger.info(f"✅ Update scheduler running with {shards} shards")
+    try:
+        # wait() rather than gather(): being cancelled mustn't cancel the workers before they drain
+        await asyncio.wait(workers)
+    finally:
+        # Shutting down: new updates go inline again, queued ones get a moment to finish
+        _queues.clear()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in queues)), 5)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            left = sum(queue.qsize() for queue in queues)
+            if left:
+                logger.warning(f"⚠️ {left} queued updates dropped at shutdown")
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+def get_metrics():
+    """Per-shard depth (queued plus the one being handled), totals and the longest queue wait seen"""
+    depths = [queue.qsize() + busy for queue, busy in zip(_queues, _busy)]
+    return {'shards': len(depths), 'depths': depths, 'queued': sum(depths), 'deepest': max(depths, default=0), **_stats}
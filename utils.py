@@ -1,7 +1,16 @@
 # utils.py - Helper functions for navigation and UI
 
+import callback_codec
+import outbound
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import GIFT_CARDS, CARDS_PER_PAGE
+from pagination import NEWER, OLDER
+
+# paginate_cards() callback_prefix -> (card button, page button) actions
+CARD_PICKER_ACTIONS = {
+    'sell': (callback_codec.SELL_CARD, callback_codec.SELL_PAGE),
+    'buy': (callback_codec.BUY_CARD, callback_codec.BUY_PAGE),
+}
 
 def create_back_button(callback_data="main_menu"):
     """Create a standard back button"""
@@ -19,9 +28,10 @@ def create_cancel_button(with_back=False):
         keyboard.add(InlineKeyboardButton("❌ Cancel", callback_data="cancel_action"))
     return keyboard
 
-def paginate_cards(page=0, callback_prefix="card"):
+def paginate_cards(page=0, callback_prefix="sell"):
     """Create paginated gift card buttons"""
     keyboard = InlineKeyboardMarkup(row_width=2)
+    card_action, page_action = CARD_PICKER_ACTIONS[callback_prefix]
     
     start = page * CARDS_PER_PAGE
     end = start + CARDS_PER_PAGE
@@ -32,26 +42,35 @@ def paginate_cards(page=0, callback_prefix="card"):
     for card in current_cards:
         keyboard.insert(InlineKeyboardButton(
             card['name'], 
-            callback_data=f"{callback_prefix}_{card['name']}"
+            callback_data=card_action.encode(card['name'])
         ))
     
     # Navigation buttons
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=f"{callback_prefix}_page_{page-1}"))
+        nav_buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=page_action.encode(page - 1)))
     
     # Page indicator
     total_pages = (len(GIFT_CARDS) + CARDS_PER_PAGE - 1) // CARDS_PER_PAGE
     nav_buttons.append(InlineKeyboardButton(f"📄 {page+1}/{total_pages}", callback_data="page_info"))
     
     if end < len(GIFT_CARDS):
-        nav_buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"{callback_prefix}_page_{page+1}"))
+        nav_buttons.append(InlineKeyboardButton("Next ▶️", callback_data=page_action.encode(page + 1)))
     
     keyboard.row(*nav_buttons)
     keyboard.add(InlineKeyboardButton("⬅️ Back to Menu", callback_data="main_menu"))
     
     return keyboard
 
+def create_page_buttons(callback_prefix, page):
+    """Prev/Next buttons carrying the cursors of a pagination.Page"""
+    nav_buttons = []
+    if page.newer:
+        nav_buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=f"{callback_prefix}_{NEWER}_{page.newer}"))
+    if page.older:
+        nav_buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"{callback_prefix}_{OLDER}_{page.older}"))
+    return nav_buttons
+
 def format_currency(amount):
     """Format currency consistently"""
     return f"${amount:.2f}"
@@ -101,12 +120,12 @@ def truncate_text(text, max_length=30):
 async def safe_edit_message(message, text, reply_markup=None, parse_mode="Markdown"):
     """Safely edit message, handling errors"""
     try:
-        await message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        await outbound.edit_text(message, text, reply_markup=reply_markup, parse_mode=parse_mode)
         return True
     except Exception as e:
         # If edit fails, send new message
         try:
-            await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
+            await outbound.answer(message, text, reply_markup=reply_markup, parse_mode=parse_mode)
         except:
             pass
         return False
@@ -0,0 +1,159 @@
+# workers.py - Multi-process mode: a front process takes updates and shards them by user over pipes to workers
+#
+# With BOT_WORKERS = K > 1, `python main.py` becomes the front: it polls (or
+# serves the webhook and health routes), applies migrations and starts K copies
+# of itself with WORKER_INDEX set. Each update is written as one JSON line to
+# the stdin of worker user_id % K, so a user's updates arrive at the same worker
+# in order and their FSM state stays in that worker's cache. Workers run the
+# handlers and background services, each with its own connection pool on the
+# shared database: SQLite serializes their writes, leases keep a job or outbox
+# message from being taken twice, and cache_sync carries cache changes between
+# them. Worker 0 also runs the one-per-bot tasks (broadcast resume, counter
+# reconciliation).
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from update_scheduler import shard_key
+
+logger = logging.getLogger(__name__)
+
+# Longest update line a worker accepts (bytes)
+MAX_LINE = 1 << 20
+
+# Front process: seconds a worker gets to finish its updates after stdin closes
+STOP_TIMEOUT = 15
+
+class _Worker:
+    """One worker process and the pipe to its stdin"""
+
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+        self.process = None
+        self.forwarded = 0
+        self.restarts = 0
+        self._lock = asyncio.Lock()  # one writer at a time keeps a user's updates in order
+
+    async def start(self):
+        env = dict(os.environ, BOT_WORKERS=str(self.count), WORKER_INDEX=str(self.index))
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(sys.modules['__main__'].__file__),
+            stdin=asyncio.subprocess.PIPE, env=env
+        )
+        logger.info(f"✅ Worker {self.index} started (pid {self.process.pid})")
+
+    async def _restart(self):
+        await self.process.wait()
+        logger.error(f"❌ Worker {self.index} exited with {self.process.returncode}, restarting")
+        self.restarts += 1
+        await self.start()
+
+    async def send(self, line):
+        async with self._lock:
+            if self.process.returncode is not None:
+                await self._restart()
+            try:
+                self.process.stdin.write(line)
+                await self.process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # Died since the check - its FSM state is in the database, so a new one can take over
+                await self._restart()
+                self.process.stdin.write(line)
+                await self.process.stdin.drain()
+            self.forwarded += 1
+
+    async def stop(self, timeout):
+        if self.process is None or self.process.returncode is not None:
+            return
+        # EOF tells the worker to finish what it has and shut down
+        self.process.stdin.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Worker {self.index} didn't stop in {timeout}s, killing it")
+            self.process.kill()
+            await self.process.wait()
+
+_workers = []
+
+class UpdateForwarder(BaseMiddleware):
+    """Front process: sends each update to its user's worker instead of handling it"""
+
+    async def on_pre_process_update(self, update, data):
+        if not _workers:
+            return
+        line = json.dumps(update.to_python(), separators=(',', ':')).encode() + b'\n'
+        await _workers[shard_key(update) % len(_workers)].send(line)
+        raise CancelHandler()
+
+def install(dp):
+    dp.middleware.setup(UpdateForwarder())
+
+async def start(count):
+    """Front process: start `count` workers"""
+    workers = [_Worker(index, count) for index in range(count)]
+    for worker in workers:
+        await worker.start()
+    _workers[:] = workers
+
+async def stop(timeout=STOP_TIMEOUT):
+    """Front process: close every worker's pipe and wait for them to exit"""
+    workers = _workers[:]
+    _workers.clear()
+    await asyncio.gather(*(worker.stop(timeout) for worker in workers))
+    logger.info(f"✅ {len(workers)} workers stopped")
+
+async def serve(dp):
+    """Worker process: feed update lines from stdin to the dispatcher until EOF or SIGTERM"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_LINE)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    reading = asyncio.current_task()
+    loop.add_signal_handler(signal.SIGTERM, reading.cancel)
+
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+                if not line:
+                    break
+                update = types.Update(**json.loads(line))
+            except ValueError as e:
+                logger.error(f"❌ Bad update line from the front process: {e}")
+                continue
+            # The update scheduler queues it on the user's shard and returns
+            await dp.updates_handler.notify(update)
+    except asyncio.CancelledError:
+        # SIGTERM: stop reading, but let the shutdown that follows run
+        reading.uncancel()
+    finally:
+        loop.remove_signal_handler(signal.SIGTERM)
+
+def run_worker(dp, on_startup, on_shutdown):
+    """Worker process entry point"""
+    # Ctrl+C reaches the whole process group; workers stop when the front closes their pipe
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    async def main():
+        await on_startup(dp)
+        try:
+            await serve(dp)
+        finally:
+            await on_shutdown(dp)
+
+    asyncio.run(main())
+
+def get_metrics():
+    """Front process: updates forwarded to and restarts of each worker"""
+    return [{'index': worker.index, 'pid': worker.process.pid, 'forwarded': worker.forwarded,
+             'restarts': worker.restarts} for worker in _workers]